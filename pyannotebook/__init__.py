@@ -20,17 +20,37 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import ipywidgets
-
-from .wavesurfer import WavesurferWidget
-from .annotation import AnnotationWidget
-from .labels import LabelsWidget
-from .rttm import load_rttm
-from .pyannotebook import Pyannotebook
+from .rttm import IndexedRTTM, iter_rttm, load_rttm
 
 from ._version import __version__, version_info
 
 
+# widgets are imported lazily (on first access) so that `import pyannotebook`
+# does not pay for ipywidgets, scipy, soundfile or pyannote.audio (torch)
+_LAZY_ATTRIBUTES = {
+    "WavesurferWidget": ".wavesurfer",
+    "AnnotationWidget": ".annotation",
+    "LabelsWidget": ".labels",
+    "Pyannotebook": ".pyannotebook",
+    "AnnotationQueue": ".session",
+}
+
+# so that `from pyannotebook import *` also exports lazily imported widgets
+__all__ = sorted(["IndexedRTTM", "iter_rttm", "load_rttm", *_LAZY_ATTRIBUTES])
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
+
+
 def _jupyter_labextension_paths():
     """Called by Jupyter Lab Server to detect if it is a valid labextension and
     to install the widget
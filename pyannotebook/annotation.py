@@ -23,12 +23,15 @@
 
 import ipywidgets
 import traitlets
-from typing import Dict, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Text
 from pyannote.core import Annotation, Segment
 from pyannote.core.utils.generators import string_generator
 from itertools import filterfalse, count
-import random
-import string
+
+from .intervals import PRECISION
+from .profiling import Profiled, profiled
+from .regions import RegionStore
 
 def get_annotation(regions, labels):
     annotation = Annotation()
@@ -37,7 +40,7 @@ def get_annotation(regions, labels):
     return annotation
 
 
-class AnnotationWidget(ipywidgets.Widget):
+class AnnotationWidget(Profiled, ipywidgets.Widget):
     """Annotation widget
     
     
@@ -54,27 +57,78 @@ class AnnotationWidget(ipywidgets.Widget):
     ---------
     labels : str -> human-readable
     regions : list of {"start": float, "end": float, "id": str, "label": str}
+
+    Note
+    ----
+    `annotation` is cached (and patched as regions are edited) and returned
+    as is: treat it as read-only and `copy()` it before modifying it.
+    Returned annotations are never modified behind the caller's back: the
+    cache is copied before being patched (copy-on-write).
     """
 
     labels = traitlets.Dict().tag(sync=True)
-    regions = traitlets.List().tag(sync=True)
+    # not synced: this widget has no view, and WavesurferWidget
+    # already sends regions (changes) to the browser
+    regions = traitlets.List()
 
     def __init__(self, annotation: Optional[Annotation] = None):
         super().__init__()
+        # id-indexed regions, kept in sync with `regions`
+        self._store = RegionStore()
+        # cached annotation, valid as long as its version matches the store's
+        self._annotation: Optional[Annotation] = None
+        self._annotation_version = -1
+        # whether cached annotation was returned, and must be copied before patching
+        self._annotation_shared = False
+        self.slebal = dict()
+        # `regions` changes are only applied once the outermost `batch` exits
+        self._batch_depth = 0
+        self._regions_dirty = False
         if annotation:
             self.annotation = annotation
-    
+
+    def _build_annotation(self) -> Annotation:
+        labels = [self.labels.get(label, label) for label in self._store.labels]
+        starts, ends = self._store.starts.tolist(), self._store.ends.tolist()
+        codes = self._store.codes.tolist()
+        return Annotation.from_records(
+            (Segment(start, end), region_id, labels[code])
+            for start, end, region_id, code in zip(starts, ends, self._store.ids, codes)
+            # like Annotation.__setitem__, skip empty segments
+            if end - start > PRECISION
+        )
+
+    @profiled
     def _get_annotation(self):
-        return get_annotation(self.regions, self.labels)
+        if self._regions_dirty:
+            self._sync_regions(self.regions)
+        if self._annotation is None or self._annotation_version != self._store.version:
+            self._annotation = self._build_annotation()
+            self._annotation_version = self._store.version
+        self._annotation_shared = True
+        return self._annotation
 
+    @profiled
     def _set_annotation(self, annotation: Annotation):
 
-        # rename tracks if they are not unique
-        tracks = [track for _, track in annotation.itertracks()]
-        if len(tracks) > len(set(tracks)):
-            annotation = annotation.relabel_tracks()
+        starts, ends, labels, region_ids = list(), list(), list(), list()
+        seen = set()
+        for segment, track, label in annotation.itertracks(yield_label=True):
+            starts.append(segment.start)
+            ends.append(segment.end)
+            labels.append(label)
+            # keep (unique) ids of regions created in the browser
+            if isinstance(track, str) and track.startswith("wavesurfer_") and track not in seen:
+                seen.add(track)
+                region_ids.append(track)
+            else:
+                region_ids.append(None)
 
-        added_labels = set(annotation.labels()) - set(self.labels.values())
+        self.set_regions_from_arrays(starts, ends, labels, ids=region_ids)
+
+    def _add_labels(self, labels: Iterable):
+        """Allocate keys for human-readable labels that do not have one yet"""
+        added_labels = [label for label in labels if label not in self.slebal]
         if added_labels:
             new_labels = dict(self.labels)
             # index_pool = filterfalse(lambda i: i in self.labels, count(start=0))
@@ -83,14 +137,33 @@ class AnnotationWidget(ipywidgets.Widget):
                 index = next(index_pool).lower()
                 new_labels[index] = label
             self.labels = new_labels
-        
-        self.regions = [
-            {
-                "start": segment.start, 
-                "end": segment.end, 
-                "label": self.slebal[label],
-                "id": track if track.startswith("wavesurfer_") else "frompython_" + "".join(random.choices(string.ascii_lowercase, k=11))
-            } for segment, track, label in annotation.itertracks(yield_label=True)]
+
+    def set_regions_from_arrays(
+        self,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        labels: Sequence,
+        ids: Optional[Sequence[Optional[Text]]] = None,
+    ):
+        """Replace all regions at once
+
+        This is much faster than assigning a list of regions, as regions are
+        created in bulk and `regions` is only assigned (and synced) once.
+
+        Parameters
+        ----------
+        starts, ends : (num_regions, ) array-like
+            Regions start and end times, in seconds.
+        labels : (num_regions, ) sequence
+            Regions human-readable labels (e.g. speaker names).
+            Those missing from `labels` are added.
+        ids : (num_regions, ) sequence of str or None, optional
+            Regions ids. Missing (None) ids are allocated automatically.
+        """
+        self._add_labels(dict.fromkeys(labels))
+        slebal = self.slebal
+        self._store.replace(starts, ends, [slebal[label] for label in labels], region_ids=ids)
+        self.regions = self._store.to_list()
 
     def _del_annotation(self):
         self.regions = list()
@@ -99,12 +172,86 @@ class AnnotationWidget(ipywidgets.Widget):
     annotation = property(_get_annotation, _set_annotation, _del_annotation)
 
     @traitlets.observe("labels")
+    @profiled
     def labels_has_changed(self, change: Dict):
         self.slebal = {label: idx for idx, label in change["new"].items()}
+        # cached annotation uses human-readable labels
+        self._annotation = None
+
+    def _patch_annotation(self, add, update, remove):
+        """Apply regions changes to store and (if up to date) cached annotation"""
+
+        annotation = self._annotation
+        if annotation is not None and self._annotation_version != self._store.version:
+            annotation = self._annotation = None
+        if annotation is not None and self._annotation_shared:
+            annotation = self._annotation = annotation.copy()
+            self._annotation_shared = False
+
+        # remove previous version of updated and removed regions...
+        removed = set(remove)
+        for region_id in remove + [region["id"] for region in update]:
+            if annotation is not None:
+                region = self._store[region_id]
+                try:
+                    del annotation[Segment(region["start"], region["end"]), region_id]
+                except KeyError:
+                    # empty segments are not in the annotation
+                    pass
+            if region_id in removed:
+                self._store.remove(region_id)
+
+        # ... and add their new version
+        self._store.upsert(add + update)
+        if annotation is not None:
+            for region in add + update:
+                segment = Segment(region["start"], region["end"])
+                annotation[segment, region["id"]] = self.labels.get(region["label"], region["label"])
+            self._annotation_version = self._store.version
+
+    @contextmanager
+    def batch(self):
+        """Coalesce `regions` changes until the block exits
+
+        Successive assignments to `regions` are only applied (diffed against
+        the previous ones) once, when the outermost block exits, or when
+        `annotation` is read in the meantime.
+
+        Usage
+        -----
+        with widget.batch():
+            for regions in edits:
+                widget.regions = regions
+        """
+        self._batch_depth += 1
+        with self.hold_sync():
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._regions_dirty:
+                    self._sync_regions(self.regions)
 
     @traitlets.observe("regions")
+    @profiled
     def regions_has_changed(self, change: Dict):
-        added_labels = set(region["label"] for region in change["new"]) - set(self.labels)
+        if self._batch_depth:
+            self._regions_dirty = True
+            return
+        self._sync_regions(change["new"])
+
+    def _sync_regions(self, regions: List[Dict]):
+        """Apply `regions` changes to store and cached annotation"""
+
+        self._regions_dirty = False
+        if regions is not self._store.to_list():
+            add, update, remove = self._store.diff(regions)
+            if len(add) + len(update) + len(remove) < len(self._store) // 2:
+                self._patch_annotation(add, update, remove)
+            else:
+                self._store.assign(regions)
+
+        added_labels = set(region["label"] for region in regions) - set(self.labels)
         if added_labels:
             new_labels = dict(self.labels)
             for label in added_labels:
@@ -0,0 +1,193 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Run pipelines in a worker thread, so that the kernel (and widgets) stay responsive.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Optional, Text, Tuple
+
+import ipywidgets
+
+
+class Cancelled(Exception):
+    """Raised in the worker thread (by the progress hook) when its job is cancelled"""
+
+
+class PipelineRunner:
+    """Run pipeline in a worker thread and report its progress in a widget
+
+    Parameters
+    ----------
+    on_done : callable
+        Called with pipeline output. When started from a running event loop
+        (e.g. the one of the Jupyter kernel), it is called on that loop.
+        Otherwise, it is called by `join`. Progress bar is updated the same
+        way, so that widgets are never touched from the worker thread.
+
+    Attributes
+    ----------
+    progress : ipywidgets.FloatProgress
+        Progress bar, only visible while a job is running.
+    error : Exception
+        Exception raised by last job, if any.
+
+    Usage
+    -----
+    runner = PipelineRunner(on_done=print)
+    display(runner.progress)
+    runner.run(pipeline, file)
+    runner.cancel()
+    """
+
+    def __init__(self, on_done: Callable[[Any], None]):
+        self.on_done = on_done
+        self.progress = ipywidgets.FloatProgress(
+            value=0.0, min=0.0, max=1.0, layout=ipywidgets.Layout(visibility="hidden")
+        )
+        self.error: Optional[Exception] = None
+        # set when current job is cancelled (None when idle)
+        self._cancelled: Optional[threading.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        # callbacks of worker thread waiting for `join` (when there is no loop)
+        self._pending: Deque[Callable[[], None]] = deque()
+        # latest (description, value) reported by progress hook, and whether
+        # an update of the progress bar is already scheduled
+        self._progress_state: Tuple[Text, Optional[float]] = ("", None)
+        self._progress_scheduled = False
+
+    @property
+    def running(self) -> bool:
+        return self._cancelled is not None
+
+    def join(self, timeout: Optional[float] = None):
+        """Wait for worker thread to finish
+
+        Do not call this from the kernel event loop while a job is running:
+        its output is delivered on that very loop.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._run_pending()
+
+    def _run_pending(self):
+        while self._pending:
+            self._pending.popleft()()
+
+    def cancel(self):
+        """Cancel current job (its output, if any, is discarded)"""
+        if self._cancelled is not None:
+            self._cancelled.set()
+            self._cancelled = None
+        self.progress.layout.visibility = "hidden"
+
+    def run(self, pipeline: Callable, file: Any):
+        """Cancel current job (if any) and run `pipeline(file, hook=...)` in a worker thread"""
+
+        self.cancel()
+        # updates of cancelled jobs are no-ops
+        self._run_pending()
+        self._progress_scheduled = False
+        cancelled = self._cancelled = threading.Event()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        self.error = None
+        self.progress.value = 0.0
+        self.progress.description = ""
+        self.progress.bar_style = ""
+        self.progress.layout.visibility = "visible"
+
+        self._thread = threading.Thread(
+            target=self._work, args=(pipeline, file, cancelled, loop), daemon=True
+        )
+        self._thread.start()
+
+    def _call_soon(self, callback: Callable[[], None], loop: Optional[asyncio.AbstractEventLoop]):
+        """Call `callback` from the thread that started the job"""
+        if loop is None:
+            self._pending.append(callback)
+        else:
+            loop.call_soon_threadsafe(callback)
+
+    def _hook(self, cancelled: threading.Event, loop: Optional[asyncio.AbstractEventLoop]) -> Callable:
+        """pyannote.audio-compatible progress hook"""
+
+        def update_progress():
+            self._progress_scheduled = False
+            description, value = self._progress_state
+            if cancelled.is_set():
+                return
+            self.progress.description = description
+            if value is not None:
+                self.progress.value = value
+
+        def hook(step_name, step_artifact, file=None, total=None, completed=None, **kwargs):
+            if cancelled.is_set():
+                raise Cancelled()
+            value = completed / total if total and completed is not None else None
+            self._progress_state = (step_name, value)
+            # only the latest progress is shown, however often hook is called
+            if not self._progress_scheduled:
+                self._progress_scheduled = True
+                self._call_soon(update_progress, loop)
+
+        return hook
+
+    def _work(
+        self,
+        pipeline: Callable,
+        file: Any,
+        cancelled: threading.Event,
+        loop: Optional[asyncio.AbstractEventLoop],
+    ):
+        try:
+            output = pipeline(file, hook=self._hook(cancelled, loop))
+        except Cancelled:
+            return
+        except Exception as error:
+
+            def fail(error: Exception = error):
+                if self._cancelled is cancelled:
+                    self._cancelled = None
+                    self.error = error
+                    self.progress.description = "failed"
+                    self.progress.bar_style = "danger"
+
+            self._call_soon(fail, loop)
+            raise
+
+        def deliver():
+            # job might have been cancelled in the meantime
+            if cancelled.is_set():
+                return
+            self._cancelled = None
+            self.progress.layout.visibility = "hidden"
+            self.on_done(output)
+
+        self._call_soon(deliver, loop)
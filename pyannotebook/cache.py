@@ -0,0 +1,491 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Caches of pipeline outputs and of encoded audio.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, Iterator, NamedTuple, Optional, Text, Union, TYPE_CHECKING
+
+import numpy as np
+
+from .peaks import PeakPyramid
+
+if TYPE_CHECKING:
+    from pyannote.core import Annotation
+    from .io import AudioSource
+
+MODES = ("use", "refresh", "bypass")
+
+
+def evict_lru(directory: Path, pattern: Text, max_size: int):
+    """Remove least recently used (i.e. oldest mtime) files until `directory` fits in `max_size` bytes"""
+    entries = []
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total_size <= max_size:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total_size -= size
+
+
+def _atomic_savez(path: Path, savez: Callable = np.savez, **arrays):
+    """Write arrays to `path` through a temporary file, so that readers never see partial files"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+# attributes where pyannote.audio pipelines keep their pretrained models
+# (checkpoint names or paths, or already loaded models)
+MODEL_ATTRIBUTES = ("segmentation", "segmentation_model", "embedding", "checkpoint", "model")
+
+
+def _model_bytes(model) -> Iterator[bytes]:
+    """Bytes identifying a model (checkpoint name or path, or weights)"""
+    if isinstance(model, (str, Path, dict)):
+        yield json.dumps(model, sort_keys=True, default=str).encode()
+    elif hasattr(model, "state_dict"):
+        # torch.nn.Module
+        for name, tensor in model.state_dict().items():
+            yield name.encode()
+            yield memoryview(np.ascontiguousarray(tensor.detach().cpu().numpy())).cast("B")
+    else:
+        yield repr(model).encode()
+
+
+# pipeline -> (ids of its pretrained models, digest of pretrained models)
+_MODELS_DIGESTS = weakref.WeakKeyDictionary()
+
+
+def _models_digest(pipeline: Callable) -> bytes:
+    """Digest of pipeline pretrained models, computed once per pipeline
+
+    Hashing weights is expensive: digests are memoized for as long as the
+    pipeline is alive, and only computed again when models are replaced
+    (weights updated in place are not detected).
+    """
+    models = [(name, getattr(pipeline, name, None)) for name in MODEL_ATTRIBUTES]
+    models = [(name, model) for name, model in models if model is not None]
+    model_ids = tuple((name, id(model)) for name, model in models)
+
+    try:
+        memoized_ids, digest = _MODELS_DIGESTS[pipeline]
+    except (KeyError, TypeError):
+        pass
+    else:
+        if memoized_ids == model_ids:
+            return digest
+
+    sha256 = hashlib.sha256()
+    for name, model in models:
+        sha256.update(f"{name}:".encode())
+        for chunk in _model_bytes(model):
+            sha256.update(chunk)
+    digest = sha256.digest()
+
+    try:
+        _MODELS_DIGESTS[pipeline] = (model_ids, digest)
+    except TypeError:
+        # pipeline cannot be weakly referenced
+        pass
+    return digest
+
+
+class PipelineCache:
+    """On-disk cache of pipeline outputs
+
+    Outputs are keyed by a hash of the audio content (waveform and sample rate,
+    or file content when audio is not loaded in memory) and of the pipeline
+    class, pretrained models and instantiated hyperparameters. They are stored
+    as compressed NumPy archives, and least recently used ones are removed when
+    the cache grows larger than `max_size`.
+
+    Pretrained models are looked up among attributes commonly used by
+    pyannote.audio pipelines (e.g. `segmentation` or `embedding`). Pipelines
+    that keep them elsewhere should be wrapped with an explicit `pipeline_id`.
+    Their weights are only hashed once per pipeline: use `mode="refresh"`
+    (or a new `pipeline_id`) after fine-tuning them in place.
+
+    Parameters
+    ----------
+    directory : Path
+        Cache directory. Created if needed.
+    max_size : int, optional
+        Maximum size of the cache, in bytes. Defaults to 1GiB.
+    mode : {"use", "refresh", "bypass"}, optional
+        "use" cached outputs when available (default), "refresh" them
+        (always run the pipeline and overwrite cached outputs), or "bypass"
+        the cache altogether.
+
+    Usage
+    -----
+    cache = PipelineCache("~/.cache/pyannotebook")
+    cached_pipeline = cache.wrap(pipeline)
+    annotation = cached_pipeline(file)
+
+    # pipeline whose pretrained models cannot be inferred
+    cached_pipeline = cache.wrap(pipeline, pipeline_id="my-pipeline-v2")
+    """
+
+    SUFFIX = ".npz"
+
+    def __init__(self, directory: Union[Text, Path], max_size: int = 1 << 30, mode: Text = "use"):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.mode = mode
+
+    @property
+    def mode(self) -> Text:
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: Text):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported cache mode '{mode}' (must be one of {MODES}).")
+        self._mode = mode
+
+    def key(self, file: Dict, pipeline: Callable, pipeline_id: Optional[Text] = None) -> Text:
+        """Hash of audio content and pipeline
+
+        Pipeline is identified by `pipeline_id` when provided, and by its
+        class, pretrained models and instantiated hyperparameters otherwise.
+        """
+
+        sha256 = hashlib.sha256()
+
+        if "waveform" in file:
+            waveform = file["waveform"]
+            # torch.Tensor
+            if hasattr(waveform, "numpy"):
+                waveform = waveform.detach().cpu().numpy()
+            waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+            sha256.update(f"{waveform.shape}:{file.get('sample_rate')}".encode())
+            sha256.update(memoryview(waveform).cast("B"))
+        else:
+            with open(file["audio"], "rb") as audio:
+                for block in iter(lambda: audio.read(1 << 20), b""):
+                    sha256.update(block)
+
+        if pipeline_id is not None:
+            sha256.update(f"id:{pipeline_id}".encode())
+            return sha256.hexdigest()
+
+        sha256.update(f"{type(pipeline).__module__}.{type(pipeline).__qualname__}".encode())
+        sha256.update(_models_digest(pipeline))
+        # hyperparameters are cheap to hash, and may be instantiated again
+        try:
+            parameters = pipeline.parameters(instantiated=True)
+        except Exception:
+            parameters = None
+        sha256.update(json.dumps(parameters, sort_keys=True, default=repr).encode())
+
+        return sha256.hexdigest()
+
+    def _path(self, key: Text) -> Path:
+        return self.directory / f"{key}{self.SUFFIX}"
+
+    def get(self, key: Text, uri: Optional[Text] = None) -> Optional["Annotation"]:
+        """Load cached output (None when missing or unreadable)
+
+        Outputs are keyed by audio content: pass the `uri` of the file at hand,
+        as the same audio may have been cached under another uri.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                starts, ends = data["start"].tolist(), data["end"].tolist()
+                tracks, labels = data["track"].tolist(), data["label"].tolist()
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # mark as recently used
+        os.utime(path)
+
+        from pyannote.core import Annotation, Segment
+        return Annotation.from_records(
+            ((Segment(start, end), track, label) for start, end, track, label in zip(starts, ends, tracks, labels)),
+            uri=uri,
+        )
+
+    def put(self, key: Text, annotation: "Annotation"):
+        """Store output (tracks and labels are stored as strings)"""
+        records = list(annotation.itertracks(yield_label=True))
+        _atomic_savez(
+            self._path(key),
+            savez=np.savez_compressed,
+            start=np.array([segment.start for segment, _, _ in records], dtype=np.float64),
+            end=np.array([segment.end for segment, _, _ in records], dtype=np.float64),
+            track=np.array([str(track) for _, track, _ in records], dtype=np.str_),
+            label=np.array([str(label) for _, _, label in records], dtype=np.str_),
+        )
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used outputs until cache fits in `max_size`"""
+        evict_lru(self.directory, f"*{self.SUFFIX}", self.max_size)
+
+    def clear(self):
+        """Remove all cached outputs"""
+        for path in self.directory.glob(f"*{self.SUFFIX}"):
+            path.unlink()
+
+    def wrap(
+        self,
+        pipeline: Callable,
+        pipeline_id: Optional[Text] = None,
+        lock: Optional[ContextManager] = None,
+    ) -> Callable:
+        """Wrap pipeline so that its outputs go through the cache
+
+        The returned callable has the same (file, hook=None) signature as
+        pyannote.audio pipelines, and follows the current `mode`.
+        See `key` for `pipeline_id`. When provided, `lock` is held while the
+        pipeline runs (but not while the cache is looked up), e.g. to keep
+        several threads from running the same pipeline at once.
+        """
+
+        def cached_pipeline(file: Dict, hook: Optional[Callable] = None) -> "Annotation":
+            if self.mode == "bypass":
+                with lock or nullcontext():
+                    return pipeline(file, hook=hook)
+
+            key = self.key(file, pipeline, pipeline_id=pipeline_id)
+            if self.mode == "use":
+                annotation = self.get(key, uri=file.get("uri"))
+                if annotation is not None:
+                    return annotation
+
+            with lock or nullcontext():
+                annotation = pipeline(file, hook=hook)
+            self.put(key, annotation)
+            return annotation
+
+        return cached_pipeline
+
+
+class EncodedAudio(NamedTuple):
+    """Encoded transport payload and derived peaks of an audio source
+
+    `payload` is empty (and `mime_type` is None) in streaming mode, where
+    audio is encoded chunk by chunk on request.
+    """
+
+    payload: bytes
+    mime_type: Optional[Text]
+    duration: float
+    # peak normalization gain (already applied to `peaks` and `payload`)
+    gain: float
+    peaks: PeakPyramid
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.payload) + sum(level.nbytes for level in self.peaks.levels)
+
+
+class PayloadCache:
+    """Content-addressed cache of encoded audio payloads and peaks
+
+    Entries are keyed by file path, size and modification time (or by a hash
+    of the waveform for in-memory audio), and by transport codec and sample
+    rate. Least recently used entries are evicted from memory (and from disk)
+    once the cache grows larger than `max_size` (and `max_disk_size`) bytes.
+
+    Hashing in-memory waveforms takes time (and is needed even for audio that
+    is never displayed again): set `waveforms` to False to only cache audio
+    read from files.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximum size of in-memory entries, in bytes. Defaults to 256MiB.
+        Set to 0 to only use the disk tier.
+    directory : Path, optional
+        Also keep entries on disk, in this directory. Created if needed.
+        Defaults to only keep entries in memory.
+    max_disk_size : int, optional
+        Maximum size of on-disk entries, in bytes. Defaults to 1GiB.
+    waveforms : bool, optional
+        Also cache in-memory audio. Defaults to True.
+
+    Usage
+    -----
+    cache = PayloadCache(directory="~/.cache/pyannotebook/payloads")
+    widget = WavesurferWidget(payload_cache=cache)
+    """
+
+    SUFFIX = ".payload.npz"
+
+    def __init__(
+        self,
+        max_size: int = 256 << 20,
+        directory: Optional[Union[Text, Path]] = None,
+        max_disk_size: int = 1 << 30,
+        waveforms: bool = True,
+    ):
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self.waveforms = waveforms
+        self.directory = None if directory is None else Path(directory).expanduser()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._size = 0
+        # entries may be added from worker threads (see `WavesurferWidget.prefetch`)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(
+        self, audio: "AudioSource", codec: Optional[Text] = None, max_sample_rate: Optional[int] = None
+    ) -> Optional[Text]:
+        """Cache key of `audio` encoded with `codec` (use codec=None for peaks only)
+
+        None when `audio` is not cached (i.e. in-memory audio, unless `waveforms` is True).
+        """
+
+        sha256 = hashlib.sha256()
+        if isinstance(audio, (str, Path)):
+            path = Path(audio).resolve()
+            stat = path.stat()
+            sha256.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        elif not self.waveforms:
+            return None
+        else:
+            waveform, sample_rate = audio
+            waveform = np.ascontiguousarray(waveform)
+            sha256.update(f"{waveform.dtype}:{waveform.shape}:{sample_rate}".encode())
+            sha256.update(memoryview(waveform).cast("B"))
+        sha256.update(f"{codec}:{max_sample_rate}".encode())
+        return sha256.hexdigest()
+
+    def _path(self, key: Text) -> Path:
+        return self.directory / f"{key}{self.SUFFIX}"
+
+    def get(self, key: Text) -> Optional[EncodedAudio]:
+        """Cached entry (None when missing)"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self.directory is None:
+            return None
+
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                num_levels = int(data["num_levels"])
+                peaks = PeakPyramid(
+                    [data[f"level{level}"] for level in range(num_levels)],
+                    int(data["sample_rate"]),
+                    int(data["base"]),
+                )
+                entry = EncodedAudio(
+                    payload=data["payload"].tobytes(),
+                    mime_type=str(data["mime_type"]) or None,
+                    duration=float(data["duration"]),
+                    gain=float(data["gain"]),
+                    peaks=peaks,
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # mark as recently used
+        os.utime(path)
+
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: Text, entry: EncodedAudio):
+        """Store entry (in memory, and on disk if enabled)"""
+
+        self._remember(key, entry)
+
+        if self.directory is None:
+            return
+
+        levels = {f"level{level}": peaks for level, peaks in enumerate(entry.peaks.levels)}
+        _atomic_savez(
+            self._path(key),
+            # payload is already compressed by the transport codec
+            payload=np.frombuffer(entry.payload, dtype=np.uint8),
+            mime_type=np.array(entry.mime_type or ""),
+            duration=np.array(entry.duration),
+            gain=np.array(entry.gain),
+            sample_rate=np.array(entry.peaks.sample_rate),
+            base=np.array(entry.peaks.base),
+            num_levels=np.array(len(entry.peaks.levels)),
+            **levels,
+        )
+        evict_lru(self.directory, f"*{self.SUFFIX}", self.max_disk_size)
+
+    def _remember(self, key: Text, entry: EncodedAudio):
+        """Add entry to in-memory tier and evict least recently used ones"""
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).nbytes
+            if entry.nbytes > self.max_size:
+                return
+            self._entries[key] = entry
+            self._size += entry.nbytes
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def clear(self):
+        """Remove all entries (from memory and disk)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.directory is not None:
+            for path in self.directory.glob(f"*{self.SUFFIX}"):
+                path.unlink()
+
+
+# shared by all widgets so that audio files displayed again (e.g. in another
+# cell) are neither read nor encoded again. kept small, and in-memory audio
+# is not cached, so that loading audio stays cheap in memory and time.
+DEFAULT_PAYLOAD_CACHE = PayloadCache(max_size=32 << 20, waveforms=False)
@@ -0,0 +1,279 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Audio codecs used to send audio from the kernel to the frontend.
+
+  - "wav": 32-bit float WAV (largest payload, no quantization)
+  - "pcm16": 16-bit integer WAV
+  - "flac": lossless 16-bit FLAC (requires `soundfile`)
+  - "opus": lossy Ogg/Opus (requires `soundfile` with libsndfile >= 1.0.29)
+
+Audio is expected to be peak-normalized to [-1, 1] before encoding.
+"""
+
+import io
+from functools import lru_cache
+from math import gcd
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def soundfile_is_available() -> bool:
+    """Check (once) whether `soundfile` can be imported
+
+    `soundfile` (and `scipy`) are only imported when audio is first loaded,
+    to keep `import pyannotebook` fast.
+    """
+    try:
+        import soundfile
+    except OSError:
+        print("Could not import `soundfile`: using `scipy.io.wavfile` instead, with limited audio file format support.")
+        return False
+    return True
+
+
+CODECS = ("wav", "pcm16", "flac", "opus")
+
+MIME_TYPES = {
+    "wav": "audio/x-wav",
+    "pcm16": "audio/x-wav",
+    "flac": "audio/flac",
+    "opus": "audio/ogg",
+}
+
+# (format, subtype) used by `soundfile` for each codec
+FORMATS = {
+    "wav": ("WAV", "FLOAT"),
+    "pcm16": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "opus": ("OGG", "OPUS"),
+}
+
+# sample rates supported by the Opus codec
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def transport_sample_rate(
+    sample_rate: int, codec: str = "flac", max_sample_rate: Optional[int] = None
+) -> int:
+    """Sample rate at which audio is actually sent to the frontend
+
+    Parameters
+    ----------
+    sample_rate : int
+        Original sample rate.
+    codec : str, optional
+        Transport codec. Defaults to "flac".
+    max_sample_rate : int, optional
+        Downsample audio whose sample rate is higher than this.
+        Defaults to keep original sample rate.
+    """
+    if max_sample_rate is not None:
+        sample_rate = min(sample_rate, max_sample_rate)
+
+    if codec == "opus" and sample_rate not in OPUS_SAMPLE_RATES:
+        # use the closest supported sample rate that does not lose bandwidth
+        sample_rate = min(
+            (sr for sr in OPUS_SAMPLE_RATES if sr >= sample_rate),
+            default=OPUS_SAMPLE_RATES[-1],
+        )
+
+    return sample_rate
+
+
+def resampled_range(reader, start: int, stop: int, target_sample_rate: int) -> np.ndarray:
+    """Resample [start, stop) frame range
+
+    The range is resampled with enough context on both sides, and only output
+    samples whose (absolute) position falls within the range are returned, so
+    that the concatenation of consecutive ranges matches resampling the whole
+    waveform at once.
+
+    Parameters
+    ----------
+    reader : AudioReader
+        Audio reader.
+    start, stop : int
+        Input frame range.
+    target_sample_rate : int
+        Target sample rate.
+    """
+
+    sample_rate = reader.sample_rate
+    if sample_rate == target_sample_rate:
+        return reader.read(start, stop)
+
+    import scipy.signal
+
+    factor = gcd(sample_rate, target_sample_rate)
+    up = target_sample_rate // factor
+    down = sample_rate // factor
+
+    start, stop = max(0, start), min(stop, reader.num_frames)
+    # half length of resample_poly's default filter, in input frames
+    half_length = 10 * max(up, down) // up + 1
+    # context must start on a multiple of `down` for its output samples
+    # to fall on the same (absolute) positions as the whole waveform's
+    context_start = max(0, start - half_length) // down * down
+    samples = reader.read(context_start, stop + half_length)
+    resampled = scipy.signal.resample_poly(samples, up, down).astype(np.float32, copy=False)
+
+    # output sample k is at input position k * down / up
+    offset = context_start // down * up
+    first = -(-start * up // down) - offset
+    last = -(-stop * up // down) - offset
+    return resampled[first:last]
+
+
+def resampled_blocks(reader, target_sample_rate: int, blocksize: int) -> Iterator[np.ndarray]:
+    """Iterate over resampled blocks of audio
+
+    See `resampled_range`: the concatenation of blocks matches resampling
+    the whole waveform at once.
+
+    Parameters
+    ----------
+    reader : AudioReader
+        Audio reader.
+    target_sample_rate : int
+        Target sample rate.
+    blocksize : int
+        Number of (input) frames per block.
+    """
+
+    if reader.sample_rate == target_sample_rate:
+        yield from reader.blocks(blocksize)
+        return
+
+    for start in range(0, reader.num_frames, blocksize):
+        yield resampled_range(reader, start, start + blocksize, target_sample_rate)
+
+
+def encode_reader(
+    reader,
+    gain: float = 1.0,
+    codec: str = "flac",
+    max_sample_rate: Optional[int] = None,
+    blocksize: int = 2 ** 20,
+) -> Tuple[bytes, str]:
+    """Encode audio for transport, block by block
+
+    Parameters
+    ----------
+    reader : AudioReader
+        Audio reader.
+    gain : float, optional
+        Gain applied to samples before encoding (e.g. for peak normalization).
+        Defaults to 1.
+    codec : {"wav", "pcm16", "flac", "opus"}, optional
+        Transport codec. Defaults to "flac".
+        Falls back to "pcm16" when `soundfile` is not available.
+    max_sample_rate : int, optional
+        Downsample audio whose sample rate is higher than this.
+        Defaults to keep original sample rate.
+    blocksize : int, optional
+        Number of frames encoded at once.
+
+    Returns
+    -------
+    payload : bytes
+        Encoded audio.
+    mime_type : str
+        Corresponding MIME type.
+    """
+
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec '{codec}': must be one of {CODECS}.")
+
+    if codec in {"flac", "opus"} and not soundfile_is_available():
+        codec = "pcm16"
+
+    target_sample_rate = transport_sample_rate(
+        reader.sample_rate, codec=codec, max_sample_rate=max_sample_rate
+    )
+    blocks = resampled_blocks(reader, target_sample_rate, blocksize)
+
+    with io.BytesIO() as content:
+
+        if soundfile_is_available():
+            import soundfile as sf
+            # normalize and encode one block at a time
+            format, subtype = FORMATS[codec]
+            with sf.SoundFile(
+                content, "w", samplerate=target_sample_rate, channels=1, format=format, subtype=subtype
+            ) as f:
+                for block in blocks:
+                    block *= gain
+                    # resampling may overshoot peak-normalized samples
+                    np.clip(block, -1.0, 1.0, out=block)
+                    f.write(block)
+
+        else:
+            # scipy.io.wavfile can only write whole waveforms
+            import scipy.io.wavfile
+            waveform = np.concatenate(list(blocks))
+            waveform *= gain
+            np.clip(waveform, -1.0, 1.0, out=waveform)
+            if codec == "pcm16":
+                waveform = (waveform * 32767.0).astype(np.int16)
+            scipy.io.wavfile.write(content, target_sample_rate, waveform)
+
+        payload = content.getvalue()
+
+    return payload, MIME_TYPES[codec]
+
+
+def encode(
+    waveform: np.ndarray,
+    sample_rate: int,
+    codec: str = "flac",
+    max_sample_rate: Optional[int] = None,
+) -> Tuple[bytes, str]:
+    """Encode (mono, peak-normalized) waveform for transport
+
+    Parameters
+    ----------
+    waveform : (num_samples, ) np.ndarray
+        Waveform.
+    sample_rate : int
+        Sample rate.
+    codec : {"wav", "pcm16", "flac", "opus"}, optional
+        Transport codec. Defaults to "flac".
+        Falls back to "pcm16" when `soundfile` is not available.
+    max_sample_rate : int, optional
+        Downsample audio whose sample rate is higher than this.
+        Defaults to keep original sample rate.
+
+    Returns
+    -------
+    payload : bytes
+        Encoded audio.
+    mime_type : str
+        Corresponding MIME type.
+    """
+    from .io import AudioReader
+    return encode_reader(
+        AudioReader((waveform, sample_rate)), codec=codec, max_sample_rate=max_sample_rate
+    )
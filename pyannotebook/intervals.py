@@ -0,0 +1,343 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Sorted interval index used for regions layout and navigation.
+"""
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Text, Tuple
+
+import numpy as np
+
+# two regions overlap when their intersection is longer than this
+# (same as pyannote.core.segment.SEGMENT_PRECISION)
+PRECISION = 1e-6
+
+
+class IntervalIndex:
+    """Intervals sorted by start time (and by end time)
+
+    Keeps parallel arrays of start and end times (and ids) sorted by (start, end)
+    so that clusters of overlapping intervals can be found with vectorized
+    operations, and only the clusters touched by an edit need relayout.
+    A second copy sorted by (end, start) supports backward navigation.
+
+    Edits are O(n), as sorted arrays are shifted (with `np.insert` and
+    `np.delete`), but this boils down to cheap memory moves. The running
+    maximum of end times and cluster boundaries derived from it are cached,
+    and only computed again from the first edited position onwards.
+
+    Usage
+    -----
+    index = IntervalIndex()
+    index.add("a", 0.0, 2.0)
+    index.add("b", 1.0, 3.0)
+    index.covering(1.5)  # ["a", "b"]
+    index.following("a")  # "b"
+    index.preceding("a")  # "b" (wraps around)
+    """
+
+    def __init__(self):
+        # sorted by (start, end)
+        self._starts = np.zeros((0,), dtype=np.float64)
+        self._ends = np.zeros((0,), dtype=np.float64)
+        self._ids: List[Text] = []
+        # sorted by (end, start)
+        self._ends_by_end = np.zeros((0,), dtype=np.float64)
+        self._starts_by_end = np.zeros((0,), dtype=np.float64)
+        self._ids_by_end: List[Text] = []
+        self._extents: Dict[Text, Tuple[float, float]] = dict()
+        # running maximum of end times and cluster boundaries, only valid
+        # for the first `_valid` positions (see `_invalidate` and `_refresh`)
+        self._cummax = np.zeros((0,), dtype=np.float64)
+        self._boundaries = np.zeros((0,), dtype=np.int64)
+        self._valid = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._extents)
+
+    def __contains__(self, interval_id: Text) -> bool:
+        return interval_id in self._extents
+
+    def extent(self, interval_id: Text) -> Tuple[float, float]:
+        return self._extents[interval_id]
+
+    @staticmethod
+    def _insertion_point(keys: np.ndarray, subkeys: np.ndarray, key: float, subkey: float) -> int:
+        """Position at which (key, subkey) should be inserted in lexicographically sorted arrays"""
+        first = int(np.searchsorted(keys, key, side="left"))
+        last = int(np.searchsorted(keys, key, side="right"))
+        return first + int(np.searchsorted(subkeys[first:last], subkey, side="right"))
+
+    @staticmethod
+    def _find(keys: np.ndarray, ids: List[Text], key: float, interval_id: Text) -> int:
+        position = int(np.searchsorted(keys, key, side="left"))
+        while ids[position] != interval_id:
+            position += 1
+        return position
+
+    def _position(self, interval_id: Text) -> int:
+        """Position of interval in arrays sorted by start time"""
+        start, _ = self._extents[interval_id]
+        return self._find(self._starts, self._ids, start, interval_id)
+
+    def _position_by_end(self, interval_id: Text) -> int:
+        """Position of interval in arrays sorted by end time"""
+        _, end = self._extents[interval_id]
+        return self._find(self._ends_by_end, self._ids_by_end, end, interval_id)
+
+    def add(self, interval_id: Text, start: float, end: float):
+        if interval_id in self._extents:
+            self.remove(interval_id)
+
+        position = self._insertion_point(self._starts, self._ends, start, end)
+        self._invalidate(position)
+        self._starts = np.insert(self._starts, position, start)
+        self._ends = np.insert(self._ends, position, end)
+        self._ids.insert(position, interval_id)
+
+        position = self._insertion_point(self._ends_by_end, self._starts_by_end, end, start)
+        self._ends_by_end = np.insert(self._ends_by_end, position, end)
+        self._starts_by_end = np.insert(self._starts_by_end, position, start)
+        self._ids_by_end.insert(position, interval_id)
+
+        self._extents[interval_id] = (start, end)
+
+    def remove(self, interval_id: Text):
+        position = self._position(interval_id)
+        self._invalidate(position)
+        self._starts = np.delete(self._starts, position)
+        self._ends = np.delete(self._ends, position)
+        del self._ids[position]
+
+        position = self._position_by_end(interval_id)
+        self._ends_by_end = np.delete(self._ends_by_end, position)
+        self._starts_by_end = np.delete(self._starts_by_end, position)
+        del self._ids_by_end[position]
+
+        del self._extents[interval_id]
+
+    def clear(self):
+        self.__init__()
+
+    def update(
+        self,
+        intervals: Dict[Text, Tuple[float, float]],
+        removed: Iterable[Text] = (),
+    ):
+        """Add (or move) and remove many intervals at once
+
+        Small edits are applied one by one, while large ones rebuild
+        sorted arrays in a single vectorized pass.
+
+        Parameters
+        ----------
+        intervals : dict
+            {interval_id: (start, end)} dictionary of intervals to add or move.
+        removed : iterable of str
+            Ids of intervals to remove.
+        """
+        removed = [interval_id for interval_id in removed if interval_id in self._extents]
+        if len(intervals) + len(removed) < 32:
+            for interval_id in removed:
+                self.remove(interval_id)
+            for interval_id, (start, end) in intervals.items():
+                self.add(interval_id, start, end)
+            return
+
+        for interval_id in removed:
+            del self._extents[interval_id]
+        self._extents.update(intervals)
+
+        ids = list(self._extents)
+        extents = np.array(list(self._extents.values()), dtype=np.float64).reshape(-1, 2)
+        starts, ends = extents[:, 0], extents[:, 1]
+
+        order = np.lexsort((ends, starts))
+        self._starts, self._ends = starts[order], ends[order]
+        self._ids = [ids[i] for i in order]
+
+        order = np.lexsort((starts, ends))
+        self._ends_by_end, self._starts_by_end = ends[order], starts[order]
+        self._ids_by_end = [ids[i] for i in order]
+
+        self._invalidate(0)
+
+    def _invalidate(self, position: int):
+        """Forget running maximum and cluster boundaries from `position` onwards
+
+        Both only depend on intervals before (and at) a given position: those
+        before an inserted or removed interval are left untouched.
+        """
+        if position >= self._valid:
+            return
+        self._valid = position
+        self._cummax = self._cummax[:position]
+        self._boundaries = self._boundaries[: int(np.searchsorted(self._boundaries, position, side="left"))]
+
+    def _refresh(self):
+        """Compute running maximum and cluster boundaries from first invalid position"""
+        valid, num_intervals = self._valid, len(self._ids)
+        if valid == num_intervals:
+            return
+
+        cummax = np.maximum.accumulate(self._ends[valid:])
+        if valid > 0:
+            np.maximum(cummax, self._cummax[valid - 1], out=cummax)
+        self._cummax = np.concatenate([self._cummax, cummax])
+
+        # interval i starts a new cluster when it does not overlap any previous one
+        first = max(valid, 1)
+        boundaries = np.flatnonzero(self._cummax[first - 1 : -1] - self._starts[first:] <= PRECISION) + first
+        self._boundaries = np.concatenate([self._boundaries, boundaries])
+
+        self._valid = num_intervals
+
+    @property
+    def cummax(self) -> np.ndarray:
+        self._refresh()
+        return self._cummax
+
+    def covering(self, time: float, tolerance: float = 0.0) -> List[Text]:
+        """Intervals containing `time`
+
+        Parameters
+        ----------
+        time : float
+        tolerance : float, optional
+            Also return intervals that are less than `tolerance` away from `time`.
+
+        Returns
+        -------
+        interval_ids : list of str
+            Ids of intervals such that start - tolerance <= time <= end + tolerance,
+            sorted by start time.
+        """
+        # intervals before `first` all end before `time` (running maximum of
+        # end times is sorted) and intervals after `last` all start after it
+        first = int(np.searchsorted(self.cummax, time - tolerance, side="left"))
+        last = int(np.searchsorted(self._starts, time + tolerance, side="right"))
+        if first >= last:
+            return []
+        mask = self._ends[first:last] >= time - tolerance
+        return [self._ids[first + offset] for offset in np.flatnonzero(mask)]
+
+    def following(self, interval_id: Optional[Text] = None) -> Optional[Text]:
+        """Next interval in (start, end) order, wrapping around
+
+        Returns the first interval when `interval_id` is not provided,
+        and None when the index is empty.
+        """
+        if not self._ids:
+            return None
+        if interval_id is None:
+            return self._ids[0]
+        return self._ids[(self._position(interval_id) + 1) % len(self._ids)]
+
+    def preceding(self, interval_id: Optional[Text] = None) -> Optional[Text]:
+        """Previous interval in (end, start) order, wrapping around
+
+        Returns the last interval when `interval_id` is not provided,
+        and None when the index is empty.
+        """
+        if not self._ids_by_end:
+            return None
+        if interval_id is None:
+            return self._ids_by_end[-1]
+        return self._ids_by_end[(self._position_by_end(interval_id) - 1) % len(self._ids_by_end)]
+
+    def _cluster_boundaries(self) -> np.ndarray:
+        """Sorted positions at which a new cluster of overlapping intervals starts"""
+        self._refresh()
+        return self._boundaries
+
+    def clusters(self, extents: Iterable[Tuple[float, float]]) -> List[Tuple[int, int]]:
+        """Clusters of overlapping intervals touched by any of `extents`
+
+        Parameters
+        ----------
+        extents : iterable of (start, end) tuples
+            Time ranges (e.g. previous and current extent of edited intervals).
+
+        Returns
+        -------
+        clusters : list of (first, last) tuples
+            Sorted positions range [first, last) of each touched cluster.
+        """
+        if not self._ids:
+            return []
+
+        extents = np.array(list(extents), dtype=np.float64).reshape(-1, 2)
+        if not len(extents):
+            return []
+
+        boundaries = self._cluster_boundaries()
+        # cluster k spans [bounds[k], bounds[k + 1])
+        bounds = np.concatenate([[0], boundaries, [len(self._ids)]])
+
+        # any interval that could intersect [start, end] lies in [first, last]...
+        first = np.maximum(0, np.searchsorted(self._starts, extents[:, 0], side="left") - 1)
+        last = np.minimum(len(self._ids) - 1, np.searchsorted(self._starts, extents[:, 1], side="right"))
+        # ... which spans clusters [k_first, k_last]
+        k_first = np.searchsorted(boundaries, first, side="right")
+        k_last = np.searchsorted(boundaries, last, side="right")
+
+        # union of [k_first, k_last] ranges
+        num_clusters = len(bounds) - 1
+        delta = np.zeros((num_clusters + 1,), dtype=np.int64)
+        np.add.at(delta, k_first, 1)
+        np.add.at(delta, k_last + 1, -1)
+        touched = np.flatnonzero(np.cumsum(delta[:-1]) > 0)
+
+        return [(int(bounds[k]), int(bounds[k + 1])) for k in touched]
+
+    def layout(self, first: int, last: int) -> Dict[Text, int]:
+        """Assign levels to intervals of a cluster so that overlapping ones differ
+
+        Greedy coloring in start time order, which is optimal for interval graphs.
+
+        Returns
+        -------
+        levels : dict
+            {interval_id: level} dictionary (0-indexed).
+        """
+        levels = dict()
+        active = []  # heap of (end, level) of intervals still running
+        free = []  # heap of available levels
+        num_levels = 0
+        for position in range(first, last):
+            start = self._starts[position]
+            while active and active[0][0] - start <= PRECISION:
+                _, level = heapq.heappop(active)
+                heapq.heappush(free, level)
+            if free:
+                level = heapq.heappop(free)
+            else:
+                level = num_levels
+                num_levels += 1
+            heapq.heappush(active, (self._ends[position], level))
+            levels[self._ids[position]] = level
+        return levels
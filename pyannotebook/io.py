@@ -0,0 +1,159 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Block-wise audio reading.
+
+Audio is never loaded as a whole: PCM/float WAV files are memory-mapped and
+other formats are read with `soundfile`, one block at a time, so that peak
+memory usage does not depend on the duration of the recording.
+"""
+
+from pathlib import Path
+from typing import Iterator, Optional, Text, Tuple, Union
+
+import numpy as np
+
+from .codec import soundfile_is_available
+
+
+AudioSource = Union[Text, Path, Tuple[np.ndarray, int]]
+
+# default number of frames per block (4MB of float32 samples)
+BLOCKSIZE = 2 ** 20
+
+
+def _to_float32(samples: np.ndarray) -> np.ndarray:
+    """Convert (memory-mapped) PCM samples to float32 in [-1, 1]"""
+    if samples.dtype == np.float32:
+        return np.array(samples, dtype=np.float32)
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float32) - 128.0) / 128.0
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = float(np.iinfo(samples.dtype).max) + 1.0
+        return samples.astype(np.float32) / scale
+    return samples.astype(np.float32)
+
+
+class AudioReader:
+    """Block-wise, mono, float32 access to an audio file or waveform
+
+    Parameters
+    ----------
+    audio : str, Path or (waveform, sample_rate) tuple
+        Audio file or in-memory (mono) waveform.
+
+    Usage
+    -----
+    reader = AudioReader("audio.wav")
+    for block in reader.blocks():
+        ...
+    """
+
+    def __init__(self, audio: AudioSource):
+
+        self.path = None
+        self._memmap = None
+
+        if isinstance(audio, (str, Path)):
+            self.path = str(audio)
+            self._open_file()
+
+        else:
+            waveform, sample_rate = audio
+            assert isinstance(waveform, np.ndarray)
+            assert waveform.ndim == 1
+            self._memmap = waveform
+            self.sample_rate = sample_rate
+            self.num_frames = len(waveform)
+
+    def _open_file(self):
+
+        # memory-map raw WAV data when possible
+        import scipy.io.wavfile
+        try:
+            self.sample_rate, self._memmap = scipy.io.wavfile.read(self.path, mmap=True)
+            self.num_frames = len(self._memmap)
+            return
+        except ValueError:
+            # not a (memory-mappable) WAV file
+            pass
+
+        if not soundfile_is_available():
+            raise ValueError(f"Could not read {self.path}: only WAV files are supported without `soundfile`.")
+
+        import soundfile as sf
+        info = sf.info(self.path)
+        self.sample_rate = info.samplerate
+        self.num_frames = info.frames
+
+    @property
+    def duration(self) -> float:
+        return self.num_frames / self.sample_rate
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Read [start, stop) frame range
+
+        Returns
+        -------
+        samples : (num_frames, ) np.ndarray
+            Newly allocated mono float32 samples (safe to modify in place).
+        """
+        start = max(0, start)
+        stop = min(stop, self.num_frames)
+        if stop <= start:
+            return np.zeros((0,), dtype=np.float32)
+
+        if self._memmap is not None:
+            samples = _to_float32(self._memmap[start:stop])
+            if samples.ndim > 1:
+                samples = np.mean(samples, axis=1, dtype=np.float32)
+            return samples
+
+        import soundfile as sf
+        with sf.SoundFile(self.path) as f:
+            f.seek(start)
+            samples = f.read(stop - start, dtype="float32", always_2d=True)
+        if samples.shape[1] == 1:
+            return samples[:, 0].copy()
+        return np.mean(samples, axis=1, dtype=np.float32)
+
+    def blocks(
+        self, blocksize: int = BLOCKSIZE, start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[np.ndarray]:
+        """Iterate over consecutive blocks of `blocksize` frames (last one may be shorter)"""
+
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+
+        if self._memmap is not None:
+            for offset in range(start, stop, blocksize):
+                yield self.read(offset, min(offset + blocksize, stop))
+            return
+
+        import soundfile as sf
+        for block in sf.blocks(
+            self.path, blocksize=blocksize, start=start, stop=stop, dtype="float32", always_2d=True
+        ):
+            if block.shape[1] == 1:
+                yield block[:, 0]
+            else:
+                yield np.mean(block, axis=1, dtype=np.float32)
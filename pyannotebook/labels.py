@@ -23,6 +23,7 @@
 import ipywidgets
 import traitlets
 from ._frontend import module_name, module_version
+from .profiling import Profiled, profiled
 from itertools import cycle
 from typing import Dict
 
@@ -37,7 +38,7 @@ COLORS = [
     "#66cdaa",
 ]
 
-class LabelsWidget(ipywidgets.Widget):
+class LabelsWidget(Profiled, ipywidgets.Widget):
     """Labels widget
 
     Usage
@@ -67,6 +68,7 @@ class LabelsWidget(ipywidgets.Widget):
         self._color_pool = cycle(COLORS)
 
     @traitlets.observe("labels")
+    @profiled
     def labels_has_changed(self, change: Dict):
         """Update label-to-color mapping when `labels` changes"""
 
@@ -0,0 +1,169 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Multi-resolution waveform peaks.
+
+Peaks are computed in the kernel so that the browser can draw the waveform
+without decoding the audio first (wavesurfer.js precomputed peaks mode).
+"""
+
+from typing import Iterable, List
+
+import numpy as np
+
+
+def compute_peaks(waveform: np.ndarray, samples_per_pixel: int) -> np.ndarray:
+    """Compute (max, min) peaks of consecutive chunks of `samples_per_pixel` samples
+
+    Parameters
+    ----------
+    waveform : (num_samples, ) np.ndarray
+        Waveform.
+    samples_per_pixel : int
+        Number of samples per chunk.
+
+    Returns
+    -------
+    peaks : (num_pixels, 2) np.ndarray
+        Maximum (first column) and minimum (second column) value of each chunk.
+        This is the interleaved layout expected by wavesurfer.js once flattened.
+    """
+
+    num_samples = len(waveform)
+    num_full, remainder = divmod(num_samples, samples_per_pixel)
+    num_pixels = num_full + (remainder > 0)
+
+    peaks = np.zeros((num_pixels, 2), dtype=np.float32)
+    if num_full > 0:
+        chunks = waveform[: num_full * samples_per_pixel].reshape(num_full, samples_per_pixel)
+        np.max(chunks, axis=1, out=peaks[:num_full, 0])
+        np.min(chunks, axis=1, out=peaks[:num_full, 1])
+    if remainder > 0:
+        peaks[-1, 0] = np.max(waveform[num_full * samples_per_pixel :])
+        peaks[-1, 1] = np.min(waveform[num_full * samples_per_pixel :])
+    return peaks
+
+
+def downsample_peaks(peaks: np.ndarray) -> np.ndarray:
+    """Halve the resolution of (max, min) peaks"""
+    num_pixels = len(peaks)
+    if num_pixels % 2:
+        peaks = np.concatenate([peaks, peaks[-1:]])
+    pairs = peaks.reshape(-1, 2, 2)
+    return np.stack([pairs[:, :, 0].max(axis=1), pairs[:, :, 1].min(axis=1)], axis=1)
+
+
+class PeakPyramid:
+    """Multi-resolution (max, min) waveform peaks
+
+    Level k has `base * 2 ** k` samples per pixel.
+
+    Parameters
+    ----------
+    levels : list of (num_pixels, 2) np.ndarray
+        Peaks, from finest to coarsest resolution.
+    sample_rate : int
+        Sample rate.
+    base : int
+        Number of samples per pixel of the finest level.
+
+    Usage
+    -----
+    pyramid = PeakPyramid.from_waveform(waveform, sample_rate)
+    peaks = pyramid.peaks(zoom=20)
+    """
+
+    def __init__(self, levels: List[np.ndarray], sample_rate: int, base: int):
+        self.levels = levels
+        self.sample_rate = sample_rate
+        self.base = base
+
+    @classmethod
+    def from_levels(
+        cls, peaks: np.ndarray, sample_rate: int, base: int = 32, min_pixels: int = 1024
+    ) -> "PeakPyramid":
+        """Build pyramid from finest level by iterative halving"""
+        levels = [peaks]
+        while len(levels[-1]) > min_pixels:
+            levels.append(downsample_peaks(levels[-1]))
+        return cls(levels, sample_rate, base)
+
+    @classmethod
+    def from_waveform(
+        cls, waveform: np.ndarray, sample_rate: int, base: int = 32, min_pixels: int = 1024
+    ) -> "PeakPyramid":
+        """Compute pyramid of a (mono) waveform
+
+        Parameters
+        ----------
+        waveform : (num_samples, ) or (num_samples, num_channels) np.ndarray
+            Waveform. Multi-channel waveforms are downmixed.
+        sample_rate : int
+            Sample rate.
+        base : int, optional
+            Number of samples per pixel of the finest level. Defaults to 32.
+        min_pixels : int, optional
+            Stop halving resolution below that number of pixels. Defaults to 1024.
+        """
+        if waveform.ndim > 1:
+            waveform = np.mean(waveform, axis=1, dtype=np.float32)
+        return cls.from_levels(
+            compute_peaks(waveform, base), sample_rate, base=base, min_pixels=min_pixels
+        )
+
+    @classmethod
+    def from_blocks(
+        cls, blocks: Iterable[np.ndarray], sample_rate: int, base: int = 32, min_pixels: int = 1024
+    ) -> "PeakPyramid":
+        """Compute pyramid of a (mono) waveform provided block by block
+
+        Blocks size must be a multiple of `base` (except for the last one).
+        """
+        peaks = [compute_peaks(block, base) for block in blocks]
+        peaks = np.concatenate(peaks) if peaks else np.zeros((0, 2), dtype=np.float32)
+        return cls.from_levels(peaks, sample_rate, base=base, min_pixels=min_pixels)
+
+    @property
+    def peak_amplitude(self) -> float:
+        """Maximum absolute amplitude of the waveform"""
+        return float(np.max(np.abs(self.levels[-1]), initial=0.0))
+
+    def scale(self, gain: float):
+        """Scale peaks in place (e.g. after waveform normalization)"""
+        for peaks in self.levels:
+            peaks *= gain
+
+    def samples_per_pixel(self, level: int) -> int:
+        return self.base * 2 ** level
+
+    def level(self, zoom: float) -> int:
+        """Coarsest level whose resolution is at least the one needed at `zoom` pixels per second"""
+        if zoom <= 0:
+            return len(self.levels) - 1
+        needed = self.sample_rate / zoom
+        level = int(np.floor(np.log2(max(needed / self.base, 1.0))))
+        return min(level, len(self.levels) - 1)
+
+    def peaks(self, zoom: float) -> np.ndarray:
+        """Interleaved (max, min) peaks matching `zoom` pixels per second"""
+        return self.levels[self.level(zoom)].ravel()
@@ -0,0 +1,312 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Opt-in instrumentation of widgets: handlers latency and comm traffic.
+
+Usage
+-----
+with notebook.profile() as stats:
+    ...  # annotate
+print(stats.summary())
+"""
+
+import functools
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Text
+
+# latency histograms have one bucket per power of two microseconds
+NUM_BUCKETS = 32
+
+
+class Histogram:
+    """Latency histogram with power-of-two (microseconds) buckets"""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def add(self, duration: float):
+        """Add duration (in seconds)"""
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        microseconds = int(duration * 1e6)
+        self.buckets[min(microseconds.bit_length(), NUM_BUCKETS - 1)] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket containing the `q`-quantile (in seconds)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return min(2 ** bucket * 1e-6, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Traffic:
+    """Number and size of comm messages"""
+
+    __slots__ = ("count", "bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+
+    def add(self, num_bytes: int):
+        self.count += 1
+        self.bytes += num_bytes
+
+    def to_dict(self) -> Dict:
+        return {"count": self.count, "bytes": self.bytes}
+
+
+class Stats:
+    """Widgets profiling statistics
+
+    Attributes
+    ----------
+    timings : {name: Histogram} dict
+        Latency of (kernel-side) handlers, e.g. "WavesurferWidget.on_regions_change"
+        or "WavesurferWidget.keyboard[shift+Tab]". Also includes comm serialization
+        ("WavesurferWidget.send") and handling of browser messages
+        ("WavesurferWidget.recv").
+    sent : {name: Traffic} dict
+        Messages sent to the browser, per synced trait (e.g. "WavesurferWidget.payload")
+        or custom message event (e.g. "WavesurferWidget.msg[regions]").
+    received : {name: Traffic} dict
+        Messages received from the browser, using the same naming.
+    browser : {name: Histogram} dict
+        Latency of browser-side operations (e.g. "WavesurferView.render_regions"),
+        measured with `performance.measure` and reported periodically.
+    """
+
+    def __init__(self):
+        self.timings: Dict[Text, Histogram] = defaultdict(Histogram)
+        self.sent: Dict[Text, Traffic] = defaultdict(Traffic)
+        self.received: Dict[Text, Traffic] = defaultdict(Traffic)
+        self.browser: Dict[Text, Histogram] = defaultdict(Histogram)
+
+    def reset(self):
+        for stats in (self.timings, self.sent, self.received, self.browser):
+            stats.clear()
+
+    def to_dict(self) -> Dict:
+        return {
+            category: {name: stat.to_dict() for name, stat in sorted(stats.items())}
+            for category, stats in [
+                ("timings", self.timings),
+                ("sent", self.sent),
+                ("received", self.received),
+                ("browser", self.browser),
+            ]
+        }
+
+    def summary(self) -> Text:
+        """Human-readable summary, one line per handler (or trait)"""
+        lines = []
+        for title, histograms in [("Kernel", self.timings), ("Browser", self.browser)]:
+            if not histograms:
+                continue
+            lines.append(f"{title:<48} {'count':>8} {'mean (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}")
+            for name, histogram in sorted(histograms.items(), key=lambda item: -item[1].total):
+                lines.append(
+                    f"{name:<48} {histogram.count:>8d} {1e3 * histogram.mean:>10.3f} "
+                    f"{1e3 * histogram.quantile(0.99):>10.3f} {1e3 * histogram.max:>10.3f}"
+                )
+        for title, traffic in [("Sent", self.sent), ("Received", self.received)]:
+            if not traffic:
+                continue
+            lines.append(f"{title:<48} {'count':>8} {'bytes':>10}")
+            for name, t in sorted(traffic.items(), key=lambda item: -item[1].bytes):
+                lines.append(f"{name:<48} {t.count:>8d} {t.bytes:>10d}")
+        return "\n".join(lines)
+
+    def __repr__(self) -> Text:
+        return self.summary()
+
+
+def profiled(method: Optional[Callable] = None, *, name: Optional[Callable[..., Text]] = None):
+    """Record latency of widget method when profiling is on
+
+    Parameters
+    ----------
+    method : callable
+        Method of a `Profiled` widget.
+    name : callable, optional
+        Called with method arguments to get a more specific name
+        (e.g. one per keyboard shortcut). Defaults to method name.
+
+    Usage
+    -----
+    @traitlets.observe("regions")
+    @profiled
+    def on_regions_change(self, change):
+        ...
+    """
+
+    if method is None:
+        return functools.partial(profiled, name=name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self._stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+        key = method.__name__ if name is None else name(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.timings[f"{type(self).__name__}.{key}"].add(time.perf_counter() - start)
+
+    return wrapper
+
+
+def _json_size(value) -> int:
+    return len(json.dumps(value, separators=(",", ":"), default=str))
+
+
+def _count(traffic: Dict[Text, Traffic], prefix: Text, msg: Dict, buffers):
+    """Attribute size of widget message (and its binary buffers) to traits or custom events"""
+
+    buffers = list(buffers or [])
+    method = msg.get("method")
+
+    if method == "update":
+        sizes = {name: _json_size(value) for name, value in msg.get("state", {}).items()}
+        for path, buffer in zip(msg.get("buffer_paths", []), buffers):
+            sizes[path[0]] = sizes.get(path[0], 0) + memoryview(buffer).nbytes
+        for name, size in sizes.items():
+            traffic[f"{prefix}.{name}"].add(size)
+
+    elif method == "custom":
+        content = msg.get("content", {})
+        event = content.get("event") if isinstance(content, dict) else None
+        size = _json_size(content) + sum(memoryview(buffer).nbytes for buffer in buffers)
+        traffic[f"{prefix}.msg[{event}]"].add(size)
+
+    else:
+        traffic[f"{prefix}.{method}"].add(_json_size(msg))
+
+
+class Profiled:
+    """Mixin adding opt-in profiling to ipywidgets
+
+    Methods decorated with `profiled` are timed, and comm messages are
+    counted (and measured) per synced trait while profiling is on.
+    Widgets with a synced `profiling` trait also get their browser-side
+    timings (see `Stats.browser`).
+
+    Usage
+    -----
+    class MyWidget(Profiled, ipywidgets.DOMWidget):
+        ...
+
+    with widget.profile() as stats:
+        ...
+    """
+
+    _stats: Optional[Stats] = None
+
+    @property
+    def stats(self) -> Optional[Stats]:
+        """Current profiling statistics (None when profiling is off)"""
+        return self._stats
+
+    def start_profiling(self, stats: Optional[Stats] = None) -> Stats:
+        """Start recording (into `stats` when provided)"""
+        self._stats = Stats() if stats is None else stats
+        if self.has_trait("profiling"):
+            self.profiling = True
+        return self._stats
+
+    def stop_profiling(self) -> Optional[Stats]:
+        """Stop recording and return statistics"""
+        if self.has_trait("profiling"):
+            self.profiling = False
+        stats, self._stats = self._stats, None
+        return stats
+
+    @contextmanager
+    def profile(self, stats: Optional[Stats] = None) -> Iterator[Stats]:
+        """Record statistics while in context"""
+        stats = self.start_profiling(stats=stats)
+        try:
+            yield stats
+        finally:
+            self.stop_profiling()
+
+    def _send(self, msg, buffers=None):
+        stats = self._stats
+        if stats is None:
+            return super()._send(msg, buffers=buffers)
+        _count(stats.sent, type(self).__name__, msg, buffers)
+        start = time.perf_counter()
+        try:
+            return super()._send(msg, buffers=buffers)
+        finally:
+            stats.timings[f"{type(self).__name__}.send"].add(time.perf_counter() - start)
+
+    def _handle_msg(self, msg):
+        stats = self._stats
+        if stats is None:
+            return super()._handle_msg(msg)
+        _count(stats.received, type(self).__name__, msg["content"]["data"], msg.get("buffers"))
+        start = time.perf_counter()
+        try:
+            return super()._handle_msg(msg)
+        finally:
+            stats.timings[f"{type(self).__name__}.recv"].add(time.perf_counter() - start)
+
+    def _record_browser_measures(self, measures: Dict[Text, list]):
+        """Add browser-side durations (in milliseconds) to statistics"""
+        if self._stats is None:
+            return
+        for name, durations in measures.items():
+            histogram = self._stats.browser[name]
+            for duration in durations:
+                histogram.add(1e-3 * duration)
@@ -26,20 +26,52 @@ import ipywidgets
 from .wavesurfer import WavesurferWidget
 from .annotation import AnnotationWidget
 from .labels import LabelsWidget
+from .background import PipelineRunner
+from .cache import DEFAULT_PAYLOAD_CACHE, EncodedAudio, PayloadCache, PipelineCache
+from .profiling import Profiled, Stats
 
-from typing import Optional
+import threading
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Text, Tuple, Union, TYPE_CHECKING
 from pyannote.core import Annotation
 
-try:
-    from pyannote.audio import Audio, Pipeline
+if TYPE_CHECKING:
+    from pyannote.audio import Pipeline
     from pyannote.audio.core.io import AudioFile
-    from pyannote.audio.pipelines.utils.hook import ProgressHook
-    PYANNOTE_AUDIO_AVAILABLE = True
-except ImportError:
-    PYANNOTE_AUDIO_AVAILABLE = False
+    from .io import AudioSource
 
 
-class Pyannotebook(ipywidgets.VBox):
+@lru_cache(maxsize=None)
+def pyannote_audio_is_available() -> bool:
+    """Check (once) whether `pyannote.audio` can be imported
+
+    `pyannote.audio` (and therefore `torch`) is only imported when audio
+    is first loaded, to keep `import pyannotebook` fast.
+    """
+    try:
+        import pyannote.audio
+    except ImportError:
+        return False
+    return True
+
+
+class Prefetched(NamedTuple):
+    """Audio file loaded, encoded and (optionally) annotated in advance
+
+    See `Pyannotebook.prefetch`.
+    """
+
+    # validated file (with its waveform loaded in memory, unless streaming)
+    file: "AudioFile"
+    # pipeline output (None when there is no pipeline or it was not run)
+    annotation: Optional[Annotation]
+    audio: "AudioSource"
+    encoded: EncodedAudio
+
+
+class Pyannotebook(Profiled, ipywidgets.VBox):
     """Notebook widget for audio annotation
     
     Parameters
@@ -55,7 +87,42 @@ class Pyannotebook(ipywidgets.VBox):
     auto_select : bool, optional
         Automatically select region corresponding to current time.
         Defaults to False.
+    time_sync_rate : float, optional
+        Maximum number of playback time updates sent by the browser per second.
+        Defaults to 10.
+    codec : {"flac", "pcm16", "opus", "wav"}, optional
+        Codec used to send audio to the browser. Defaults to "flac".
+    max_sample_rate : int, optional
+        Downsample audio whose sample rate is higher than this before sending
+        it to the browser. Defaults to keep original sample rate.
+    streaming : bool, optional
+        Only send audio chunks around the current viewport and playback
+        position to the browser. Use this for multi-hour recordings.
+        Defaults to False.
+    background : bool, optional
+        Run pipeline in a worker thread (with a progress bar) so that the
+        waveform can be browsed in the meantime. The annotation is updated
+        once the pipeline is done. Defaults to False (block until done).
+    cache : PipelineCache or str, optional
+        Cache pipeline outputs on disk (in provided directory), so that they are
+        not recomputed for audio files that were already processed with the
+        same pipeline. Defaults to not cache anything.
+    payload_cache : PayloadCache, optional
+        Cache of audio encoded for the browser. Defaults to a small in-memory
+        cache of audio files shared by all widgets. Set to None to disable caching.
+    local_keyboard : bool, optional
+        Handle keyboard shortcuts in the browser, so that they stay responsive
+        while the kernel is busy (e.g. running a pipeline). Defaults to False.
     
+    Usage
+    -----
+    notebook = Pyannotebook(audio)
+
+    # record handlers latency and comm traffic of all sub-widgets
+    with notebook.profile() as stats:
+        ...
+    print(stats.summary())
+
     See also
     --------
     pyannote.audio.core.io.AudioFile
@@ -67,15 +134,43 @@ class Pyannotebook(ipywidgets.VBox):
         pipeline: Optional["Pipeline"] = None,
         minimap: bool = True,
         auto_select: bool = False,
+        time_sync_rate: float = 10.0,
+        codec: str = "flac",
+        max_sample_rate: Optional[int] = None,
+        streaming: bool = False,
+        background: bool = False,
+        cache: Optional[Union[PipelineCache, Text, Path]] = None,
+        payload_cache: Optional[PayloadCache] = DEFAULT_PAYLOAD_CACHE,
+        local_keyboard: bool = False,
     ):
 
         self.minimap = minimap
         self.auto_select = auto_select
+        self.streaming = streaming
+        self.background = background
+        if cache is not None and not isinstance(cache, PipelineCache):
+            cache = PipelineCache(cache)
+        self.cache = cache
 
-        self._wavesurfer = WavesurferWidget(minimap=self.minimap, auto_select=self.auto_select)
+        self._wavesurfer = WavesurferWidget(
+            minimap=self.minimap,
+            auto_select=self.auto_select,
+            time_sync_rate=time_sync_rate,
+            codec=codec,
+            max_sample_rate=max_sample_rate,
+            streaming=streaming,
+            payload_cache=payload_cache,
+            local_keyboard=local_keyboard,
+        )
         self._annotation = AnnotationWidget()
         self._labels = LabelsWidget()
-        super().__init__([self._wavesurfer, self._labels])
+        self._runner = PipelineRunner(on_done=self._set_annotation)
+        # serializes pipeline calls (see `_wrapped_pipeline`)
+        self._pipeline_lock = threading.Lock()
+        children = [self._wavesurfer, self._labels]
+        if self.background:
+            children.append(self._runner.progress)
+        super().__init__(children)
         ipywidgets.link((self._labels, 'labels'), (self._annotation, 'labels'))
         ipywidgets.link((self._labels, 'labels'), (self._wavesurfer, 'labels'))
         ipywidgets.link((self._annotation, 'regions'), (self._wavesurfer, 'regions'))
@@ -97,25 +192,153 @@ class Pyannotebook(ipywidgets.VBox):
 
     annotation = property(_get_annotation, _set_annotation, _del_annotation)
 
-    def _set_audio(self, file: "AudioFile"):
+    def _read(self, file: "AudioFile") -> Tuple["AudioFile", "AudioSource"]:
+        """Validate file and load its audio the way the waveform widget expects it"""
+
+        if not pyannote_audio_is_available():
+            return file, file
+
+        from pyannote.audio import Audio
+        audio = Audio(mono=True)
+        file = audio.validate_file(file)
+        if self.streaming and "audio" in file:
+            # let the widget read the file chunk by chunk
+            return file, file["audio"]
+        file["waveform"], file["sample_rate"] = audio(file)
+        return file, (file["waveform"].numpy().squeeze(), file["sample_rate"])
+
+    def _wrapped_pipeline(self) -> Callable:
+        """Pipeline (wrapped by `cache`) that never runs concurrently with itself
+
+        Pipelines are run by `prefetch` (e.g. in a worker thread) as well as
+        by `load` (possibly in the background), and are not thread-safe.
+        """
+        if self.cache is not None:
+            return self.cache.wrap(self.pipeline, lock=self._pipeline_lock)
+
+        pipeline, lock = self.pipeline, self._pipeline_lock
+
+        def locked_pipeline(file: "AudioFile", hook: Optional[Callable] = None) -> Annotation:
+            with lock:
+                return pipeline(file, hook=hook)
+
+        return locked_pipeline
 
-        if PYANNOTE_AUDIO_AVAILABLE:
-            audio = Audio(mono=True)
-            file = audio.validate_file(file)
-            file["waveform"], file["sample_rate"] = audio(file)
-            self._wavesurfer.audio = (file["waveform"].numpy().squeeze(), file["sample_rate"])
+    def prefetch(self, file: "AudioFile", run_pipeline: bool = True) -> Prefetched:
+        """Load audio, encode it for the browser and run pipeline in advance
+
+        Safe to call from a worker thread: widgets are left untouched.
+
+        Parameters
+        ----------
+        file : AudioFile
+            Audio file.
+        run_pipeline : bool, optional
+            Set to False to only prefetch audio. Defaults to True.
+
+        Returns
+        -------
+        prefetched : Prefetched
+            Validated file, pipeline output (None when there is no pipeline or
+            `run_pipeline` is False), and encoded audio.
+
+        Usage
+        -----
+        prefetched = notebook.prefetch(file)  # e.g. in a worker thread
+        notebook.load(prefetched)  # (almost) instant
+        """
+        file, source = self._read(file)
+        encoded = self._wavesurfer.prefetch(source)
+        annotation = None
+        if self.pipeline is not None and run_pipeline:
+            annotation = self._wrapped_pipeline()(file)
+        return Prefetched(file, annotation, source, encoded)
+
+    def load(self, file: Union["AudioFile", Prefetched], annotation: Optional[Annotation] = None):
+        """Load audio file
+
+        Parameters
+        ----------
+        file : AudioFile or Prefetched
+            Audio file, or audio file prefetched with `prefetch` (whose audio
+            is neither read nor encoded again).
+        annotation : Annotation, optional
+            Use this annotation instead of running the pipeline.
+            Defaults to use prefetched pipeline output (if any), or to run
+            the pipeline (if any).
+        """
+
+        # previous audio pipeline output is no longer needed
+        self._runner.cancel()
+
+        if isinstance(file, Prefetched):
+            if annotation is None:
+                annotation = file.annotation
+            self._wavesurfer.set_audio(file.audio, encoded=file.encoded)
+            file = file.file
         else:
-            self._wavesurfer.audio = file
+            file, source = self._read(file)
+            self._wavesurfer.audio = source
+
+        if annotation is not None:
+            self.annotation = annotation
+            return
 
         if self.pipeline is None:
             return
 
+        pipeline = self._wrapped_pipeline()
+
+        if self.background:
+            self._runner.run(pipeline, file)
+            return
+
         # use progress hook to provide feedback
+        from pyannote.audio.pipelines.utils.hook import ProgressHook
         with ProgressHook() as hook:
-            annotation = self.pipeline(file, hook=hook)
+            annotation = pipeline(file, hook=hook)
         self.annotation = annotation
 
+    def _set_audio(self, file: "AudioFile"):
+        self.load(file)
+
+    @contextmanager
+    def batch(self):
+        """Coalesce edits (e.g. of `annotation`) until the block exits
+
+        Regions changes are applied (and sent to the browser) once, and
+        synced traits of all sub-widgets are sent together when the block
+        exits. See `WavesurferWidget.batch` and `AnnotationWidget.batch`.
+
+        Usage
+        -----
+        with notebook.batch():
+            notebook.annotation = annotation
+            ...
+        """
+        with ExitStack() as stack:
+            # annotation widget is updated (through links) when waveform
+            # widget batch exits: enter it first so that it exits last
+            stack.enter_context(self._annotation.batch())
+            stack.enter_context(self._labels.hold_sync())
+            stack.enter_context(self._wavesurfer.batch())
+            yield
+
+    def start_profiling(self, stats: Optional[Stats] = None) -> Stats:
+        """Start recording statistics of all sub-widgets (into `stats` when provided)"""
+        stats = super().start_profiling(stats=stats)
+        for widget in (self._wavesurfer, self._annotation, self._labels):
+            widget.start_profiling(stats=stats)
+        return stats
+
+    def stop_profiling(self) -> Optional[Stats]:
+        """Stop recording and return statistics"""
+        for widget in (self._wavesurfer, self._annotation, self._labels):
+            widget.stop_profiling()
+        return super().stop_profiling()
+
     def _del_audio(self):
+        self._runner.cancel()
         del self._wavesurfer.audio
 
     audio = property(None, _set_audio, _del_audio)
\ No newline at end of file
@@ -0,0 +1,460 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Columnar region store shared by annotation and waveform widgets.
+"""
+
+from itertools import count
+from typing import Container, Dict, Iterable, Iterator, List, Optional, Sequence, Text, Tuple
+
+import numpy as np
+
+
+class RegionStore:
+    """Regions stored as parallel NumPy arrays, indexed by id
+
+    Start and end times are stored as float64 arrays and labels as integer
+    codes, so that bulk operations are vectorized. A dictionary maps each
+    region id to its row, so that lookup, update and removal (which swaps
+    the last row into the removed one) are O(1).
+
+    Parameters
+    ----------
+    prefix : str, optional
+        Prefix of automatically allocated region ids.
+        Defaults to "frompython_". Ids are allocated from a counter shared
+        by all stores with the same prefix, so that stores kept in sync
+        (e.g. through linked widgets) never allocate each other's ids.
+
+    Usage
+    -----
+    store = RegionStore()
+    region_id = store.add(0.0, 2.0, "a")
+    store.update(region_id, end=3.0)
+    store[region_id]  # {"start": 0.0, "end": 3.0, "id": region_id, "label": "a"}
+    store.to_list()   # list of {"start": float, "end": float, "id": str, "label": str}
+    """
+
+    # {prefix: counter} shared by all stores
+    _counters: Dict[Text, Iterator[int]] = dict()
+
+    def __init__(self, prefix: Text = "frompython_"):
+        self.prefix = prefix
+        self._counter = self._counters.setdefault(prefix, count())
+
+        self._start = np.zeros((16,), dtype=np.float64)
+        self._end = np.zeros((16,), dtype=np.float64)
+        self._code = np.zeros((16,), dtype=np.int32)
+        self._size = 0
+
+        # row -> id and id -> row
+        self._ids: List[Text] = []
+        self._rows: Dict[Text, int] = dict()
+
+        # label <-> code
+        self._labels: List[Text] = []
+        self._codes: Dict[Text, int] = dict()
+
+        # list of dict representation, built lazily
+        self._list: Optional[List[Dict]] = None
+
+        # incremented on every change (e.g. to invalidate derived caches)
+        self.version = 0
+
+    def _changed(self):
+        self._list = None
+        self.version += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Text]:
+        return iter(list(self._ids))
+
+    def __contains__(self, region_id: Text) -> bool:
+        return region_id in self._rows
+
+    def __getitem__(self, region_id: Text) -> Dict:
+        return self._region(self._rows[region_id])
+
+    def get(self, region_id: Text, default: Optional[Dict] = None) -> Optional[Dict]:
+        row = self._rows.get(region_id)
+        if row is None:
+            return default
+        return self._region(row)
+
+    def _region(self, row: int) -> Dict:
+        return {
+            "start": float(self._start[row]),
+            "end": float(self._end[row]),
+            "id": self._ids[row],
+            "label": self._labels[self._code[row]],
+        }
+
+    @property
+    def starts(self) -> np.ndarray:
+        """Start times (read-only view, in row order)"""
+        view = self._start[: self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def ends(self) -> np.ndarray:
+        """End times (read-only view, in row order)"""
+        view = self._end[: self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def codes(self) -> np.ndarray:
+        """Label codes (read-only view, in row order)"""
+        view = self._code[: self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def ids(self) -> List[Text]:
+        """Region ids (in row order)"""
+        return list(self._ids)
+
+    @property
+    def labels(self) -> List[Text]:
+        """Labels, indexed by their code"""
+        return list(self._labels)
+
+    def label_code(self, label: Text) -> int:
+        """Get (or allocate) integer code of `label`"""
+        code = self._codes.get(label)
+        if code is None:
+            code = len(self._labels)
+            self._labels.append(label)
+            self._codes[label] = code
+        return code
+
+    def new_id(self) -> Text:
+        """Allocate a new region id (never used before by this store)"""
+        return self._new_id()
+
+    def _new_id(self, taken: Container[Text] = ()) -> Text:
+        while True:
+            region_id = f"{self.prefix}{next(self._counter)}"
+            if region_id not in self._rows and region_id not in taken:
+                return region_id
+
+    def _reserve(self, size: int):
+        capacity = len(self._start)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name in ("_start", "_end", "_code"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,), dtype=old.dtype)
+            new[: self._size] = old[: self._size]
+            setattr(self, name, new)
+
+    def add(
+        self,
+        start: float,
+        end: float,
+        label: Text,
+        region_id: Optional[Text] = None,
+    ) -> Text:
+        """Add (or replace) a region
+
+        Parameters
+        ----------
+        start, end : float
+            Region start and end times, in seconds.
+        label : str
+            Region label.
+        region_id : str, optional
+            Region id. Defaults to a newly allocated one.
+
+        Returns
+        -------
+        region_id : str
+        """
+        if region_id in self._rows:
+            self.update(region_id, start=start, end=end, label=label)
+            return region_id
+
+        if region_id is None:
+            region_id = self.new_id()
+
+        self._reserve(self._size + 1)
+        row = self._size
+        self._start[row] = start
+        self._end[row] = end
+        self._code[row] = self.label_code(label)
+        self._ids.append(region_id)
+        self._rows[region_id] = row
+        self._size += 1
+        self._changed()
+        return region_id
+
+    def extend(
+        self,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        labels: Sequence[Text],
+        region_ids: Optional[Sequence[Optional[Text]]] = None,
+    ) -> List[Text]:
+        """Add many regions at once
+
+        Parameters
+        ----------
+        starts, ends : (num_regions, ) array-like
+            Regions start and end times, in seconds.
+        labels : (num_regions, ) sequence of str
+            Regions labels.
+        region_ids : (num_regions, ) sequence of str or None, optional
+            Regions ids. Missing (None) ids are allocated automatically.
+            Ids must not already be in the store.
+
+        Returns
+        -------
+        region_ids : list of str
+        """
+        starts, ends, region_ids = self._prepare(starts, ends, labels, region_ids)
+        if any(region_id in self._rows for region_id in region_ids):
+            raise ValueError("Region ids must be unique.")
+        self._append(starts, ends, labels, region_ids)
+        return region_ids
+
+    def replace(
+        self,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        labels: Sequence[Text],
+        region_ids: Optional[Sequence[Optional[Text]]] = None,
+    ) -> List[Text]:
+        """Replace all regions at once
+
+        Same as `clear` followed by `extend`, except that the store is left
+        untouched when regions are invalid (e.g. duplicate ids).
+        """
+        starts, ends, region_ids = self._prepare(starts, ends, labels, region_ids)
+        self.clear()
+        self._append(starts, ends, labels, region_ids)
+        return region_ids
+
+    def _prepare(
+        self,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        labels: Sequence[Text],
+        region_ids: Optional[Sequence[Optional[Text]]],
+    ) -> Tuple[np.ndarray, np.ndarray, List[Text]]:
+        """Validate regions about to be added and allocate their missing ids"""
+
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        num_regions = len(starts)
+        region_ids = [None] * num_regions if region_ids is None else list(region_ids)
+        if not len(ends) == len(labels) == len(region_ids) == num_regions:
+            raise ValueError("Regions start and end times, labels and ids must have the same length.")
+
+        taken = set(region_id for region_id in region_ids if region_id is not None)
+        if len(taken) < num_regions - region_ids.count(None):
+            raise ValueError("Region ids must be unique.")
+        region_ids = [
+            self._new_id(taken=taken) if region_id is None else region_id
+            for region_id in region_ids
+        ]
+        return starts, ends, region_ids
+
+    def _append(self, starts: np.ndarray, ends: np.ndarray, labels: Sequence[Text], region_ids: List[Text]):
+        """Append (already validated) regions"""
+
+        num_regions = len(starts)
+        codes = [self.label_code(label) for label in labels]
+
+        first = self._size
+        self._reserve(first + num_regions)
+        self._start[first : first + num_regions] = starts
+        self._end[first : first + num_regions] = ends
+        self._code[first : first + num_regions] = codes
+        self._ids.extend(region_ids)
+        self._rows.update(zip(region_ids, range(first, first + num_regions)))
+        self._size += num_regions
+        self._changed()
+
+    def update(
+        self,
+        region_id: Text,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        label: Optional[Text] = None,
+    ):
+        """Update an existing region"""
+        row = self._rows[region_id]
+        if start is not None:
+            self._start[row] = start
+        if end is not None:
+            self._end[row] = end
+        if label is not None:
+            self._code[row] = self.label_code(label)
+        self._changed()
+
+    def upsert(self, regions: Iterable[Dict]):
+        """Add or update {"start": float, "end": float, "id": str, "label": str} regions"""
+        added = dict()
+        for region in regions:
+            if region["id"] in self._rows:
+                self.update(region["id"], start=region["start"], end=region["end"], label=region["label"])
+            else:
+                added[region["id"]] = region
+        if added:
+            added = list(added.values())
+            self.extend(
+                [region["start"] for region in added],
+                [region["end"] for region in added],
+                [region["label"] for region in added],
+                region_ids=[region["id"] for region in added],
+            )
+
+    def remove(self, region_id: Text):
+        """Remove a region (the last row is moved in its place)"""
+        row = self._rows.pop(region_id)
+        last = self._size - 1
+        if row != last:
+            self._start[row] = self._start[last]
+            self._end[row] = self._end[last]
+            self._code[row] = self._code[last]
+            moved_id = self._ids[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self._size -= 1
+        self._changed()
+
+    def clear(self):
+        """Remove all regions (ids are not reused)"""
+        self._size = 0
+        self._ids = []
+        self._rows = dict()
+        self._changed()
+
+    def diff(self, regions: Iterable[Dict]) -> Tuple[List[Dict], List[Dict], List[Text]]:
+        """Compare {"start": float, "end": float, "id": str, "label": str} regions to stored ones
+
+        Returns
+        -------
+        add : list of dict
+            Regions whose id is not in the store.
+        update : list of dict
+            Regions whose id is in the store but that differ from stored ones.
+        remove : list of str
+            Ids of stored regions missing from `regions`.
+        """
+        regions = {region["id"]: region for region in regions}
+        add, update = list(), list()
+        for region_id, region in regions.items():
+            if region_id not in self._rows:
+                add.append(region)
+            elif self[region_id] != region:
+                update.append(region)
+        remove = [region_id for region_id in self._ids if region_id not in regions]
+        return add, update, remove
+
+    def assign(self, regions: Iterable[Dict]):
+        """Replace all regions by {"start": float, "end": float, "id": str, "label": str} regions"""
+        regions = list(regions)
+        self.replace(
+            [region["start"] for region in regions],
+            [region["end"] for region in regions],
+            [region["label"] for region in regions],
+            region_ids=[region["id"] for region in regions],
+        )
+        self._list = regions
+
+    def to_list(self) -> List[Dict]:
+        """Regions as a list of {"start": float, "end": float, "id": str, "label": str}
+
+        The list is built lazily and cached until the next change:
+        callers must not modify it.
+        """
+        if self._list is None:
+            labels = self._labels
+            self._list = [
+                {"start": start, "end": end, "id": region_id, "label": labels[code]}
+                for start, end, region_id, code in zip(
+                    self._start[: self._size].tolist(),
+                    self._end[: self._size].tolist(),
+                    self._ids,
+                    self._code[: self._size].tolist(),
+                )
+            ]
+        return self._list
+
+
+class RegionPatch:
+    """Regions changes accumulated over several edits
+
+    Successive changes of the same region are merged, so that the patch
+    holds at most one change per region (e.g. a region added then
+    removed does not appear at all).
+
+    Usage
+    -----
+    patch = RegionPatch()
+    patch.extend(add=[region], update=[], remove=[])
+    add, update, remove = patch.to_lists()
+    """
+
+    def __init__(self):
+        self._add: Dict[Text, Dict] = dict()
+        self._update: Dict[Text, Dict] = dict()
+        # used as an ordered set
+        self._remove: Dict[Text, None] = dict()
+
+    def __bool__(self) -> bool:
+        return bool(self._add or self._update or self._remove)
+
+    def extend(self, add: Iterable[Dict] = (), update: Iterable[Dict] = (), remove: Iterable[Text] = ()):
+        """Merge changes (applied in the `remove`, then `add` and `update` order)"""
+
+        for region_id in remove:
+            if self._add.pop(region_id, None) is None:
+                self._update.pop(region_id, None)
+                self._remove[region_id] = None
+
+        for region in add:
+            region_id = region["id"]
+            if region_id in self._remove:
+                # removed, then added back
+                del self._remove[region_id]
+                self._update[region_id] = region
+            else:
+                self._add[region_id] = region
+
+        for region in update:
+            region_id = region["id"]
+            if region_id in self._add:
+                self._add[region_id] = region
+            else:
+                self._update[region_id] = region
+
+    def to_lists(self) -> Tuple[List[Dict], List[Dict], List[Text]]:
+        """Merged (add, update, remove) changes"""
+        return list(self._add.values()), list(self._update.values()), list(self._remove)
@@ -20,15 +20,258 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import csv
-import random
-import string
+import json
+import os
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Dict, Text, Union
-from collections import defaultdict
-from pyannote.core import Segment, Annotation
+from typing import Dict, Iterable, Iterator, List, Optional, Text, Tuple, Union, TYPE_CHECKING
 
-def load_rttm(rttm: Path, keep_type="SPEAKER") -> Dict[Text, Annotation]:
+if TYPE_CHECKING:
+    from pyannote.core import Annotation
+
+
+def _to_annotation(
+    uri: Text,
+    line_numbers: List[int],
+    times: List[Text],
+    durations: List[Text],
+    speakers: List[Text],
+) -> "Annotation":
+    """Build annotation from (not yet parsed) columns of RTTM lines"""
+    # pyannote.core imports IPython: do it lazily (as well as numpy,
+    # so that `import pyannotebook` stays fast)
+    from pyannote.core import Segment, Annotation
+    import numpy as np
+    from .intervals import PRECISION
+
+    starts = np.array(times, dtype=np.float64)
+    ends = starts + np.array(durations, dtype=np.float64)
+    # like Annotation.__setitem__, skip empty segments
+    keep = np.flatnonzero(ends - starts > PRECISION).tolist()
+    starts, ends = starts.tolist(), ends.tolist()
+
+    # track ids only need to be unique: use line numbers
+    records = (
+        (Segment(starts[i], ends[i]), f"{line_numbers[i]:06d}", speakers[i])
+        for i in keep
+    )
+    return Annotation.from_records(records, uri=uri)
+
+
+def iter_rttm(rttm: Path, keep_type="SPEAKER") -> Iterator[Tuple[Text, "Annotation"]]:
+    """Iterate over RTTM file, one file at a time
+
+    Only lines of the file being read are kept in memory.
+
+    Parameters
+    ----------
+    rttm : Path
+        Path to RTTM file
+    keep_type : {"SPEAKER"}, optional
+        Only load lines of that type. Defaults to "SPEAKER".
+
+    Yields
+    ------
+    file_id : str
+    annotation : Annotation
+
+    Note
+    ----
+    Lines are expected to be grouped by file (which is usually the case).
+    A file whose lines are not contiguous is yielded once per group of lines.
+    """
+
+    with open(rttm, "r") as rttm_file:
+        yield from _iter_annotations(enumerate(rttm_file), keep_type=keep_type)
+
+
+def _iter_annotations(
+    lines: Iterable[Tuple[int, Text]], keep_type="SPEAKER"
+) -> Iterator[Tuple[Text, "Annotation"]]:
+    """Group (line_number, line) RTTM lines by file and build annotations"""
+
+    uri = None
+    columns = ([], [], [], [])
+    for l, line in lines:
+        # type, file_id, channel, time, duration, orthography, subtype, speaker_name, ...
+        fields = line.split()
+        if not fields or fields[0] != keep_type:
+            continue
+        if fields[1] != uri:
+            if columns[0]:
+                yield uri, _to_annotation(uri, *columns)
+            uri = fields[1]
+            columns = ([], [], [], [])
+        line_numbers, times, durations, speakers = columns
+        line_numbers.append(l)
+        times.append(fields[3])
+        durations.append(fields[4])
+        speakers.append(fields[7])
+
+    if columns[0]:
+        yield uri, _to_annotation(uri, *columns)
+
+
+# sidecar index is stored next to the RTTM file, with this suffix appended
+INDEX_SUFFIX = ".index"
+
+# {(path, size, mtime_ns): index} of most recently loaded indexes, so that
+# they are not read (and parsed) again for every single file loaded
+_INDEX_CACHE: "OrderedDict[Tuple[Text, int, int], Dict[Text, List[List[int]]]]" = OrderedDict()
+_INDEX_CACHE_SIZE = 8
+
+
+def _build_index(rttm: Path) -> Dict[Text, List[List[int]]]:
+    """Map each file to the byte ranges of its lines
+
+    Returns
+    -------
+    index : dict
+        {file_id: [[offset, length, first_line_number], ...]} dictionary,
+        with one range per group of contiguous lines.
+    """
+    index = defaultdict(list)
+    uri = None
+    offset = 0
+    with open(rttm, "rb") as rttm_file:
+        for l, line in enumerate(rttm_file):
+            fields = line.split(None, 2)
+            if len(fields) > 1:
+                file_id = fields[1].decode("utf-8")
+                if file_id != uri:
+                    index[file_id].append([offset, 0, l])
+                    uri = file_id
+                ranges = index[file_id][-1]
+                ranges[1] = offset + len(line) - ranges[0]
+            offset += len(line)
+    return dict(index)
+
+
+def load_index(rttm: Path, write_index: bool = True) -> Dict[Text, List[List[int]]]:
+    """Load (or build) byte offset index of RTTM file
+
+    The index is saved in a sidecar file and reused as long as the size and
+    modification time of the RTTM file do not change. When the sidecar file
+    cannot be written, the index is only kept in memory. Most recently loaded
+    indexes are also kept in memory, and must not be modified.
+
+    Parameters
+    ----------
+    rttm : Path
+        Path to RTTM file
+    write_index : bool, optional
+        Set to False to never write the sidecar file (e.g. for read-only or
+        shared directories). An existing one is still used. Defaults to True.
+
+    Returns
+    -------
+    index : dict
+        {file_id: [[offset, length, first_line_number], ...]} dictionary.
+    """
+    rttm = Path(rttm)
+    stat = rttm.stat()
+    key = (str(rttm.resolve()), stat.st_size, stat.st_mtime_ns)
+
+    index = _INDEX_CACHE.get(key)
+    if index is not None:
+        _INDEX_CACHE.move_to_end(key)
+        return index
+
+    index = _read_index(rttm, stat, write_index=write_index)
+    _INDEX_CACHE[key] = index
+    while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+        _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def _read_index(rttm: Path, stat: os.stat_result, write_index: bool = True) -> Dict[Text, List[List[int]]]:
+    """Read index from sidecar file (or build it, and write it unless `write_index` is False)"""
+
+    index_path = rttm.with_name(rttm.name + INDEX_SUFFIX)
+
+    try:
+        with open(index_path, "r") as index_file:
+            cached = json.load(index_file)
+        if cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["index"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    index = _build_index(rttm)
+    if not write_index:
+        return index
+
+    # write to a temporary file first so that concurrent readers
+    # never see a partially written index
+    tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w") as index_file:
+            json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "index": index}, index_file)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass
+
+    return index
+
+
+class IndexedRTTM(Mapping):
+    """Lazy {file_id: Annotation} mapping over a (possibly huge) RTTM file
+
+    Only lines of the requested file are read and parsed, thanks to a byte
+    offset index (see `load_index`) built on first use.
+
+    Parameters
+    ----------
+    rttm : Path
+        Path to RTTM file
+    keep_type : {"SPEAKER"}, optional
+        Only load lines of that type. Defaults to "SPEAKER".
+    write_index : bool, optional
+        Set to False to never write the index sidecar file. Defaults to True.
+
+    Usage
+    -----
+    annotations = IndexedRTTM("corpus.rttm")
+    annotation = annotations["file_id"]
+    """
+
+    def __init__(self, rttm: Path, keep_type="SPEAKER", write_index: bool = True):
+        self.rttm = Path(rttm)
+        self.keep_type = keep_type
+        self._index = load_index(self.rttm, write_index=write_index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[Text]:
+        return iter(self._index)
+
+    def __contains__(self, uri) -> bool:
+        return uri in self._index
+
+    def __getitem__(self, uri: Text) -> "Annotation":
+        from pyannote.core import Annotation
+
+        ranges = self._index[uri]
+
+        annotation = Annotation(uri=uri)
+        with open(self.rttm, "rb") as rttm_file:
+            for offset, length, first_line in ranges:
+                rttm_file.seek(offset)
+                lines = rttm_file.read(length).decode("utf-8").split("\n")
+                # annotations are returned in line order: merge them
+                for _, group in _iter_annotations(
+                    enumerate(lines, start=first_line), keep_type=self.keep_type
+                ):
+                    if group.uri == uri:
+                        annotation.update(group)
+        return annotation
+
+
+def load_rttm(
+    rttm: Path, keep_type="SPEAKER", uri: Optional[Text] = None, write_index: bool = True
+) -> Union[Dict[Text, "Annotation"], "Annotation"]:
     """Load RTTM file
 
     Parameters
@@ -37,34 +280,33 @@ def load_rttm(rttm: Path, keep_type="SPEAKER") -> Dict[Text, Annotation]:
         Path to RTTM file
     keep_type : {"SPEAKER"}, optional
         Only load lines of that type. Defaults to "SPEAKER".
+    uri : str, optional
+        Only load this file, using a byte offset index of the RTTM file
+        (see `IndexedRTTM`).
+    write_index : bool, optional
+        Set to False to never write the index sidecar file. Defaults to True.
 
     Returns
     -------
     annotations : dictionary of Annotation
         {file_id: pyannote.core.Annotation instance} dictionary
+        (or a single pyannote.core.Annotation instance when `uri` is provided)
+
+    See also
+    --------
+    iter_rttm : iterate over files without loading the whole RTTM file
+    IndexedRTTM : lazy {file_id: Annotation} mapping
     """
+    if uri is not None:
+        return IndexedRTTM(rttm, keep_type=keep_type, write_index=write_index)[uri]
+
+    from pyannote.core import Annotation
+
     annotations = defaultdict(Annotation)
-    letters = string.ascii_lowercase
-    with open(rttm, "r") as rttm_file:
-        rttm_reader = csv.reader(rttm_file, delimiter=' ')
-        for l, line in enumerate(rttm_reader):
-            main_type = line[0]
-            if main_type != keep_type:
-                continue
-            file_id = line[1] 
-            # channel = line[2] 
-            time = float(line[3])
-            duration = float(line[4]) 
-            # orthography = line[5] 
-            #sub_type = line[6] 
-            speaker_name = line[7] 
-            # confidence = line[8] 
-            # slat = line[9]
-            
-            annotations[file_id].uri = file_id
-            speech_turn = Segment(start=time, end=time+duration)
-            track_id = "".join(random.choices(letters, k=20)) + f"_{l:06d}"
-            annotations[file_id][speech_turn, track_id] = speaker_name
+    for uri, annotation in iter_rttm(rttm, keep_type=keep_type):
+        if uri in annotations:
+            annotations[uri].update(annotation)
+        else:
+            annotations[uri] = annotation
 
     return annotations
-
@@ -0,0 +1,71 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+(De)serialization of binary traitlets.
+
+Binary values are sent to the frontend as comm buffers (no base64 or JSON
+encoding involved). See `src/serializers.ts` for the frontend counterpart.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+
+def bytes_to_json(value: Optional[bytes], widget) -> Optional[memoryview]:
+    """Serialize bytes as a binary comm buffer"""
+    if value is None:
+        return None
+    return memoryview(value)
+
+
+def json_to_bytes(value: Optional[memoryview], widget) -> Optional[bytes]:
+    """Deserialize binary comm buffer into bytes"""
+    if value is None:
+        return None
+    return bytes(value)
+
+
+bytes_serialization = dict(to_json=bytes_to_json, from_json=json_to_bytes)
+
+
+def array_to_json(value: Optional[np.ndarray], widget) -> Optional[Dict]:
+    """Serialize numpy array as a binary comm buffer (with dtype and shape)"""
+    if value is None:
+        return None
+    value = np.ascontiguousarray(value)
+    return {
+        "dtype": str(value.dtype),
+        "shape": value.shape,
+        "buffer": memoryview(value.ravel()),
+    }
+
+
+def json_to_array(value: Optional[Dict], widget) -> Optional[np.ndarray]:
+    """Deserialize binary comm buffer into numpy array"""
+    if value is None:
+        return None
+    return np.frombuffer(value["buffer"], dtype=value["dtype"]).reshape(value["shape"])
+
+
+array_serialization = dict(to_json=array_to_json, from_json=json_to_array)
@@ -0,0 +1,180 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Annotate many files in a row.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, TYPE_CHECKING
+
+from pyannote.core import Annotation
+
+from .cache import DEFAULT_PAYLOAD_CACHE, PayloadCache
+from .pyannotebook import Pyannotebook
+
+if TYPE_CHECKING:
+    from pyannote.audio.core.io import AudioFile
+
+
+class AnnotationQueue:
+    """Annotate a list of files, one after the other
+
+    While current file is being annotated, the next ones are prefetched by a
+    pool of worker threads: audio is loaded and encoded for the browser, and
+    the pre-annotation pipeline is applied. Switching to the next file then
+    boils down to sending the (already encoded) audio and regions.
+
+    Memory use is capped by the number of prefetched files (whose waveform,
+    encoded audio and pipeline output are kept in memory until displayed)
+    and by the size of the notebook payload cache. As the default payload
+    cache does not keep in-memory audio, notebooks using it are given a
+    dedicated (256MiB) one.
+
+    Parameters
+    ----------
+    files : list of AudioFile
+        Files to annotate.
+    notebook : Pyannotebook, optional
+        Notebook used for annotation. Its pipeline (if any) is used for
+        pre-annotation. Defaults to `Pyannotebook()`.
+    prefetch : int, optional
+        Number of next files prefetched in advance. Defaults to 2.
+    max_workers : int, optional
+        Number of worker threads. Defaults to 1.
+    on_save : callable, optional
+        Called with (file, annotation) every time a file is saved, that is
+        when leaving it (or calling `save` explicitly).
+
+    Attributes
+    ----------
+    annotations : list of Annotation
+        Last saved annotation of each file (None for files not saved yet).
+
+    Usage
+    -----
+    queue = AnnotationQueue(files, Pyannotebook(pipeline=pipeline))
+    display(queue.notebook)
+    queue.next()
+    """
+
+    def __init__(
+        self,
+        files: Sequence["AudioFile"],
+        notebook: Optional[Pyannotebook] = None,
+        prefetch: int = 2,
+        max_workers: int = 1,
+        on_save: Optional[Callable[["AudioFile", Annotation], None]] = None,
+    ):
+        self.files = list(files)
+        self.notebook = Pyannotebook() if notebook is None else notebook
+        # prefetched audio is loaded in memory
+        if self.notebook._wavesurfer.payload_cache is DEFAULT_PAYLOAD_CACHE:
+            self.notebook._wavesurfer.payload_cache = PayloadCache()
+        self.prefetch = prefetch
+        self.on_save = on_save
+        self.annotations: List[Optional[Annotation]] = [None] * len(self.files)
+        self.index: Optional[int] = None
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # {file index: future Prefetched} of prefetched files
+        self._futures: Dict[int, Future] = dict()
+
+        if self.files:
+            self.goto(0)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    @property
+    def file(self) -> Optional["AudioFile"]:
+        """Current file"""
+        return None if self.index is None else self.files[self.index]
+
+    def _schedule(self):
+        """Prefetch next files (and forget about files that are no longer next)"""
+
+        window = range(self.index + 1, min(self.index + 1 + self.prefetch, len(self.files)))
+
+        for index in list(self._futures):
+            if index not in window:
+                self._futures.pop(index).cancel()
+
+        for index in window:
+            if index not in self._futures:
+                # saved annotations take precedence over the pipeline
+                run_pipeline = self.annotations[index] is None
+                self._futures[index] = self._executor.submit(
+                    self.notebook.prefetch, self.files[index], run_pipeline=run_pipeline
+                )
+
+    def save(self):
+        """Save annotation of current file"""
+        if self.index is None:
+            return
+        # never modified afterwards (see AnnotationWidget.annotation)
+        annotation = self.notebook.annotation
+        self.annotations[self.index] = annotation
+        if self.on_save is not None:
+            self.on_save(self.files[self.index], annotation)
+
+    def goto(self, index: int):
+        """Save current file and switch to file at `index`"""
+
+        if not 0 <= index < len(self.files):
+            raise IndexError(f"File index {index} is out of range [0, {len(self.files)}).")
+
+        self.save()
+
+        file = self.files[index]
+
+        future = self._futures.pop(index, None)
+        # cancel() fails for prefetching jobs already running (or done)
+        if future is not None and not future.cancel():
+            try:
+                # audio is then neither read nor encoded again
+                file = future.result()
+            except Exception:
+                # e.g. missing file or pipeline failure: loading it again
+                # below reports the error without getting the queue stuck
+                pass
+
+        # saved annotation takes precedence over (prefetched) pipeline output
+        self.notebook.load(file, annotation=self.annotations[index])
+        self.index = index
+        self._schedule()
+
+    def next(self):
+        """Save current file and switch to the next one"""
+        self.goto(0 if self.index is None else self.index + 1)
+
+    def previous(self):
+        """Save current file and switch to the previous one"""
+        self.goto(0 if self.index is None else self.index - 1)
+
+    def close(self):
+        """Save current file and stop prefetching"""
+        self.save()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,161 @@
+# MIT License
+#
+# Copyright (c) 2022- CNRS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Chunked access to long recordings.
+
+In streaming mode, the browser never receives the whole recording: it only
+asks for (and keeps) the chunks around the current viewport and playback
+position. See `ChunkPlayer` in `src/streaming.ts` for the frontend side.
+"""
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .codec import encode, resampled_range, transport_sample_rate
+from .io import AudioReader, AudioSource
+from .peaks import PeakPyramid
+
+
+class AudioStream:
+    """Chunked, normalized access to an audio file or waveform
+
+    Parameters
+    ----------
+    audio : str, Path or (waveform, sample_rate) tuple
+        Audio file or in-memory (mono) waveform.
+    chunk_duration : float, optional
+        Chunk duration, in seconds. Defaults to 30s.
+    codec : str, optional
+        Transport codec. Defaults to "flac".
+    max_sample_rate : int, optional
+        Downsample chunks whose sample rate is higher than this.
+    cache_size : int, optional
+        Maximum number of encoded chunks kept in memory. Defaults to 4.
+    peaks_base : int, optional
+        Number of samples per pixel of the finest peak level. Defaults to 32.
+    pyramid : PeakPyramid, optional
+        Normalized peaks, when already known (e.g. cached). Requires `gain`.
+    gain : float, optional
+        Normalization gain applied to `pyramid`.
+
+    Usage
+    -----
+    stream = AudioStream("long.wav")
+    payload, mime_type = stream.chunk(0)
+    """
+
+    def __init__(
+        self,
+        audio: AudioSource,
+        chunk_duration: float = 30.0,
+        codec: str = "flac",
+        max_sample_rate: Optional[int] = None,
+        cache_size: int = 4,
+        peaks_base: int = 32,
+        pyramid: Optional[PeakPyramid] = None,
+        gain: Optional[float] = None,
+    ):
+        self.codec = codec
+        self.max_sample_rate = max_sample_rate
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+        self.reader = AudioReader(audio)
+        self.sample_rate = self.reader.sample_rate
+        self.num_frames = self.reader.num_frames
+
+        self.chunk_frames = int(round(chunk_duration * self.sample_rate))
+        self.num_chunks = int(np.ceil(self.num_frames / self.chunk_frames))
+
+        if pyramid is not None:
+            self.pyramid = pyramid
+            self.gain = gain
+            return
+
+        # single pass over the audio to get both peaks and normalization gain
+        # (blocks are a multiple of `peaks_base` for peaks to be exact)
+        self.pyramid = PeakPyramid.from_blocks(
+            self.reader.blocks(blocksize=peaks_base * 8192), self.sample_rate, base=peaks_base
+        )
+        self.gain = 1.0 / (self.pyramid.peak_amplitude + 1e-8)
+        self.pyramid.scale(self.gain)
+
+    @property
+    def duration(self) -> float:
+        return self.num_frames / self.sample_rate
+
+    @property
+    def chunk_duration(self) -> float:
+        """Actual chunk duration (i.e. rounded to an integer number of samples)"""
+        return self.chunk_frames / self.sample_rate
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Read normalized (mono) float32 samples in [start, stop) frame range"""
+        samples = self.reader.read(start, stop)
+        samples *= self.gain
+        return samples
+
+    def chunk(self, index: int) -> Tuple[bytes, str]:
+        """Encoded chunk
+
+        Parameters
+        ----------
+        index : int
+            Chunk index. Chunk `index` starts at `index * chunk_duration` seconds.
+
+        Returns
+        -------
+        payload : bytes
+            Encoded audio.
+        mime_type : str
+            Corresponding MIME type.
+        """
+        if not 0 <= index < self.num_chunks:
+            raise IndexError(f"Chunk index {index} is out of range [0, {self.num_chunks}).")
+
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+
+        # resample with context (rather than chunk by chunk), so that there
+        # is no discontinuity at chunk boundaries
+        start = index * self.chunk_frames
+        target_sample_rate = transport_sample_rate(
+            self.sample_rate, codec=self.codec, max_sample_rate=self.max_sample_rate
+        )
+        samples = resampled_range(self.reader, start, start + self.chunk_frames, target_sample_rate)
+        samples *= self.gain
+        encoded = encode(samples, target_sample_rate, codec=self.codec)
+
+        self._cache[index] = encoded
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return encoded
+
+    def prefetch(self, index: int):
+        """Encode chunk in advance (no-op if out of range)"""
+        if 0 <= index < self.num_chunks:
+            self.chunk(index)
@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+"""
+Benchmarks of the widgets hot paths.
+
+Benchmarks are skipped by default. Run them with
+`pytest pyannotebook/tests/benchmarks --run-benchmarks --benchmark-only`
+(requires `pytest-benchmark`). Besides wall time, each benchmark reports
+peak (traced) memory and number of bytes sent through the comm in its
+`extra_info`, e.g. with `--benchmark-columns=mean,max --benchmark-json=...`.
+
+Long recordings (1h, 4h) and 100k regions are only benchmarked when
+`PYANNOTEBOOK_BENCHMARK_LARGE=1`.
+"""
+
+import json
+import os
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+LARGE = pytest.mark.skipif(
+    not os.environ.get("PYANNOTEBOOK_BENCHMARK_LARGE"),
+    reason="set PYANNOTEBOOK_BENCHMARK_LARGE=1 to run benchmarks on large inputs",
+)
+
+
+def comm_bytes(log_send) -> int:
+    """Number of bytes sent through a mock comm (JSON messages and binary buffers)"""
+    num_bytes = 0
+    for _, kwargs in log_send:
+        num_bytes += len(json.dumps(kwargs.get("data"), default=str))
+        num_bytes += sum(memoryview(buffer).nbytes for buffer in kwargs.get("buffers") or [])
+    return num_bytes
+
+
+@pytest.fixture
+def measure(benchmark, mock_comm):
+    """Benchmark `target(*args)` where `args = setup()` is called before each round
+
+    Wall time is measured by `pytest-benchmark`. One more (untimed) round
+    measures peak memory and comm bytes, reported as `extra_info`.
+    Widgets whose traffic should be measured must use `mock_comm`.
+    """
+
+    def run(target, setup=lambda: (), rounds: int = 5):
+
+        args = setup()
+        mock_comm.log_send.clear()
+        tracemalloc.start()
+        try:
+            target(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory"] = peak
+        benchmark.extra_info["comm_bytes"] = comm_bytes(mock_comm.log_send)
+
+        return benchmark.pedantic(target, setup=lambda: (setup(), {}), rounds=rounds, iterations=1)
+
+    return run
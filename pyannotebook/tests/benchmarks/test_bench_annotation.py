@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+import pytest
+from pyannote.core import Annotation, Segment
+
+from ...annotation import AnnotationWidget
+from .conftest import LARGE
+
+
+def random_annotation(num_segments: int) -> Annotation:
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0.0, 3600.0, num_segments)
+    durations = rng.uniform(0.5, 5.0, num_segments)
+    speakers = rng.choice([f"SPEAKER_{i:02d}" for i in range(8)], num_segments)
+    return Annotation.from_records(
+        (Segment(start, start + d), f"{i:06d}", str(speaker))
+        for i, (start, d, speaker) in enumerate(zip(starts, durations, speakers))
+    )
+
+
+@pytest.mark.parametrize("num_segments", [100, 10_000, pytest.param(100_000, marks=LARGE)])
+def test_set_annotation(measure, mock_comm, num_segments):
+    annotation = random_annotation(num_segments)
+
+    def setup():
+        w = AnnotationWidget()
+        w.comm = mock_comm
+        return (w, )
+
+    measure(lambda w: setattr(w, "annotation", annotation), setup=setup)
+
+
+@pytest.mark.parametrize("num_segments", [100, 10_000, pytest.param(100_000, marks=LARGE)])
+def test_get_annotation(measure, mock_comm, num_segments):
+    """Annotation rebuilt from regions (i.e. cold cache)"""
+    annotation = random_annotation(num_segments)
+    w = AnnotationWidget()
+    w.comm = mock_comm
+    w.annotation = annotation
+    regions = list(w.regions)
+
+    def setup():
+        w.regions = list()
+        w.regions = regions
+        w._annotation = None
+        return ()
+
+    measure(lambda: w.annotation, setup=setup)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+import pytest
+
+from ...rttm import load_rttm
+from .conftest import LARGE
+
+
+@pytest.fixture(params=[10_000, pytest.param(1_000_000, marks=LARGE)])
+def rttm(request, tmp_path):
+    num_lines = request.param
+    rng = np.random.default_rng(0)
+    path = tmp_path / "large.rttm"
+    with open(path, "w") as f:
+        for i in range(num_lines):
+            # lines are grouped by file (as is usually the case)
+            uri = f"file{100 * i // num_lines:03d}"
+            start, duration = rng.uniform(0.0, 3600.0), rng.uniform(0.5, 5.0)
+            f.write(f"SPEAKER {uri} 1 {start:.3f} {duration:.3f} <NA> <NA> SPEAKER_{i % 8:02d} <NA> <NA>\n")
+    return path
+
+
+def test_load_rttm(measure, rttm):
+    measure(lambda: load_rttm(rttm), rounds=3)
+
+
+def test_load_rttm_uri(measure, rttm):
+    """Single file out of an indexed RTTM file"""
+    load_rttm(rttm, uri="file042")  # builds the index
+    measure(lambda: load_rttm(rttm, uri="file042"))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+import pytest
+
+from ...wavesurfer import WavesurferWidget
+from .conftest import LARGE
+
+SAMPLE_RATE = 16000
+
+
+def random_regions(num_regions: int, duration: float, prefix: str = "region"):
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0.0, duration, num_regions)
+    durations = rng.uniform(0.5, 5.0, num_regions)
+    labels = rng.choice(list("abcd"), num_regions)
+    return [
+        {"start": float(start), "end": float(start + d), "id": f"{prefix}{i}", "label": str(label)}
+        for i, (start, d, label) in enumerate(zip(starts, durations, labels))
+    ]
+
+
+def widget_with_regions(mock_comm, num_regions: int) -> WavesurferWidget:
+    w = WavesurferWidget(payload_cache=None)
+    w.comm = mock_comm
+    w.regions = random_regions(num_regions, 3600.0)
+    return w
+
+
+@pytest.mark.parametrize(
+    "duration", [60, pytest.param(3600, marks=LARGE), pytest.param(4 * 3600, marks=LARGE)]
+)
+def test_set_audio(measure, mock_comm, duration):
+    waveform = np.random.default_rng(0).standard_normal(duration * SAMPLE_RATE, dtype=np.float32)
+    w = WavesurferWidget(payload_cache=None)
+    w.comm = mock_comm
+    measure(lambda: setattr(w, "audio", (waveform, SAMPLE_RATE)), rounds=3)
+
+
+@pytest.mark.parametrize("num_regions", [100, 10_000, pytest.param(100_000, marks=LARGE)])
+def test_regions_assign(measure, mock_comm, num_regions):
+    regions = random_regions(num_regions, 3600.0)
+
+    def setup():
+        w = WavesurferWidget(payload_cache=None)
+        w.comm = mock_comm
+        return (w, )
+
+    measure(lambda w: setattr(w, "regions", regions), setup=setup)
+
+
+@pytest.mark.parametrize("num_regions", [100, 10_000, pytest.param(100_000, marks=LARGE)])
+def test_regions_edit_one(measure, mock_comm, num_regions):
+    w = widget_with_regions(mock_comm, num_regions)
+
+    def setup():
+        regions = list(w.regions)
+        regions[len(regions) // 2] = dict(regions[len(regions) // 2], start=regions[len(regions) // 2]["start"] + 0.1)
+        return (regions, )
+
+    measure(lambda regions: setattr(w, "regions", regions), setup=setup, rounds=20)
+
+
+KEYS = {
+    "space": dict(key=" "),
+    "tab": dict(key="Tab"),
+    "shift+tab": dict(key="Tab", shiftKey=True),
+    "escape": dict(key="Escape"),
+    "letter": dict(key="b"),
+    "left": dict(key="ArrowLeft"),
+    "left (selected)": dict(key="ArrowLeft", select=True),
+    "alt+right (selected)": dict(key="ArrowRight", altKey=True, select=True),
+    "up": dict(key="ArrowUp"),
+    "delete": dict(key="Delete", select=True),
+    "backspace": dict(key="Backspace", select=True),
+    "enter": dict(key="Enter"),
+    "shift+enter": dict(key="Enter", shiftKey=True, select=True),
+}
+
+
+@pytest.mark.parametrize("action", list(KEYS))
+def test_keyboard(measure, mock_comm, action):
+    w = widget_with_regions(mock_comm, 10_000)
+    event = {"key": "", "code": "", "shiftKey": False, "altKey": False}
+    event.update(KEYS[action])
+    select = event.pop("select", False)
+
+    def setup():
+        w.playing = False
+        if select:
+            region = w.regions[len(w.regions) // 2]
+            w.active_region = region["id"]
+            w.t = 0.5 * (region["start"] + region["end"])
+        return (event, )
+
+    measure(w.keyboard, setup=setup, rounds=20)
@@ -32,6 +32,24 @@ class MockComm(Comm):
     def close(self, *args, **kwargs):
         self.log_close.append((args, kwargs))
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        default=False,
+        help="run benchmarks (pyannotebook/tests/benchmarks) as well",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-benchmarks"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="use --run-benchmarks to run benchmarks")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip_benchmark)
+
+
 _widget_attrs = {}
 undefined = object()
 
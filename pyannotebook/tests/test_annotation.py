@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import pytest
+from pyannote.core import Annotation, Segment
+
+from ..annotation import AnnotationWidget, get_annotation
+
+
+def test_annotation_is_cached_and_patched():
+    reference = Annotation()
+    for i in range(10):
+        reference[Segment(i, i + 0.5), f"t{i}"] = "alice" if i % 2 else "bob"
+    w = AnnotationWidget(reference)
+
+    annotation = w.annotation
+    # tracks are renamed
+    assert list(annotation.itertracks(yield_label=True)) != list(reference.itertracks(yield_label=True))
+    assert annotation.rename_tracks() == reference.rename_tracks()
+    # cached annotation is handed out as is
+    assert w.annotation is annotation
+
+    # edit one region (e.g. coming from a linked WavesurferWidget)
+    regions = [dict(region) for region in w.regions]
+    regions[3]["end"] = 4.0
+    del regions[5]
+    w.regions = regions
+
+    # previously returned annotation is left untouched (copy-on-write)...
+    assert annotation.rename_tracks() == reference.rename_tracks()
+    assert w.annotation is not annotation
+    # ... while cached annotation was patched and matches a full rebuild
+    expected = get_annotation(regions, w.labels)
+    assert list(w.annotation.itertracks(yield_label=True)) == list(expected.itertracks(yield_label=True))
+
+
+def test_set_regions_from_arrays():
+    w = AnnotationWidget()
+    w.set_regions_from_arrays([0.0, 1.0, 2.0], [0.5, 1.5, 2.5], ["alice", "bob", "alice"], ids=["wavesurfer_x", None, None])
+    assert sorted(w.labels.values()) == ["alice", "bob"]
+    assert [region["id"] for region in w.regions][0] == "wavesurfer_x"
+    assert [(segment.start, label) for segment, _, label in w.annotation.itertracks(yield_label=True)] == [
+        (0.0, "alice"), (1.0, "bob"), (2.0, "alice")
+    ]
+
+    # invalid regions leave current ones untouched
+    regions = w.regions
+    with pytest.raises(ValueError):
+        w.set_regions_from_arrays([0.0, 1.0], [0.5, 1.5], ["alice", "bob"], ids=["wavesurfer_y", "wavesurfer_y"])
+    assert w.regions is regions
+    assert len(w.annotation) == 3
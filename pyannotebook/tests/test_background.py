@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import threading
+
+from ..background import PipelineRunner
+
+
+def test_pipeline_runner():
+    outputs = []
+    runner = PipelineRunner(on_done=outputs.append)
+
+    def pipeline(file, hook=None):
+        for completed in range(10):
+            hook("step", None, total=10, completed=completed)
+        return file.upper()
+
+    # widgets are only updated from the main thread
+    threads = set()
+    runner.progress.observe(lambda change: threads.add(threading.current_thread()), names=["value", "description"])
+
+    runner.run(pipeline, "done")
+    runner.join()
+    assert outputs == ["DONE"]
+    assert not runner.running
+    assert runner.progress.description == "step"
+    assert runner.progress.value == 0.9
+    assert threads == {threading.main_thread()}
+
+    # cancelled jobs stop at next hook call and are never delivered
+    started, resume = threading.Event(), threading.Event()
+
+    def slow_pipeline(file, hook=None):
+        started.set()
+        resume.wait()
+        hook("step", None)
+        return file
+
+    runner.run(slow_pipeline, "cancelled")
+    started.wait()
+    runner.run(pipeline, "new")
+    resume.set()
+    runner.join()
+    assert outputs[-1] == "NEW"
+    assert "cancelled" not in outputs
+
+    # errors are reported in the progress bar
+    def failing_pipeline(file, hook=None):
+        raise ValueError(file)
+
+    runner.run(failing_pipeline, "failed")
+    runner.join()
+    assert isinstance(runner.error, ValueError)
+    assert runner.progress.bar_style == "danger"
+    assert threads == {threading.main_thread()}
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+from pyannote.core import Annotation, Segment
+
+from ..cache import PayloadCache, PipelineCache
+from ..wavesurfer import WavesurferWidget
+
+
+class Pipeline:
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.calls = 0
+
+    def parameters(self, instantiated=False):
+        return {"threshold": self.threshold}
+
+    def __call__(self, file, hook=None):
+        self.calls += 1
+        annotation = Annotation(uri="file")
+        annotation[Segment(0.0, 1.5), "A"] = "SPEAKER_00"
+        annotation[Segment(1.0, 2.0), "B"] = "SPEAKER_01"
+        return annotation
+
+
+def test_pipeline_cache(tmp_path):
+    cache = PipelineCache(tmp_path)
+    file = {"waveform": np.random.randn(1, 16000).astype(np.float32), "sample_rate": 16000}
+
+    pipeline = Pipeline(0.5)
+    cached_pipeline = cache.wrap(pipeline)
+    annotation = cached_pipeline(file)
+    assert cached_pipeline(file) == annotation
+    assert pipeline.calls == 1
+
+    # different hyperparameters (or audio) are cached separately
+    assert cache.key(file, Pipeline(0.6)) != cache.key(file, pipeline)
+    other_file = {"waveform": file["waveform"] * 0.5, "sample_rate": 16000}
+    assert cache.key(other_file, pipeline) != cache.key(file, pipeline)
+
+    # ... and so are different pretrained models
+    other_pipeline = Pipeline(0.5)
+    other_pipeline.segmentation = "pyannote/segmentation-3.0"
+    assert cache.key(file, other_pipeline) != cache.key(file, pipeline)
+    assert cache.key(file, pipeline, pipeline_id="v1") != cache.key(file, pipeline, pipeline_id="v2")
+
+    # cached outputs are given the uri of the file at hand
+    assert cached_pipeline(dict(file, uri="other")).uri == "other"
+
+    cache.mode = "refresh"
+    cached_pipeline(file)
+    assert pipeline.calls == 2
+
+    # least recently used outputs are evicted
+    cache.mode = "use"
+    cache.max_size = 0
+    cache.evict()
+    cached_pipeline(file)
+    assert pipeline.calls == 3
+
+
+
+class Model:
+    def __init__(self):
+        self.calls = 0
+
+    def state_dict(self):
+        self.calls += 1
+        return {}
+
+
+def test_pipeline_models_are_hashed_once(tmp_path):
+    cache = PipelineCache(tmp_path)
+    file = {"waveform": np.random.randn(1, 16000).astype(np.float32), "sample_rate": 16000}
+    pipeline = Pipeline(0.5)
+    pipeline.segmentation = Model()
+    key = cache.key(file, pipeline)
+    assert cache.key(file, pipeline) == key
+    assert pipeline.segmentation.calls == 1
+
+    # ... until models are replaced
+    pipeline.segmentation = Model()
+    cache.key(file, pipeline)
+    assert pipeline.segmentation.calls == 1
+    # ... while hyperparameters are hashed every time
+    pipeline.threshold = 0.6
+    assert cache.key(file, pipeline) != key
+
+def test_payload_cache(tmp_path):
+    sample_rate = 16000
+    audio = (np.random.randn(sample_rate).astype(np.float32), sample_rate)
+
+    cache = PayloadCache(directory=tmp_path)
+    w = WavesurferWidget(payload_cache=cache)
+    num_entries = len(cache)
+    w.audio = audio
+    assert len(cache) == num_entries + 1
+
+    # same audio is served from memory...
+    entry = cache.get(cache.key(audio, codec=w.codec))
+    other = WavesurferWidget(payload_cache=cache)
+    other.audio = audio
+    assert other.payload is entry.payload
+
+    # ... or from disk
+    cold = PayloadCache(directory=tmp_path)
+    other = WavesurferWidget(payload_cache=cold)
+    other.audio = audio
+    assert other.payload == w.payload
+    np.testing.assert_array_equal(other.peaks, w.peaks)
+
+    # entries that do not fit in memory are only kept on disk
+    cache.clear()
+    cache.max_size = 0
+    w.audio = audio
+    assert len(cache) == 0
+    assert cache.get(cache.key(audio, codec=w.codec)).payload == w.payload
+
+    # in-memory audio is not cached by default
+    assert PayloadCache(waveforms=False).key(audio, codec=w.codec) is None
+    assert WavesurferWidget().payload_cache.key(audio) is None
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from ..codec import encode, encode_reader, resampled_range
+from ..io import AudioReader
+
+
+@pytest.mark.parametrize("codec", ["wav", "pcm16", "flac", "opus"])
+@pytest.mark.parametrize("max_sample_rate", [None, 8000])
+def test_encode_preserves_duration(codec, max_sample_rate):
+    sample_rate = 16000
+    waveform = np.random.uniform(-1.0, 1.0, 3 * sample_rate).astype(np.float32)
+    payload, mime_type = encode(waveform, sample_rate, codec=codec, max_sample_rate=max_sample_rate)
+    assert mime_type.startswith("audio/")
+    info = sf.info(io.BytesIO(payload))
+    assert info.duration == pytest.approx(3.0, abs=1.0 / info.samplerate)
+
+
+def test_compressed_payload_is_smaller():
+    sample_rate = 16000
+    waveform = np.sin(np.arange(10 * sample_rate) / 10.0).astype(np.float32)
+    wav, _ = encode(waveform, sample_rate, codec="wav")
+    flac, _ = encode(waveform, sample_rate, codec="flac")
+    assert len(flac) < len(wav) / 2
+
+
+def test_encode_reader_clips_samples():
+    sample_rate = 16000
+    waveform = np.random.uniform(-1.0, 1.0, sample_rate).astype(np.float32)
+    payload, _ = encode_reader(AudioReader((waveform, sample_rate)), gain=2.0, codec="wav")
+    samples, _ = sf.read(io.BytesIO(payload), dtype="float32")
+    assert np.max(np.abs(samples)) <= 1.0
+
+
+@pytest.mark.parametrize("sample_rate, target_sample_rate", [(44100, 16000), (22050, 48000)])
+def test_resampled_ranges_match_whole_waveform(sample_rate, target_sample_rate):
+    import scipy.signal
+    waveform = np.random.randn(3 * sample_rate + 17).astype(np.float32)
+    reader = AudioReader((waveform, sample_rate))
+    expected = scipy.signal.resample_poly(waveform, target_sample_rate, sample_rate)
+    # ranges that do not start on output samples
+    bounds = [0, 12345, 2 * sample_rate + 1, len(waveform)]
+    resampled = np.concatenate([
+        resampled_range(reader, start, stop, target_sample_rate) for start, stop in zip(bounds[:-1], bounds[1:])
+    ])
+    np.testing.assert_allclose(resampled, expected, atol=1e-5)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import json
+import subprocess
+import sys
+
+# generous budget: `import pyannotebook` takes a few milliseconds
+# when heavy dependencies are imported lazily
+IMPORT_TIME_BUDGET = 1.0
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import pyannotebook
+duration = time.perf_counter() - start
+print(json.dumps({"duration": duration, "modules": sorted(sys.modules)}))
+"""
+
+
+def test_import_is_fast_and_lazy():
+    # run in a fresh interpreter: this one already imported everything
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result["duration"] < IMPORT_TIME_BUDGET
+    for module in ["torch", "pyannote.audio", "ipywidgets", "scipy", "soundfile"]:
+        assert module not in result["modules"]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+
+from ..intervals import IntervalIndex
+
+
+def test_interval_index_queries():
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0, 100, size=500)
+    ends = starts + rng.uniform(0, 5, size=500)
+    index = IntervalIndex()
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        index.add(str(i), start, end)
+    for i in range(0, 500, 3):
+        index.remove(str(i))
+    kept = [i for i in range(500) if i % 3]
+
+    for time in rng.uniform(0, 100, size=50):
+        expected = {str(i) for i in kept if starts[i] - 0.01 <= time <= ends[i] + 0.01}
+        assert set(index.covering(time, tolerance=0.01)) == expected
+
+    by_start = [str(i) for i in sorted(kept, key=lambda i: (starts[i], ends[i]))]
+    by_end = [str(i) for i in sorted(kept, key=lambda i: (ends[i], starts[i]))]
+    assert index.following() == by_start[0]
+    assert index.following(by_start[10]) == by_start[11]
+    assert index.following(by_start[-1]) == by_start[0]
+    assert index.preceding() == by_end[-1]
+    assert index.preceding(by_end[10]) == by_end[9]
+    assert index.preceding(by_end[0]) == by_end[-1]
+
+    # bulk update gives the same index
+    bulk = IntervalIndex()
+    bulk.update({str(i): (starts[i], ends[i]) for i in range(500)})
+    bulk.update({}, removed=[str(i) for i in range(0, 500, 3)])
+    assert bulk._ids == index._ids
+    assert bulk._ids_by_end == index._ids_by_end
+
+
+def test_interval_index_incremental_cluster_boundaries():
+    rng = np.random.default_rng(1)
+    index = IntervalIndex()
+    extents = dict()
+    for step in range(300):
+        if extents and rng.uniform() < 0.3:
+            interval_id = rng.choice(sorted(extents))
+            index.remove(interval_id)
+            del extents[interval_id]
+        else:
+            start = rng.uniform(0, 100)
+            extents[str(step)] = (start, start + rng.uniform(0, 3))
+            index.add(str(step), *extents[str(step)])
+        # cached running maximum and boundaries match those of a fresh index
+        if step % 7 == 0:
+            expected = IntervalIndex()
+            expected.update(extents)
+            np.testing.assert_array_equal(index.cummax, expected.cummax)
+            np.testing.assert_array_equal(index._cluster_boundaries(), expected._cluster_boundaries())
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from ..io import AudioReader
+
+
+@pytest.mark.parametrize("extension", ["wav", "flac"])
+def test_blocks_match_whole_file(tmp_path, extension):
+    sample_rate = 16000
+    waveform = np.random.uniform(-0.5, 0.5, (5 * sample_rate + 7, 2))
+    path = tmp_path / f"audio.{extension}"
+    sf.write(path, waveform, sample_rate, subtype="PCM_16")
+    expected = np.mean(sf.read(path, dtype="float32")[0], axis=1)
+
+    reader = AudioReader(path)
+    assert reader.num_frames == len(expected)
+    blocks = list(reader.blocks(blocksize=4096))
+    assert all(block.dtype == np.float32 for block in blocks)
+    np.testing.assert_allclose(np.concatenate(blocks), expected, atol=1e-6)
+    np.testing.assert_allclose(reader.read(100, 200), expected[100:200], atol=1e-6)
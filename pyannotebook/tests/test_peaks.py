@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+
+from ..peaks import PeakPyramid
+
+
+def test_peak_pyramid_levels():
+    sample_rate = 16000
+    waveform = np.random.randn(10 * sample_rate + 123).astype(np.float32)
+    pyramid = PeakPyramid.from_waveform(waveform, sample_rate, base=32)
+    for level, peaks in enumerate(pyramid.levels):
+        samples_per_pixel = pyramid.samples_per_pixel(level)
+        for i in [0, len(peaks) // 2, len(peaks) - 1]:
+            chunk = waveform[i * samples_per_pixel : (i + 1) * samples_per_pixel]
+            assert peaks[i, 0] == chunk.max()
+            assert peaks[i, 1] == chunk.min()
+
+
+def test_peak_pyramid_zoom():
+    sample_rate = 16000
+    waveform = np.random.randn(60 * sample_rate).astype(np.float32)
+    pyramid = PeakPyramid.from_waveform(waveform, sample_rate, base=32)
+    # 20 pixels per second = 800 samples per pixel => 512 samples per pixel level
+    assert pyramid.samples_per_pixel(pyramid.level(20)) == 512
+    assert pyramid.level(1e6) == 0
+    assert len(pyramid.peaks(20)) == 2 * int(np.ceil(len(waveform) / 512))
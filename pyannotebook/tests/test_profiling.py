@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+from ..profiling import Histogram
+from ..wavesurfer import WavesurferWidget
+
+
+def test_histogram():
+    histogram = Histogram()
+    for duration in [1e-6, 1e-5, 1e-4, 1e-3]:
+        histogram.add(duration)
+    assert histogram.count == 4
+    assert histogram.max == 1e-3
+    assert 1e-5 <= histogram.quantile(0.5) < 1e-4
+    assert histogram.quantile(1.0) == 1e-3
+
+
+def test_profile(mock_comm):
+    w = WavesurferWidget()
+    w.comm = mock_comm
+    regions = [{"start": float(i), "end": i + 0.5, "id": f"r{i}", "label": "A"} for i in range(10)]
+
+    with w.profile() as stats:
+        assert w.profiling
+        w.regions = regions
+        w.keyboard({"key": "Tab", "code": "Tab", "shiftKey": True, "altKey": False})
+        w._on_custom_msg(w, {"event": "profile", "measures": {"WavesurferView.render_regions": [2.0, 4.0]}}, [])
+    assert not w.profiling
+    assert w.stats is None
+
+    assert stats.timings["WavesurferWidget.on_regions_change"].count == 1
+    assert stats.timings["WavesurferWidget.keyboard[shift+Tab]"].count == 1
+    assert stats.sent["WavesurferWidget.msg[regions]"].count == 1
+    assert stats.sent["WavesurferWidget.active_region"].bytes > 0
+    assert stats.browser["WavesurferView.render_regions"].max == 4e-3
+
+    # nothing is recorded once profiling is over
+    w.regions = []
+    assert stats.timings["WavesurferWidget.on_regions_change"].count == 1
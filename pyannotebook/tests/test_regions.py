@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+from ..regions import RegionPatch, RegionStore
+
+
+def test_region_store():
+    store = RegionStore()
+    region_ids = store.extend([0.0, 1.0, 2.0], [0.5, 1.5, 2.5], ["a", "b", "a"])
+    assert len(set(region_ids)) == 3
+    assert store[region_ids[1]] == {"start": 1.0, "end": 1.5, "id": region_ids[1], "label": "b"}
+
+    store.update(region_ids[0], end=0.8, label="c")
+    assert store[region_ids[0]]["end"] == 0.8
+    assert store[region_ids[0]]["label"] == "c"
+
+    # removal moves last region in place of the removed one
+    store.remove(region_ids[0])
+    assert region_ids[0] not in store
+    assert store.ids == [region_ids[2], region_ids[1]]
+    assert store.starts.tolist() == [2.0, 1.0]
+    assert store.to_list() == [store[region_ids[2]], store[region_ids[1]]]
+
+    # ids are never reused
+    store.clear()
+    assert store.new_id() not in region_ids
+
+    # ... and other stores (e.g. kept in sync) allocate the next ones right away
+    region_ids = store.extend([0.0, 1.0, 2.0], [0.5, 1.5, 2.5], ["a", "b", "a"])
+    other_store = RegionStore()
+    other_store.upsert(store.to_list())
+    last = int(region_ids[-1][len(store.prefix):])
+    assert other_store.new_id() == f"{store.prefix}{last + 1}"
+
+
+def test_region_patch():
+    a, b, c = ({"start": 0.0, "end": 1.0, "id": region_id, "label": "a"} for region_id in "abc")
+    patch = RegionPatch()
+    assert not patch
+    patch.extend(add=[a], update=[b], remove=["c"])
+    # added then updated: still added
+    patch.extend(update=[dict(a, end=2.0)])
+    # removed then added back: updated
+    patch.extend(add=[c])
+    # updated then removed: removed
+    patch.extend(remove=["b"])
+    add, update, remove = patch.to_lists()
+    assert add == [dict(a, end=2.0)]
+    assert update == [c]
+    assert remove == ["b"]
+    # added then removed: never existed
+    patch.extend(remove=["a"])
+    assert patch.to_lists() == ([], [c], ["b"])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+from pyannote.core import Segment
+
+from ..rttm import INDEX_SUFFIX, IndexedRTTM, iter_rttm, load_rttm
+
+RTTM = """SPEAKER file1 1 0.500 1.000 <NA> <NA> alice <NA> <NA>
+SPEAKER file1 1 1.000  2.000 <NA> <NA> bob <NA> <NA>
+SPKR-INFO file1 1 <NA> <NA> <NA> unknown alice <NA> <NA>
+SPEAKER file1 1 3.000 0.000 <NA> <NA> bob <NA> <NA>
+SPEAKER file2 1 0.000 1.000 <NA> <NA> carol <NA> <NA>
+"""
+
+
+def test_load_rttm(tmp_path):
+    rttm = tmp_path / "test.rttm"
+    rttm.write_text(RTTM)
+
+    assert [uri for uri, _ in iter_rttm(rttm)] == ["file1", "file2"]
+
+    annotations = load_rttm(rttm)
+    file1 = annotations["file1"]
+    assert file1.uri == "file1"
+    # empty segments are skipped
+    assert list(file1.itertracks(yield_label=True)) == [
+        (Segment(0.5, 1.5), "000000", "alice"),
+        (Segment(1.0, 3.0), "000001", "bob"),
+    ]
+    assert annotations["file2"].labels() == ["carol"]
+
+
+def test_indexed_rttm(tmp_path):
+    rttm = tmp_path / "test.rttm"
+    rttm.write_text(RTTM + "SPEAKER file1 1 5.000 1.000 <NA> <NA> alice <NA> <NA>\n")
+
+    annotations = IndexedRTTM(rttm)
+    assert (tmp_path / f"test.rttm{INDEX_SUFFIX}").exists()
+    assert sorted(annotations) == ["file1", "file2"]
+    # same as parsing the whole file (including non-contiguous lines)
+    expected = load_rttm(rttm)
+    for uri in ["file1", "file2"]:
+        assert annotations[uri] == expected[uri]
+        assert list(annotations[uri].itertracks()) == list(expected[uri].itertracks())
+    assert load_rttm(rttm, uri="file2") == expected["file2"]
+
+    # index is rebuilt when file changes
+    rttm.write_text(RTTM.replace("file2", "file3"))
+    assert "file3" in IndexedRTTM(rttm)
+
+    # index is only read once...
+    (tmp_path / f"test.rttm{INDEX_SUFFIX}").unlink()
+    assert "file3" in IndexedRTTM(rttm)
+    assert not (tmp_path / f"test.rttm{INDEX_SUFFIX}").exists()
+
+    # ... and sidecar file is optional
+    other = tmp_path / "other.rttm"
+    other.write_text(RTTM)
+    assert load_rttm(other, uri="file2", write_index=False) == expected["file2"]
+    assert not (tmp_path / f"other.rttm{INDEX_SUFFIX}").exists()
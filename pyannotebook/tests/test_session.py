@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import threading
+import time
+
+import numpy as np
+from pyannote.core import Annotation, Segment
+
+from ..pyannotebook import Pyannotebook
+from ..session import AnnotationQueue
+
+
+class Pipeline:
+    def __init__(self):
+        self.threads = []
+        self.running = 0
+        self.overlaps = 0
+
+    def __call__(self, file, hook=None):
+        self.threads.append(threading.current_thread())
+        self.running += 1
+        self.overlaps += self.running > 1
+        time.sleep(0.01)
+        waveform, sample_rate = file
+        annotation = Annotation()
+        annotation[Segment(0.0, len(waveform) / sample_rate)] = "A"
+        self.running -= 1
+        return annotation
+
+
+def test_annotation_queue():
+    sample_rate = 16000
+    files = [(np.random.randn(n * sample_rate).astype(np.float32), sample_rate) for n in range(1, 5)]
+    pipeline = Pipeline()
+    notebook = Pyannotebook(pipeline=pipeline, background=True)
+    saved = []
+    queue = AnnotationQueue(files, notebook, prefetch=2, on_save=lambda file, annotation: saved.append(annotation))
+    notebook._runner.join()
+    assert queue.notebook.annotation.get_timeline().duration() == 1.0
+
+    # next files are prefetched (and encoded) in a worker thread
+    for future in list(queue._futures.values()):
+        future.result()
+    assert sorted(queue._futures) == [1, 2]
+    assert len(notebook._wavesurfer.payload_cache) == 3
+
+    # prefetched audio is neither read nor hashed again
+    payload_cache = notebook._wavesurfer.payload_cache
+    keys = []
+    payload_cache.key = lambda *args, **kwargs: keys.append(args)
+    queue.next()
+    del payload_cache.key
+    assert keys == []
+    assert queue.notebook.annotation.get_timeline().duration() == 2.0
+    assert pipeline.threads[1] is not threading.main_thread()
+    assert sorted(queue._futures) == [2, 3]
+
+    # previous annotation was saved, and is restored when going back
+    assert len(saved) == 1
+    assert queue.annotations[0] == saved[0]
+    queue.previous()
+    assert queue.notebook.annotation.rename_tracks() == saved[0].rename_tracks()
+    assert sorted(queue._futures) == [1, 2]
+
+    queue.close()
+    assert len(saved) == 3
+    # pipeline never ran concurrently (e.g. in prefetching and loading threads)
+    assert pipeline.overlaps == 0
+
+
+def test_annotation_queue_recovers_from_prefetch_failure():
+    class FlakyPipeline(Pipeline):
+        """Fails the first time it is applied to the second file"""
+        failed = False
+
+        def __call__(self, file, hook=None):
+            waveform, sample_rate = file
+            if len(waveform) == 2 * sample_rate and not self.failed:
+                self.failed = True
+                raise RuntimeError("pipeline failed")
+            return super().__call__(file, hook=hook)
+
+    sample_rate = 16000
+    files = [(np.random.randn(n * sample_rate).astype(np.float32), sample_rate) for n in range(1, 3)]
+    notebook = Pyannotebook(pipeline=FlakyPipeline(), background=True)
+    queue = AnnotationQueue(files, notebook, prefetch=1)
+    notebook._runner.join()
+    for future in list(queue._futures.values()):
+        assert isinstance(future.exception(), RuntimeError)
+
+    # failed prefetching falls back to loading (and running pipeline) again
+    queue.next()
+    notebook._runner.join()
+    assert queue.index == 1
+    assert queue.notebook.annotation.get_timeline().duration() == 2.0
+    queue.close()
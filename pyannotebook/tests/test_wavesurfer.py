@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) Hervé Bredin.
+# Distributed under the terms of the Modified BSD License.
+
+import inspect
+import re
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ..wavesurfer import KEYBOARD_SHORTCUTS, WavesurferWidget
+
+
+def test_payload_is_sent_as_binary_buffer(mock_comm):
+    w = WavesurferWidget()
+    w.comm = mock_comm
+    sample_rate = 16000
+    w.audio = (np.random.randn(sample_rate).astype(np.float32), sample_rate)
+    assert isinstance(w.payload, bytes)
+    assert w.payload[:4] == b"fLaC"
+    (_, kwargs), = [
+        call for call in mock_comm.log_send
+        if ["payload"] in call[1]["data"].get("buffer_paths", [])
+    ]
+    index = kwargs["data"]["buffer_paths"].index(["payload"])
+    assert bytes(kwargs["buffers"][index]) == w.payload
+
+
+def test_peaks_follow_zoom(mock_comm):
+    w = WavesurferWidget()
+    sample_rate = 16000
+    w.audio = (np.random.randn(60 * sample_rate).astype(np.float32), sample_rate)
+    num_peaks = len(w.peaks)
+    w.zoom = 4 * w.zoom
+    assert len(w.peaks) == 4 * num_peaks
+
+
+def test_streaming_serves_chunks_on_request(mock_comm):
+    w = WavesurferWidget(streaming=True, chunk_duration=10.0)
+    w.comm = mock_comm
+    sample_rate = 16000
+    w.audio = (np.random.randn(25 * sample_rate).astype(np.float32), sample_rate)
+    assert w.payload == b""
+    assert w.duration == 25.0
+    assert w._stream.num_chunks == 3
+
+    w._on_custom_msg(w, {"event": "request_chunk", "stream_id": w.stream_id, "index": 2}, [])
+    (_, kwargs), = [
+        call for call in mock_comm.log_send
+        if call[1]["data"].get("method") == "custom"
+    ]
+    content = kwargs["data"]["content"]
+    assert content["event"] == "chunk"
+    assert content["index"] == 2
+    assert kwargs["buffers"][0][:4] == b"fLaC"
+
+    # requests about previous audio (or out of range) are ignored
+    w._on_custom_msg(w, {"event": "request_chunk", "stream_id": w.stream_id - 1, "index": 0}, [])
+    w._on_custom_msg(w, {"event": "request_chunk", "stream_id": w.stream_id, "index": 3}, [])
+    assert len([call for call in mock_comm.log_send if call[1]["data"].get("method") == "custom"]) == 1
+
+
+def test_overlap_layout_is_incremental(mock_comm):
+    w = WavesurferWidget()
+    w.comm = mock_comm
+    w.regions = [
+        {"start": 0.0, "end": 2.0, "id": "a", "label": "a"},
+        {"start": 1.0, "end": 3.0, "id": "b", "label": "b"},
+        {"start": 5.0, "end": 6.0, "id": "c", "label": "a"},
+    ]
+    assert w.overlap == {
+        "a": {"level": 1, "num_levels": 2},
+        "b": {"level": 2, "num_levels": 2},
+        "c": {"level": 1, "num_levels": 1},
+    }
+
+    # moving "b" away from "a" only changes the layout of "a" and "b"
+    mock_comm.log_send.clear()
+    w.regions = [
+        {"start": 0.0, "end": 2.0, "id": "a", "label": "a"},
+        {"start": 2.5, "end": 3.0, "id": "b", "label": "b"},
+        {"start": 5.0, "end": 6.0, "id": "c", "label": "a"},
+    ]
+    (_, kwargs), = [
+        call for call in mock_comm.log_send
+        if call[1]["data"].get("method") == "custom"
+        and call[1]["data"]["content"]["event"] == "overlap"
+    ]
+    assert kwargs["data"]["content"]["update"] == {
+        "a": {"level": 1, "num_levels": 1},
+        "b": {"level": 1, "num_levels": 1},
+    }
+
+
+def test_regions_are_sent_as_patches(mock_comm):
+    w = WavesurferWidget()
+    w.comm = mock_comm
+    w.regions = [
+        {"start": float(i), "end": i + 0.5, "id": f"r{i}", "label": "a"}
+        for i in range(100)
+    ]
+
+    def sent_regions():
+        return [
+            call[1]["data"]["content"] for call in mock_comm.log_send
+            if call[1]["data"].get("method") == "custom"
+            and call[1]["data"]["content"]["event"] == "regions"
+        ]
+
+    # editing one region only sends that region...
+    mock_comm.log_send.clear()
+    w.active_region = "r42"
+    w.active_label = "b"
+    patch, = sent_regions()
+    assert patch["update"] == [{"start": 42.0, "end": 42.5, "id": "r42", "label": "b"}]
+    assert patch["add"] == patch["remove"] == []
+    # ... and keeps `regions` up to date
+    assert len(w.regions) == 100
+    assert {"start": 42.0, "end": 42.5, "id": "r42", "label": "b"} in w.regions
+
+    # edits coming from the browser
+    mock_comm.log_send.clear()
+    version = patch["version"]
+    w._on_custom_msg(w, {"event": "regions", "view": "v", "seq": 1, "remove": ["r42"]}, [])
+    patch, = sent_regions()
+    assert patch["version"] == version + 1
+    assert patch["remove"] == ["r42"]
+    assert patch["acks"] == {"v": 1}
+    assert w.active_region == ""
+    assert len(w.regions) == 99
+
+    # edits that change nothing are acknowledged all the same
+    mock_comm.log_send.clear()
+    w._on_custom_msg(w, {"event": "regions", "view": "v", "seq": 2, "remove": ["r42"]}, [])
+    assert not sent_regions()
+    (_, kwargs), = mock_comm.log_send
+    assert kwargs["data"]["content"] == {"event": "ack", "acks": {"v": 2}}
+
+    # views can request a full snapshot
+    mock_comm.log_send.clear()
+    w._on_custom_msg(w, {"event": "request_regions"}, [])
+    snapshot, = sent_regions()
+    assert snapshot["reset"] and snapshot["version"] == version + 1
+    assert snapshot["acks"] == {"v": 2}
+    assert len(snapshot["add"]) == 99
+
+
+def test_batch_sends_a_single_update(mock_comm):
+    w = WavesurferWidget()
+    w.comm = mock_comm
+    w.regions = [
+        {"start": float(i), "end": i + 0.5, "id": f"r{i}", "label": "a"}
+        for i in range(100)
+    ]
+    regions = w.regions
+
+    mock_comm.log_send.clear()
+    with w.batch():
+        for i in range(10):
+            w.patch_regions(update=[dict(w._store[f"r{i}"], end=i + 2.0)])
+        w.patch_regions(remove=["r99"])
+        w.active_region = "r0"
+        w.active_label = "b"
+        # index is up to date...
+        assert w._intervals.extent("r5") == (5.0, 7.0)
+        # ... but `regions` is only updated on exit
+        assert w.regions is regions
+        assert not mock_comm.log_send
+
+    events = [
+        call[1]["data"]["content"]["event"] if call[1]["data"].get("method") == "custom" else "state"
+        for call in mock_comm.log_send
+    ]
+    assert events == ["regions", "overlap", "state"]
+    patch = mock_comm.log_send[0][1]["data"]["content"]
+    assert len(patch["update"]) == 10 and patch["remove"] == ["r99"]
+    assert patch["update"][0] == {"start": 0.0, "end": 2.0, "id": "r0", "label": "b"}
+    assert len(w.regions) == 99
+
+
+def test_local_keyboard(mock_comm):
+    w = WavesurferWidget(local_keyboard=True)
+    w.comm = mock_comm
+    # shortcuts are handled by the browser, not the kernel
+    assert w._keyboard.watched_events == []
+    assert w.get_state()["precision"] == (0.1, 0.5)
+    assert w.get_state()["shortcuts"] == KEYBOARD_SHORTCUTS
+    w.patch_regions(add=[{"start": 0.0, "end": 2.0, "id": "r0", "label": "A"}])
+
+    # [ shift + enter ] at t=1s, as sent by the browser
+    mock_comm.log_send.clear()
+    w._on_custom_msg(w, {
+        "event": "regions",
+        "view": "v",
+        "seq": 1,
+        "add": [{"start": 1.0, "end": 2.0, "id": "wavesurfer_x", "label": "A"}],
+        "update": [{"start": 0.0, "end": 1.0, "id": "r0", "label": "A"}],
+        "remove": [],
+    }, [])
+    w.set_state({"active_region": "wavesurfer_x", "time": 1.0})
+    assert w._intervals.following("r0") == "wavesurfer_x"
+    assert w.active_region == "wavesurfer_x"
+    # changes are echoed so that other views of the widget are updated
+    patch = mock_comm.log_send[0][1]["data"]["content"]
+    assert patch["event"] == "regions" and len(patch["add"] + patch["update"]) == 2
+
+    w.local_keyboard = False
+    assert w._keyboard.watched_events == ["keydown"]
+
+
+def test_keyboard_actions_match_browser():
+    # kernel and browser implement the same keyboard actions
+    widget_ts = Path(__file__).parents[2] / "src" / "widget.ts"
+    if not widget_ts.exists():
+        pytest.skip("frontend sources are not available")
+    on_key = re.search(r"\n  on_key\(.*?\n  }\n", widget_ts.read_text(), re.DOTALL).group(0)
+    browser_actions = set(re.findall(r"case '(\w+)':", on_key))
+
+    conditions = re.findall(r"action (?:==|in) (.+):", inspect.getsource(WavesurferWidget._on_key))
+    kernel_actions = set(re.findall(r'"(\w+)"', " ".join(conditions)))
+
+    assert browser_actions == kernel_actions == set(KEYBOARD_SHORTCUTS.values())
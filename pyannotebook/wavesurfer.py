@@ -25,37 +25,49 @@ from ipywidgets import DOMWidget
 from ._frontend import module_name, module_version
 import traitlets
 from ipyevents import Event
-from typing import Dict, Tuple, Union, Text, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple, Text, Optional
 
-from pathlib import Path
-
-try:
-    import soundfile as sf
-    SOUNDFILE_IS_AVAILABLE = True
-except OSError as e:
-    SOUNDFILE_IS_AVAILABLE = False
-    print("Could not import `soundfile`: using `scipy.io.wavfile` instead, with limited audio file format support.")
-
-import networkx as nx
 import numpy as np
-import base64
-import io
-import random
 import string
-import scipy.io.wavfile
-
-from .annotation import get_annotation
-
-from itertools import filterfalse, tee
-
-def partition(pred, iterable):
-    "Use a predicate to partition entries into false entries and true entries"
-    # partition(is_odd, range(10)) --> 0 2 4 6 8   and  1 3 5 7 9
-    t1, t2 = tee(iterable)
-    return filterfalse(pred, t1), filter(pred, t2)
 
-
-class WavesurferWidget(DOMWidget):
+from .cache import DEFAULT_PAYLOAD_CACHE, EncodedAudio, PayloadCache
+from .codec import encode_reader
+from .intervals import IntervalIndex
+from .io import AudioReader, AudioSource
+from .peaks import PeakPyramid
+from .profiling import Profiled, profiled
+from .regions import RegionPatch, RegionStore
+from .serializers import array_serialization, bytes_serialization
+from .streaming import AudioStream
+
+
+# {key: action} keyboard shortcuts. Actions are implemented both by
+# `WavesurferWidget._on_key` and by the browser (see `local_keyboard`).
+KEYBOARD_SHORTCUTS = {
+    " ": "toggle_playing",
+    "Tab": "select_next_region",
+    "Escape": "unselect_region",
+    "ArrowLeft": "move_left",
+    "ArrowRight": "move_right",
+    "ArrowUp": "zoom_in",
+    "ArrowDown": "zoom_out",
+    "Backspace": "remove_region_select_previous",
+    "Delete": "remove_region_select_next",
+    "Enter": "add_region",
+    **{letter: "select_label" for letter in string.ascii_lowercase},
+}
+
+
+def _shortcut(event: Dict) -> Text:
+    """Keyboard shortcut name (e.g. "keyboard[shift+Tab]")"""
+    modifiers = "".join(
+        f"{modifier}+" for modifier, pressed in [("shift", "shiftKey"), ("alt", "altKey")] if event.get(pressed)
+    )
+    return f"keyboard[{modifiers}{event['key']}]"
+
+
+class WavesurferWidget(Profiled, DOMWidget):
     """wavesurfer.js widget
     
     Parameters
@@ -64,7 +76,32 @@ class WavesurferWidget(DOMWidget):
         Display a minimap on top of waveform. Defaults to True.
     auto_select : bool, optional
         Automatically select region corresponding to current time.
-        Defaults to False.
+        During playback, this is done in the browser. Defaults to False.
+    time_sync_rate : float, optional
+        Maximum number of `time` updates sent by the browser per second during
+        playback. Seeking, pausing and auto-selecting a region always send the
+        current time. Set to 0 to only send those. Defaults to 10.
+    codec : {"flac", "pcm16", "opus", "wav"}, optional
+        Codec used to send audio to the browser. Defaults to "flac" (lossless).
+        "opus" is lossy but much smaller. "wav" sends 32-bit float samples.
+    max_sample_rate : int, optional
+        Downsample audio whose sample rate is higher than this before sending
+        it to the browser. Defaults to keep original sample rate.
+    streaming : bool, optional
+        Only send audio chunks around the current viewport and playback
+        position, on request from the browser. Use this for multi-hour
+        recordings. Defaults to False.
+    chunk_duration : float, optional
+        Duration of chunks in streaming mode, in seconds. Defaults to 30s.
+    payload_cache : PayloadCache, optional
+        Cache of encoded audio and peaks, so that audio displayed again is not
+        read and encoded again. Defaults to a small in-memory cache of audio
+        files (not in-memory audio) shared by all widgets. Set to None to
+        disable caching.
+    local_keyboard : bool, optional
+        Handle keyboard shortcuts in the browser rather than in the kernel, so
+        that they stay responsive when the kernel is busy. Resulting regions
+        changes are sent to the kernel afterwards. Defaults to False.
 
     Usage
     -----
@@ -78,33 +115,93 @@ class WavesurferWidget(DOMWidget):
     _view_module = traitlets.Unicode(module_name).tag(sync=True)
     _view_module_version = traitlets.Unicode(module_version).tag(sync=True)
 
-    b64 = traitlets.Unicode().tag(sync=True)
+    payload = traitlets.Bytes(b"").tag(sync=True, **bytes_serialization)
+    mime_type = traitlets.Unicode("audio/x-wav").tag(sync=True)
+    duration = traitlets.Float(0.0).tag(sync=True)
+    # (max, min) interleaved waveform peaks at the resolution matching `zoom`
+    peaks = traitlets.Any(None, allow_none=True).tag(sync=True, **array_serialization)
     minimap = traitlets.Bool().tag(sync=True)
 
+    streaming = traitlets.Bool(False).tag(sync=True)
+    stream_id = traitlets.Int(0).tag(sync=True)
+    chunk_duration = traitlets.Float(30.0).tag(sync=True)
+
     labels = traitlets.Dict().tag(sync=True)
     colors = traitlets.Dict().tag(sync=True)
     active_label = traitlets.Unicode("A").tag(sync=True)
 
     playing = traitlets.Bool(False).tag(sync=True)
     time = traitlets.Float(0.0).tag(sync=True)
+    time_sync_rate = traitlets.Float(10.0).tag(sync=True)
+    auto_select = traitlets.Bool(False).tag(sync=True)
     zoom = traitlets.Int(20).tag(sync=True)
-
-    regions = traitlets.List().tag(sync=True)
+    # (normal, shift) time steps of [ left ] and [ right ] shortcuts
+    precision = traitlets.Tuple(
+        traitlets.Float(), traitlets.Float(), default_value=(0.1, 0.5)
+    ).tag(sync=True)
+    # keyboard shortcuts are handled by the browser (see `local_keyboard`)
+    local_keyboard = traitlets.Bool(False).tag(sync=True)
+    # {key: action} keyboard shortcuts (see `KEYBOARD_SHORTCUTS`)
+    shortcuts = traitlets.Dict(KEYBOARD_SHORTCUTS).tag(sync=True)
+
+    # list of {"start": float, "end": float, "id": str, "label": str} regions.
+    # not synced: only changes are sent to the browser (see `patch_regions`)
+    regions = traitlets.List()
     active_region = traitlets.Unicode("").tag(sync=True)
 
-    overlap = traitlets.Dict().tag(sync=True)
+    # {region_id: {"level": int, "num_levels": int}} regions layout.
+    # not synced: only changes are sent to the browser (see `update_overlap`)
+    overlap = traitlets.Dict()
+
+    # tells the browser to report its own timings (see `Profiled`)
+    profiling = traitlets.Bool(False).tag(sync=True)
 
     def __init__(
         self, 
-        audio: Optional[Union[Text, Path, Tuple[np.ndarray, int]]] = None, 
+        audio: Optional[AudioSource] = None, 
         precision: Tuple[float, float] = (0.1, 0.5),
         minimap: bool = True,
         auto_select: bool = False,
+        time_sync_rate: float = 10.0,
+        codec: str = "flac",
+        max_sample_rate: Optional[int] = None,
+        streaming: bool = False,
+        chunk_duration: float = 30.0,
+        payload_cache: Optional[PayloadCache] = DEFAULT_PAYLOAD_CACHE,
+        local_keyboard: bool = False,
     ):
         super().__init__()
         self.precision = tuple(precision)
         self.minimap = minimap
         self.auto_select = auto_select
+        self.time_sync_rate = time_sync_rate
+        self.codec = codec
+        self.max_sample_rate = max_sample_rate
+        self.streaming = streaming
+        self.chunk_duration = chunk_duration
+        self.payload_cache = payload_cache
+        self._peaks = None
+        self._stream = None
+        self._intervals = IntervalIndex()
+
+        # id-indexed regions, kept in sync with `regions`
+        self._store = RegionStore()
+        # incremented every time regions change
+        self._regions_version = 0
+        # {view_id: seq} sequence number of the last regions patch received
+        # from each view, sent back with regions changes (see `_on_regions_msg`)
+        self._acks: Dict[Text, int] = dict()
+        self._patching = False
+
+        # changes deferred until the outermost `batch` exits
+        self._batch_depth = 0
+        self._pending_patch = RegionPatch()
+        self._pending_extents: List[Tuple[float, float]] = list()
+        self._pending_removed: List[Text] = list()
+        self._regions_stale = False
+
+        # regions changes, overlap layout and audio chunks requests
+        self.on_msg(self._on_custom_msg)
     
         if audio is None:
             del self.audio
@@ -114,14 +211,7 @@ class WavesurferWidget(DOMWidget):
         # keyboard shortcuts handler
         self._keyboard = Event(source=self, watched_events=["keydown"])
         self._keyboard.on_dom_event(self.keyboard)
-
-    def to_base64(self, waveform: np.ndarray, sample_rate: int) -> Text:
-        with io.BytesIO() as content:
-            scipy.io.wavfile.write(content, sample_rate, waveform)
-            content.seek(0)
-            b64 = base64.b64encode(content.read()).decode()
-            b64 = f"data:audio/x-wav;base64,{b64}"
-        return b64
+        self.local_keyboard = local_keyboard
 
     def get_time(self):
         return self.time
@@ -133,23 +223,174 @@ class WavesurferWidget(DOMWidget):
 
     t = property(get_time, set_time, None)
 
-    def set_audio(self, audio: Union[Text, Path, Tuple[np.ndarray, int]]):
+    @profiled
+    def set_audio(self, audio: AudioSource, encoded: Optional[EncodedAudio] = None):
+        """Load audio
+
+        Parameters
+        ----------
+        audio : AudioSource
+            Audio.
+        encoded : EncodedAudio, optional
+            Encoded `audio`, as returned by `prefetch` (with the same settings).
+            Defaults to encode `audio` (or get it from `payload_cache`).
+        """
 
-        if isinstance(audio, (str, Path)):
-            if SOUNDFILE_IS_AVAILABLE:
-                waveform, sample_rate = sf.read(audio)
-            else:
-                sample_rate, waveform = scipy.io.wavfile.read(audio)
+        if self.streaming:
+            self._set_stream(audio, encoded=encoded)
+            return
+
+        self._stream = None
+
+        if encoded is None:
+            encoded = self._encoded(audio)
+        self._peaks = encoded.peaks
+
+        # send everything in a single comm message
+        with self.hold_sync():
+            self.regions = list()
+            self.duration = encoded.duration
+            self.peaks = self._peaks.peaks(self.zoom)
+            self.mime_type = encoded.mime_type
+            self.payload = encoded.payload
+
+    def _encode(self, audio: AudioSource) -> EncodedAudio:
+        """Compute peaks and encode normalized audio (peaks only in streaming mode)"""
 
+        # first pass: peaks, from which normalization gain is derived
+        reader = AudioReader(audio)
+        peaks = PeakPyramid.from_blocks(reader.blocks(), reader.sample_rate)
+        gain = 1.0 / (peaks.peak_amplitude + 1e-8)
+        peaks.scale(gain)
+
+        if self.streaming:
+            # audio is encoded chunk by chunk, on request
+            return EncodedAudio(b"", None, reader.duration, gain, peaks)
+
+        # second pass: normalize and encode, block by block
+        payload, mime_type = encode_reader(
+            reader, gain=gain, codec=self.codec, max_sample_rate=self.max_sample_rate
+        )
+        return EncodedAudio(payload, mime_type, reader.duration, gain, peaks)
+
+    def _encoded(self, audio: AudioSource) -> EncodedAudio:
+        """Encoded audio and peaks, from `payload_cache` when possible"""
+
+        if self.payload_cache is None:
+            return self._encode(audio)
+
+        # in streaming mode, peaks (and normalization gain) do not depend on the codec
+        if self.streaming:
+            key = self.payload_cache.key(audio)
         else:
-            waveform, sample_rate = audio
-            assert isinstance(waveform, np.ndarray)
-            assert waveform.ndim == 1
+            key = self.payload_cache.key(audio, codec=self.codec, max_sample_rate=self.max_sample_rate)
 
-        waveform = waveform.astype(np.float32)
-        waveform /= np.max(np.abs(waveform)) + 1e-8
+        if key is None:
+            return self._encode(audio)
 
-        self.b64 = self.to_base64(waveform, sample_rate)
+        encoded = self.payload_cache.get(key)
+        if encoded is None:
+            encoded = self._encode(audio)
+            self.payload_cache.put(key, encoded)
+        return encoded
+
+    def prefetch(self, audio: AudioSource) -> EncodedAudio:
+        """Encode audio and compute its peaks in advance (into `payload_cache`)
+
+        Safe to call from a worker thread. Passing the returned encoded audio
+        to `set_audio` afterwards makes it (almost) instant.
+        """
+        return self._encoded(audio)
+
+    def _set_stream(self, audio: AudioSource, encoded: Optional[EncodedAudio] = None):
+        """Only send peaks: audio chunks are sent on request (see `send_chunk`)"""
+
+        if encoded is None:
+            encoded = self._encoded(audio)
+        self._stream = AudioStream(
+            audio,
+            chunk_duration=self.chunk_duration,
+            codec=self.codec,
+            max_sample_rate=self.max_sample_rate,
+            pyramid=encoded.peaks,
+            gain=encoded.gain,
+        )
+        self._peaks = self._stream.pyramid
+
+        with self.hold_sync():
+            self.regions = list()
+            self.payload = b""
+            self.duration = self._stream.duration
+            self.chunk_duration = self._stream.chunk_duration
+            self.peaks = self._peaks.peaks(self.zoom)
+            # tells the browser to drop chunks of previous audio
+            self.stream_id += 1
+
+    @profiled
+    def send_chunk(self, index: int):
+        """Send audio chunk to the browser and prefetch the next one"""
+        payload, mime_type = self._stream.chunk(index)
+        self.send(
+            {
+                "event": "chunk",
+                "stream_id": self.stream_id,
+                "index": index,
+                "mime_type": mime_type,
+            },
+            buffers=[payload],
+        )
+        # encode next chunk while the browser decodes this one
+        self._stream.prefetch(index + 1)
+
+    @profiled(name=lambda widget, content, buffers: f"msg[{content.get('event')}]")
+    def _on_custom_msg(self, widget, content: Dict, buffers):
+        event = content.get("event")
+        if event == "regions":
+            self._on_regions_msg(content)
+        elif event == "request_regions":
+            # (re)rendered views need the whole list of regions
+            self.send({
+                "event": "regions",
+                "version": self._regions_version,
+                "reset": True,
+                "add": self._store.to_list(),
+                "update": [],
+                "remove": [],
+                "acks": self._acks,
+            })
+        elif event == "request_overlap":
+            # (re)rendered views need the whole layout
+            self.send({"event": "overlap", "update": self.overlap, "remove": [], "reset": True})
+        elif event == "request_chunk":
+            # ignore requests about previous audio (or out of range ones)
+            if self._stream is None or content["stream_id"] != self.stream_id:
+                return
+            index = content["index"]
+            if not 0 <= index < self._stream.num_chunks:
+                return
+            self.send_chunk(index)
+        elif event == "profile":
+            # browser-side timings
+            self._record_browser_measures(content["measures"])
+
+    def _on_regions_msg(self, content: Dict):
+        """Apply regions edited in the browser and acknowledge them
+
+        Every patch sent by a view carries a sequence number, which is sent
+        back with the next regions changes (or on its own when nothing was
+        sent, e.g. for no-op or deferred changes). Views rely on it to tell
+        which of their local edits the kernel has received.
+        """
+        if "view" in content:
+            self._acks[content["view"]] = content["seq"]
+        version = self._regions_version
+        self.patch_regions(
+            add=content.get("add", []),
+            update=content.get("update", []),
+            remove=content.get("remove", []),
+        )
+        if "view" in content and self._regions_version == version:
+            self.send({"event": "ack", "acks": self._acks})
 
     def del_audio(self):
         sample_rate = 16000
@@ -158,16 +399,24 @@ class WavesurferWidget(DOMWidget):
 
     audio = property(None, set_audio, del_audio)
 
-    @traitlets.observe("b64")
-    def on_b64_change(self, change: Dict):
-        self.regions = list()
+    @traitlets.observe("zoom")
+    @profiled
+    def on_zoom_change(self, change: Dict):
+        """Send peaks at the resolution matching new zoom level"""
+        if self._peaks is None:
+            return
+        old_level = self._peaks.level(change["old"])
+        new_level = self._peaks.level(change["new"])
+        if new_level != old_level:
+            self.peaks = self._peaks.peaks(change["new"])
 
     @traitlets.observe("time")
+    @profiled
     def on_time_change(self, change: Dict):
         """Automatically select region corresponding to current time"""
 
         # skip if auto_select is disabled or no region exists
-        if not (self.auto_select and self.regions):
+        if not (self.auto_select and len(self._intervals)):
             return
         
         # read current time
@@ -177,121 +426,295 @@ class WavesurferWidget(DOMWidget):
         # because of Javascript/Python/wavesurfer.seek conversion, we allow a bit of tolerance on both sides.
         # in particular, this avoids a corner case where Python side asks to seek to a region start time and
         # Javascript/Wavesurfer side does not manage to seek to this exact time and ends up outside of the region.
-        overlapping_regions = list(filter(lambda r: r["start"] - 0.01 <= current_time <= r["end"] + 0.01, self.regions))
+        overlapping_regions = self._intervals.covering(current_time, tolerance=0.01)
         if not overlapping_regions:
             return
 
         # among every overlapping regions, select the one whose start time is the closest
-        self.active_region = min(overlapping_regions, key=lambda r: abs(r["start"] - current_time))["id"]
-
-    @traitlets.observe("regions")
-    def on_regions_change(self, change: Dict):
+        self.active_region = min(
+            overlapping_regions,
+            key=lambda region_id: abs(self._intervals.extent(region_id)[0] - current_time),
+        )
+
+    @profiled
+    def patch_regions(
+        self,
+        add: Iterable[Dict] = (),
+        update: Iterable[Dict] = (),
+        remove: Iterable[Text] = (),
+    ):
+        """Add, update and remove regions
+
+        This is much cheaper than assigning a new list to `regions`,
+        as only changes are sent to the browser.
+
+        Parameters
+        ----------
+        add, update : iterable of dict, optional
+            {"start": float, "end": float, "id": str, "label": str} regions
+            to add or update.
+        remove : iterable of str, optional
+            Identifiers of regions to remove.
         """
-        1. reset active region if it no longer exists
-        2. update regions overlap layout
+        if not self._apply_patch(add=add, update=update, remove=remove):
+            return
+
+        if self._batch_depth:
+            self._regions_stale = True
+            return
+
+        self._sync_regions()
+
+    def _sync_regions(self):
+        """Keep `regions` in sync with (already up to date) store"""
+        self._regions_stale = False
+        self._patching = True
+        try:
+            self.regions = self._store.to_list()
+        finally:
+            self._patching = False
+
+    def _apply_patch(
+        self,
+        add: Iterable[Dict] = (),
+        update: Iterable[Dict] = (),
+        remove: Iterable[Text] = (),
+    ) -> bool:
+        """Apply and send regions changes (without updating `regions`)
+
+        Returns
+        -------
+        changed : bool
+            Whether anything changed.
         """
 
+        add = [dict(region) for region in add]
+        update = [dict(region) for region in update]
+        remove = [region_id for region_id in remove if region_id in self._store]
+        if not (add or update or remove):
+            return False
+
+        for region_id in remove:
+            self._store.remove(region_id)
+        self._store.upsert(add + update)
+
+        if self._batch_depth:
+            # interval index is kept up to date (e.g. for [ tab ] navigation)
+            # but changes and overlap layout are only sent when batch exits
+            self._pending_patch.extend(add=add, update=update, remove=remove)
+            self._pending_extents.extend(self._update_intervals(add + update, remove))
+            self._pending_removed.extend(remove)
+        else:
+            self._send_patch(add, update, remove)
+
         # reset active region if it no longer exists
-        if self.active_region not in list(region["id"]for region in change["new"]):
+        if self.active_region not in self._store:
             self.active_region = ""
 
-        # convert regions to pyannote.core.Annotation
-        annotation = get_annotation(self.regions, self.labels)
-
-        # compute overlap graph (one node per region, edges between overlapping regions)
-        overlap_graph = nx.Graph()
-        for (s1, t1), (s2, t2) in annotation.co_iter(annotation):
-            overlap_graph.add_edge((s1, t1), (s2, t2))
-
-        # solve the graph coloring problem for each connected subgraph
-        # and use the solution for regions layout
-        overlap = dict()
-        for sub_graph in nx.connected_components(overlap_graph):
-            sub_coloring = nx.coloring.greedy_color(
-                overlap_graph.subgraph(sorted(sub_graph))
-            )
-
-            num_colors = max(sub_coloring.values()) + 1
-            for (_, region_id), color in sub_coloring.items():
-                if num_colors > 4:
-                    overlap[region_id] = {"level": (color % 4) + 1, "num_levels": 4}
+        if not self._batch_depth:
+            self.update_overlap(add + update, remove)
+        return True
+
+    def _send_patch(self, add: List[Dict], update: List[Dict], remove: List[Text]):
+        self._regions_version += 1
+        self.send({
+            "event": "regions",
+            "version": self._regions_version,
+            "add": add,
+            "update": update,
+            "remove": remove,
+            "acks": self._acks,
+        })
+
+    @contextmanager
+    def batch(self):
+        """Coalesce regions edits until the block exits
+
+        Regions edits (`patch_regions`, assignments to `regions`, keyboard
+        shortcuts) are applied to the kernel-side index right away, but the
+        overlap layout is only computed, `regions` only assigned and changes
+        only sent to the browser (in a single message) when the outermost
+        block exits. Synced traits changes are sent together, too.
+
+        Usage
+        -----
+        with widget.batch():
+            for region in regions:
+                widget.patch_regions(update=[dict(region, label="B")])
+        """
+        self._batch_depth += 1
+        with self.hold_sync():
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._flush_batch()
+
+    def _flush_batch(self):
+        """Send changes deferred by `batch`"""
+
+        patch, self._pending_patch = self._pending_patch, RegionPatch()
+        extents, self._pending_extents = self._pending_extents, list()
+        removed, self._pending_removed = self._pending_removed, list()
+
+        if patch:
+            self._send_patch(*patch.to_lists())
+            self._update_layout(extents, removed)
+
+        if self._regions_stale:
+            self._sync_regions()
+
+    @traitlets.observe("regions")
+    @profiled
+    def on_regions_change(self, change: Dict):
+        """Send changes when a new list of regions is assigned to `regions`"""
+
+        if self._patching:
+            return
+
+        add, update, remove = self._store.diff(change["new"])
+        self._apply_patch(add=add, update=update, remove=remove)
+        # store now matches `regions`
+        self._regions_stale = False
+
+    def update_overlap(self, changed: Iterable[Dict], removed: Iterable[Text]):
+        """Update regions overlap layout
+
+        Only clusters of overlapping regions touched by added, removed or
+        moved regions are laid out again, and only layout changes are sent
+        to the browser.
+
+        Parameters
+        ----------
+        changed : iterable of dict
+            Added or updated regions.
+        removed : iterable of str
+            Identifiers of removed regions.
+        """
+
+        removed = list(removed)
+        self._update_layout(self._update_intervals(changed, removed), removed)
+
+    def _update_intervals(
+        self, changed: Iterable[Dict], removed: Iterable[Text]
+    ) -> List[Tuple[float, float]]:
+        """Update interval index and return edited time ranges"""
+
+        extents = list()
+        for region_id in removed:
+            if region_id in self._intervals:
+                extents.append(self._intervals.extent(region_id))
+        moved = dict()
+        for region in changed:
+            region_id = region["id"]
+            extent = (region["start"], region["end"])
+            if region_id in self._intervals:
+                if self._intervals.extent(region_id) == extent:
+                    continue
+                extents.append(self._intervals.extent(region_id))
+            moved[region_id] = extent
+            extents.append(extent)
+        self._intervals.update(moved, removed)
+        return extents
+
+    def _update_layout(self, extents: Iterable[Tuple[float, float]], removed: Iterable[Text]):
+        """Lay out clusters of regions overlapping edited time ranges and send layout changes"""
+
+        # regions removed (and not added back)
+        removed = [
+            region_id for region_id in removed
+            if region_id in self.overlap and region_id not in self._intervals
+        ]
+        for region_id in removed:
+            del self.overlap[region_id]
+
+        updated = dict()
+        for first, last in self._intervals.clusters(extents):
+            levels = self._intervals.layout(first, last)
+            num_levels = max(levels.values()) + 1
+            for region_id, level in levels.items():
+                if num_levels > 4:
+                    layout = {"level": (level % 4) + 1, "num_levels": 4}
                 else:
-                    overlap[region_id] = {"level": color + 1, "num_levels": num_colors}
-        self.overlap = overlap
+                    layout = {"level": level + 1, "num_levels": num_levels}
+                if self.overlap.get(region_id) != layout:
+                    self.overlap[region_id] = layout
+                    updated[region_id] = layout
+
+        if updated or removed:
+            self.send({"event": "overlap", "update": updated, "remove": removed})
 
     @traitlets.observe("active_label")
+    @profiled
     def update_label(self, change: Dict):
         active_label = change["new"]
-        if self.active_region and active_label:
-            regions = list()
-            for region in self.regions:
-                if region["id"] == self.active_region:
-                    regions.append({"start": region["start"], "end": region["end"], "id": region["id"], "label": self.active_label})
-                else:
-                    regions.append(region)
-            self.regions = regions
+        region = self._store.get(self.active_region)
+        if region and active_label and region["label"] != active_label:
+            self.patch_regions(update=[dict(region, label=active_label)])
 
     @traitlets.observe("active_region")
+    @profiled
     def update_active_label(self, change: Dict):
         """Set active_label to active_region label"""
-        active_region = change["new"]
-        for region in self.regions:
-            if region["id"] == active_region:
-                self.active_label = region["label"]
-                break
+        region = self._store.get(change["new"])
+        if region:
+            self.active_label = region["label"]
 
+    @traitlets.observe("local_keyboard")
+    def update_keyboard(self, change):
+        # key events are only sent to the kernel when the browser does not
+        # handle them itself (see `WavesurferView.on_key`)
+        self._keyboard.watched_events = [] if change.new else ["keydown"]
+
+    @profiled(name=_shortcut)
     def keyboard(self, event):
+        # shortcuts send a single (coalesced) update
+        with self.batch():
+            self._on_key(event)
+
+    def _on_key(self, event):
 
         # for debugging purposes...
         self._last_event = event
 
         key = event["key"]
-        code = event["code"]
         shift = event["shiftKey"]
         alt = event["altKey"]
+        action = self.shortcuts.get(key)
 
         # [ space ] toggles play/pause status
-        if key == " ":
+        if action == "toggle_playing":
             self.playing = not self.playing
 
         # [ tab ] selects next region and move cursor to its start time
         # [ shift + tab ] selects previous region and move cursor to its start time
-        elif key == "Tab":
-            direction = -1 if shift else 1
-            # sort regions by start time (resp. end time) when going forward (resp. backward)
-            if direction > 0:
-                regions = sorted(self.regions, key=lambda r: (r["start"], r["end"]))
-            else:
-                regions = sorted(self.regions, key=lambda r: (r["end"], r["start"]))
-
-            if not regions:
+        elif action == "select_next_region":
+            if not len(self._intervals):
                 return
-            
-            if self.active_region:
-                region_ids = [region["id"] for region in regions]
-                active_region = regions[
-                    (region_ids.index(self.active_region) + direction)
-                    % len(region_ids)
-                ]
+
+            # regions are sorted by start time (resp. end time) when going forward (resp. backward)
+            active_region = self.active_region if self.active_region in self._intervals else None
+            if shift:
+                active_region = self._intervals.preceding(active_region)
             else:
-                i = -1 if shift else 0
-                active_region = regions[i]
+                active_region = self._intervals.following(active_region)
 
-            self.active_region = active_region["id"]
+            self.active_region = active_region
 
             # move cursor to selected region start time
             playing = self.playing
             self.playing = False
-            self.time = active_region["start"]
+            self.time, _ = self._intervals.extent(active_region)
             self.playing = playing
 
         # [ esc ] unselects all regions
-        elif key == "Escape":
+        elif action == "unselect_region":
             self.active_region = ""
 
         # [ letter ] selects corresponding label
         # side effect is to update the label of the currently selected region
-        elif key in string.ascii_lowercase:
+        elif action == "select_label":
             self.active_label = key
 
         # When no region is selected:
@@ -303,66 +726,55 @@ class WavesurferWidget(DOMWidget):
         # [ left + alt  ] moves end time to the left
         # [ right + alt ] moves end time to the right
         # Speed is controlled by `precision` and [ shift ] key
-        elif key in {"ArrowLeft", "ArrowRight"}:
-            direction = -1 if key == "ArrowLeft" else 1
+        elif action in {"move_left", "move_right"}:
+            direction = -1 if action == "move_left" else 1
             delta = self.precision[shift] * direction
             if self.active_region:
                 self.playing = False
-                regions = list()
-                for region in self.regions:
-                    if region["id"] == self.active_region:
-                        if alt:
-                            start = region["start"]
-                            end = region["end"] + delta
-                            if self.t > end:
-                                self.t = end - 1.0
-                        else:
-                            start = region["start"] + delta
-                            end = region["end"]
-                            self.t = start
-                        regions.append({"start": start, "end": end, "id": region["id"], "label": region["label"]})
-                    else:
-                        regions.append(region)
-                self.regions = regions
+                region = self._store[self.active_region]
+                if alt:
+                    start = region["start"]
+                    end = region["end"] + delta
+                    if self.t > end:
+                        self.t = end - 1.0
+                else:
+                    start = region["start"] + delta
+                    end = region["end"]
+                    self.t = start
+                self.patch_regions(update=[dict(region, start=start, end=end)])
                 self.playing = True
             else:
                 self.t += delta
 
         # [ up ] zooms in
         # [ down ] zooms out
-        elif key in {"ArrowUp", "ArrowDown"}:
-            direction = -1 if key == "ArrowDown" else 1
+        elif action in {"zoom_in", "zoom_out"}:
+            direction = -1 if action == "zoom_out" else 1
             self.zoom = self.zoom + direction
 
         # [ backspace ] removes active region and activates the one on the left
         # [ delete ] removes active regions and activates the one on the right
-        elif key in {"Backspace", "Delete"}:
-            if not self.active_region:
+        elif action in {"remove_region_select_previous", "remove_region_select_next"}:
+            if self.active_region not in self._intervals:
                 return
-            direction = -1 if key == "Backspace" else 1
 
-            # sort regions by start time (resp. end time) when going forward (resp. backward)
-            if direction > 0:
-                regions = sorted(self.regions, key=lambda r: (r["start"], r["end"]))
+            # regions are sorted by start time (resp. end time) when going forward (resp. backward)
+            if action == "remove_region_select_previous":
+                active_region = self._intervals.preceding(self.active_region)
             else:
-                regions = sorted(self.regions, key=lambda r: (r["end"], r["start"]))
-
-            region_ids = [region["id"] for region in regions]
-            active_region = regions[
-                (region_ids.index(self.active_region) + direction) % len(region_ids)
-            ]["id"]
+                active_region = self._intervals.following(self.active_region)
 
-            regions = list(filter(lambda r: r["id"] != self.active_region, self.regions))
-            if regions:
+            removed_region = self.active_region
+            if len(self._intervals) > 1:
                 self.active_region = active_region
             else:
                 self.active_region = ""
-            self.regions = regions
+            self.patch_regions(remove=[removed_region])
 
         # [ enter ] creates a new region at current time
         # [ shift + enter ] split selected region at current time
 
-        elif key == "Enter":
+        elif action == "add_region":
 
             if shift:
 
@@ -370,9 +782,7 @@ class WavesurferWidget(DOMWidget):
                 if not self.active_region:
                     return
 
-                other_regions, selected_region = partition(lambda r: r["id"] == self.active_region, self.regions)
-                other_regions = list(other_regions)
-                selected_region = list(selected_region)[0]
+                selected_region = self._store[self.active_region]
 
                 # check that selected region contains current time
                 if self.t < selected_region["start"] or self.t > selected_region["end"]:
@@ -385,7 +795,7 @@ class WavesurferWidget(DOMWidget):
                     "id": selected_region["id"],
                     "label": selected_region["label"]
                 }
-                region_id = "".join(random.choices(string.ascii_lowercase, k=20))
+                region_id = self._store.new_id()
                 second_half = {
                     "start": self.t,
                     "end": selected_region["end"],
@@ -393,23 +803,20 @@ class WavesurferWidget(DOMWidget):
                     "label": selected_region["label"]
                 }
                 
-                # append to halves to list of regions
-                self.regions = other_regions + [first_half, second_half]
+                self.patch_regions(update=[first_half], add=[second_half])
 
                 # selects second half
                 self.active_region = region_id
 
             else:
 
-                regions = list(self.regions)
-                region_id = "".join(random.choices(string.ascii_lowercase, k=20))
-                regions.append({
+                region_id = self._store.new_id()
+                self.patch_regions(add=[{
                     "start": self.t,
                     "end": self.t + self.precision[1],
                     "id": region_id,
                     "label": self.active_label
-                })
-                self.regions = regions
+                }])
                 self.active_region = region_id
 
 # keyboard shortcut ideas
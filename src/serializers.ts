@@ -0,0 +1,97 @@
+// MIT License
+//
+// Copyright (c) 2022- CNRS
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+// (De)serialization of binary model attributes.
+//
+// Binary values are received from the kernel as comm buffers (DataView) and
+// exposed to views as Uint8Array, without any intermediate string.
+// See `pyannotebook/serializers.py` for the kernel counterpart.
+
+export function deserialize_bytes(value: DataView | null): Uint8Array | null {
+  if (value === null) {
+    return null;
+  }
+  return new Uint8Array(value.buffer, value.byteOffset, value.byteLength);
+}
+
+export function serialize_bytes(value: Uint8Array | null): DataView | null {
+  if (value === null) {
+    return null;
+  }
+  return new DataView(value.buffer, value.byteOffset, value.byteLength);
+}
+
+export const bytes_serializers = {
+  deserialize: deserialize_bytes,
+  serialize: serialize_bytes,
+};
+
+export type TypedArray =
+  | Int8Array
+  | Uint8Array
+  | Int16Array
+  | Uint16Array
+  | Int32Array
+  | Uint32Array
+  | Float32Array
+  | Float64Array;
+
+const typed_array_constructors: { [dtype: string]: any } = {
+  int8: Int8Array,
+  uint8: Uint8Array,
+  int16: Int16Array,
+  uint16: Uint16Array,
+  int32: Int32Array,
+  uint32: Uint32Array,
+  float32: Float32Array,
+  float64: Float64Array,
+};
+
+export interface ISerializedArray {
+  dtype: string;
+  shape: number[];
+  buffer: DataView;
+}
+
+export function deserialize_array(
+  value: ISerializedArray | null
+): TypedArray | null {
+  if (value === null) {
+    return null;
+  }
+  const constructor = typed_array_constructors[value.dtype];
+  if (constructor === undefined) {
+    throw new Error('Unsupported dtype: ' + value.dtype);
+  }
+  const buffer = value.buffer;
+  const length = buffer.byteLength / constructor.BYTES_PER_ELEMENT;
+  if (buffer.byteOffset % constructor.BYTES_PER_ELEMENT !== 0) {
+    // typed arrays require aligned offsets: copy unaligned buffers
+    const end = buffer.byteOffset + buffer.byteLength;
+    return new constructor(buffer.buffer.slice(buffer.byteOffset, end));
+  }
+  return new constructor(buffer.buffer, buffer.byteOffset, length);
+}
+
+export const array_serializers = {
+  deserialize: deserialize_array,
+};
@@ -0,0 +1,218 @@
+// MIT License
+//
+// Copyright (c) 2022- CNRS
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+// Playback of audio received chunk by chunk from the kernel (streaming mode).
+//
+// Chunk `index` covers [index * chunk_duration, (index + 1) * chunk_duration)
+// in absolute file time. Only a few chunks around the playback position are
+// kept in memory, and the next chunk is requested ahead of time.
+// See `pyannotebook/streaming.py` for the kernel side.
+
+export class ChunkPlayer {
+  private _context: AudioContext | null = null;
+  private _chunks: Map<number, AudioBuffer> = new Map();
+  private _requested: Set<number> = new Set();
+  private _sources: Map<number, AudioBufferSourceNode> = new Map();
+
+  // context time at which playback (re)started and corresponding file time
+  private _started_at = 0;
+  private _offset = 0;
+  // playback is on hold until current chunk is received
+  private _buffering = false;
+
+  playing = false;
+
+  constructor(
+    public duration: number,
+    public chunk_duration: number,
+    private request: (index: number) => void,
+    private on_finish: () => void,
+    private max_chunks: number = 6
+  ) {}
+
+  private get context(): AudioContext {
+    if (this._context === null) {
+      this._context = new AudioContext();
+    }
+    return this._context;
+  }
+
+  get num_chunks(): number {
+    return Math.ceil(this.duration / this.chunk_duration);
+  }
+
+  chunk_index(time: number): number {
+    return Math.floor(time / this.chunk_duration);
+  }
+
+  get_current_time(): number {
+    if (!this.playing || this._buffering) {
+      return this._offset;
+    }
+    const time = this._offset + this.context.currentTime - this._started_at;
+    return Math.min(time, this.duration);
+  }
+
+  // decode received chunk and schedule it if it is needed right now
+  async receive(index: number, payload: Uint8Array) {
+    // decodeAudioData detaches its input: give it its own copy
+    const buffer = payload.slice().buffer;
+    const audio_buffer = await this.context.decodeAudioData(buffer);
+    this._requested.delete(index);
+    this._chunks.set(index, audio_buffer);
+    this.evict();
+    if (this.playing) {
+      this.tick();
+    }
+  }
+
+  // request chunks needed to play from `time` on
+  prefetch(time: number) {
+    const index = this.chunk_index(time);
+    for (const i of [index, index + 1]) {
+      this.ensure(i);
+    }
+  }
+
+  private ensure(index: number) {
+    if (index < 0 || index >= this.num_chunks) {
+      return;
+    }
+    if (this._chunks.has(index) || this._requested.has(index)) {
+      return;
+    }
+    this._requested.add(index);
+    this.request(index);
+  }
+
+  // only keep chunks closest to current position
+  private evict() {
+    const current = this.chunk_index(this.get_current_time());
+    const indices = Array.from(this._chunks.keys()).sort(
+      (a, b) => Math.abs(a - current) - Math.abs(b - current)
+    );
+    for (const index of indices.slice(this.max_chunks)) {
+      this._chunks.delete(index);
+    }
+  }
+
+  private schedule(index: number) {
+    const audio_buffer = this._chunks.get(index);
+    if (audio_buffer === undefined || this._sources.has(index)) {
+      return;
+    }
+
+    const now = this.context.currentTime;
+    // context time at which this chunk should start playing
+    const when = this._started_at + index * this.chunk_duration - this._offset;
+    const offset = Math.max(0, now - when);
+    if (offset >= audio_buffer.duration) {
+      return;
+    }
+
+    const source = this.context.createBufferSource();
+    source.buffer = audio_buffer;
+    source.connect(this.context.destination);
+    source.onended = () => {
+      this._sources.delete(index);
+    };
+    source.start(Math.max(now, when), offset);
+    this._sources.set(index, source);
+  }
+
+  // called periodically during playback
+  tick() {
+    if (!this.playing) {
+      return;
+    }
+    const time = this.get_current_time();
+    if (time >= this.duration) {
+      this.pause();
+      this.on_finish();
+      return;
+    }
+    const index = this.chunk_index(time);
+    this.prefetch(time);
+
+    if (!this._sources.has(index) && !this._chunks.has(index)) {
+      // freeze the clock until current chunk is received
+      if (!this._buffering) {
+        this.stop_sources();
+        this._offset = time;
+        this._buffering = true;
+      }
+      return;
+    }
+
+    if (this._buffering) {
+      this._buffering = false;
+      this._started_at = this.context.currentTime;
+    }
+
+    this.schedule(index);
+    this.schedule(index + 1);
+  }
+
+  play(time: number) {
+    this.stop_sources();
+    this._offset = Math.max(0, Math.min(time, this.duration));
+    this._started_at = this.context.currentTime;
+    this._buffering = false;
+    this.playing = true;
+    this.context.resume();
+    this.tick();
+  }
+
+  pause() {
+    this._offset = this.get_current_time();
+    this._buffering = false;
+    this.playing = false;
+    this.stop_sources();
+  }
+
+  seek(time: number) {
+    if (this.playing) {
+      this.play(time);
+    } else {
+      this._offset = Math.max(0, Math.min(time, this.duration));
+      this.prefetch(this._offset);
+    }
+  }
+
+  private stop_sources() {
+    for (const source of this._sources.values()) {
+      source.onended = null;
+      source.stop();
+    }
+    this._sources.clear();
+  }
+
+  destroy() {
+    this.stop_sources();
+    this._chunks.clear();
+    this._requested.clear();
+    if (this._context !== null) {
+      this._context.close();
+      this._context = null;
+    }
+  }
+}
@@ -28,12 +28,57 @@ import {
 
 import { MODULE_NAME, MODULE_VERSION } from './version';
 
+import { array_serializers, bytes_serializers } from './serializers';
+import { ChunkPlayer } from './streaming';
+
 import '../css/widget.css';
 
 import WaveSurfer from 'wavesurfer.js';
 import RegionsPlugin from 'wavesurfer.js/src/plugin/regions';
 import MinimapPlugin from 'wavesurfer.js/src/plugin/minimap';
 
+interface IRegion {
+  start: number;
+  end: number;
+  id: string;
+  label: string;
+}
+
+// index of the first element of sorted `values` that is not less than `value`
+function bisect_left(values: Float64Array, value: number): number {
+  let lo = 0;
+  let hi = values.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (values[mid] < value) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo;
+}
+
+// same format as ids of regions created by wavesurfer.js regions plugin
+function new_region_id(): string {
+  return 'wavesurfer_' + Math.random().toString(32).substring(2);
+}
+
+// wavesurfer.js internals used by the view, which its type definitions do not
+// (all) cover
+interface IWavesurferInternals {
+  backend: {
+    setPeaks(peaks: number[], duration?: number): void;
+  };
+  drawer: {
+    progress(progress: number): void;
+    wrapper: HTMLElement;
+  };
+  fireEvent(event: string, ...args: unknown[]): void;
+  // whether audio has been decoded
+  isReady: boolean;
+}
+
 export class WavesurferModel extends DOMWidgetModel {
   defaults() {
     return {
@@ -49,7 +94,8 @@ export class WavesurferModel extends DOMWidgetModel {
 
   static serializers: ISerializers = {
     ...DOMWidgetModel.serializers,
-    // Add any extra serializers here
+    payload: bytes_serializers,
+    peaks: array_serializers,
   };
 
   static model_name = 'WavesurferModel';
@@ -64,20 +110,53 @@ export class WavesurferView extends DOMWidgetView {
   private wavesurfer_container: HTMLDivElement;
   private wavesurfer_minimap: HTMLDivElement;
   private _wavesurfer: WaveSurfer;
+  private _url: string | null = null;
+  private _player: ChunkPlayer | null = null;
+  private _animation_frame: number | null = null;
+  private _overlap: { [id: string]: { level: number; num_levels: number } } =
+    {};
+  // local copy of regions, kept in sync with the kernel through patches
+  private _regions: Map<string, IRegion> = new Map();
+  // version of the last applied patch (-1 while waiting for a snapshot)
+  private _regions_version = -1;
+  // regions sorted by start time and running maximum of their end time,
+  // rebuilt lazily when regions change (used for auto-selection and rendering)
+  private _timeline: IRegion[] | null = null;
+  private _timeline_cummax: Float64Array = new Float64Array(0);
+  // regions sorted by end time (for [ shift + tab ]), rebuilt lazily too
+  private _timeline_by_end: IRegion[] | null = null;
+  // identifies this view in regions patches acknowledged by the kernel
+  private _view_id: string = new_region_id();
+  // sequence number of the last regions patch sent to the kernel
+  private _regions_seq = 0;
+  // sequence number of the last patch that edited each region, until the
+  // kernel acknowledges it: kernel changes of those regions are skipped so
+  // that they do not undo newer local edits
+  private _unacknowledged: Map<string, number> = new Map();
+  private _last_time_sync = 0;
+  // ids of regions that currently have a DOM element (only those
+  // intersecting the visible window are rendered)
+  private _mounted: Set<string> = new Set();
+  private _render_frame: number | null = null;
+  // region being dragged or resized by the user (never unmounted)
+  private _dragging: string | null = null;
   private _adding_regions: boolean;
-  private _syncing_regions: boolean;
-
-  to_blob(b64: string) {
-    // https://stackoverflow.com/questions/27980612/converting-base64-to-blob-in-javascript
-    // https://ionic.io/blog/converting-a-base64-string-to-a-blob-in-javascript
-    const byteString = atob(b64.split(',')[1]);
-    const ab = new ArrayBuffer(byteString.length);
-    const ia = new Uint8Array(ab);
+  // browser-side durations (in milliseconds) recorded while profiling,
+  // reported to the kernel at most once per second
+  private _measures: { [name: string]: number[] } = {};
+  private _measures_timeout: number | null = null;
+  private _load_start: number | null = null;
+  // `tabindex` attribute of the widget before `local_keyboard` was turned on
+  // (undefined while it is off)
+  private _tab_index: string | null | undefined = undefined;
+
+  private get internals(): IWavesurferInternals {
+    return this._wavesurfer as unknown as IWavesurferInternals;
+  }
 
-    for (let i = 0; i < byteString.length; i++) {
-      ia[i] = byteString.charCodeAt(i);
-    }
-    return new Blob([ab], { type: 'audio/x-wav' });
+  to_blob(payload: Uint8Array) {
+    // payload is received as a binary buffer: no decoding needed
+    return new Blob([payload], { type: this.model.get('mime_type') });
   }
 
   render() {
@@ -142,155 +221,566 @@ export class WavesurferView extends DOMWidgetView {
     this._wavesurfer.on('finish', this.on_finish.bind(this));
     this._wavesurfer.on('region-click', this.on_region_click.bind(this));
     this._wavesurfer.on('zoom', this.on_zoom.bind(this));
+    this._wavesurfer.on('scroll', this.schedule_render.bind(this));
+    this._wavesurfer.on('redraw', this.schedule_render.bind(this));
+    this._wavesurfer.on('region-updated', this.on_region_updated.bind(this));
 
     this._wavesurfer.on('ready', this.on_ready.bind(this));
-
-    this.update_b64();
-    this.model.on('change:b64', this.update_b64, this);
-    this.model.on('change:colors', this.update_colors, this);
+    this._wavesurfer.on('waveform-ready', this.on_ready.bind(this));
+
+    this.update_payload();
+    this.model.on('change:payload', this.update_payload, this);
+    this.model.on('change:stream_id', this.update_payload, this);
+    this.model.on('change:peaks', this.update_peaks, this);
+    this.model.on('msg:custom', this.on_custom_msg, this);
+    this.model.on(
+      'change:colors',
+      () => this.profiled('update_colors', () => this.update_colors()),
+      this
+    );
 
     this.model.on('change:playing', this.update_playing, this);
     this.model.on('change:time', this.update_time, this);
     this.model.on('change:zoom', this.update_zoom, this);
 
-    this.model.on('change:regions', this.update_regions, this);
     this.model.on('change:active_region', this.update_active_region, this);
 
-    this.model.on('change:overlap', this.update_overlap, this);
+    // keyboard shortcuts handled without a round trip to the kernel
+    this.el.addEventListener('keydown', this.on_keydown.bind(this));
+    this.el.addEventListener('mouseenter', this.on_mouseenter.bind(this));
+    this.update_local_keyboard();
+    this.model.on('change:local_keyboard', this.update_local_keyboard, this);
+
+    // regions and overlap layout are only sent as changes: ask for current ones
+    this.send({ event: 'request_regions' });
+    this.send({ event: 'request_overlap' });
   }
 
-  push_regions() {
-    const regions = this._wavesurfer.regions.list;
-    const region_ids = Object.keys(regions);
-    const _regions = [];
-    for (const region_id of region_ids) {
-      const region = regions[region_id];
-      _regions.push({
-        start: region.start,
-        end: region.end,
-        id: region_id,
-        label: region.attributes.label,
-      });
+  // run fn, and record its duration when profiling is on. Durations are
+  // also visible as `pyannotebook.<name>` user timings in browser devtools
+  profiled<T>(name: string, fn: () => T): T {
+    if (!this.model.get('profiling')) {
+      return fn();
+    }
+    const start = performance.now();
+    performance.mark('pyannotebook.' + name + ':start');
+    try {
+      return fn();
+    } finally {
+      this.record_measure(name, start);
     }
+  }
 
-    this._syncing_regions = true;
-    this.model.set('regions', _regions);
-    this.touch();
-    this._syncing_regions = false;
+  record_measure(name: string, start: number) {
+    const mark = 'pyannotebook.' + name;
+    performance.mark(mark + ':end');
+    performance.measure(mark, mark + ':start', mark + ':end');
+    performance.clearMarks(mark + ':start');
+    performance.clearMarks(mark + ':end');
+
+    if (!(name in this._measures)) {
+      this._measures[name] = [];
+    }
+    this._measures[name].push(performance.now() - start);
+    if (this._measures_timeout === null) {
+      this._measures_timeout = window.setTimeout(
+        () => this.flush_measures(),
+        1000
+      );
+    }
   }
 
-  update_b64() {
-    const b64 = this.model.get('b64');
-    const blob = this.to_blob(b64);
-    this._wavesurfer.clearRegions();
-    this._wavesurfer.loadBlob(blob);
+  flush_measures() {
+    this._measures_timeout = null;
+    const measures: { [name: string]: number[] } = {};
+    for (const name of Object.keys(this._measures)) {
+      measures['WavesurferView.' + name] = this._measures[name];
+      performance.clearMeasures('pyannotebook.' + name);
+    }
+    this._measures = {};
+    this.send({ event: 'profile', measures: measures });
+  }
+
+  update_payload() {
+    if (this.model.get('profiling')) {
+      // measured until wavesurfer is ready (see `on_ready`)
+      this._load_start = performance.now();
+      performance.mark('pyannotebook.load:start');
+    }
+    this.profiled('update_payload', () => this.load_payload());
   }
 
-  update_regions() {
-    if (this._syncing_regions) {
+  load_payload() {
+    if (this.model.get('streaming')) {
+      this.update_stream();
       return;
     }
 
-    const regions = this.model.get('regions');
+    const payload = this.model.get('payload');
+    const peaks = this.model.get('peaks');
+    const blob = this.to_blob(payload);
 
+    if (this._url !== null) {
+      URL.revokeObjectURL(this._url);
+    }
+    this._url = URL.createObjectURL(blob);
+
+    if (peaks === null) {
+      this._wavesurfer.load(this._url);
+    } else {
+      // draw precomputed peaks right away: audio is only decoded
+      // upon first interaction (e.g. playback)
+      this._wavesurfer.load(
+        this._url,
+        peaks as unknown as number[],
+        undefined,
+        this.model.get('duration')
+      );
+      // like in streaming mode, plugins (minimap, drag selection) would
+      // otherwise wait for audio to be decoded
+      this.internals.fireEvent('ready');
+    }
+  }
+
+  // streaming mode: draw peaks and only fetch audio chunks when needed
+  update_stream() {
+    if (this._player !== null) {
+      this._player.destroy();
+    }
+
+    const duration = this.model.get('duration');
+    this._player = new ChunkPlayer(
+      duration,
+      this.model.get('chunk_duration'),
+      this.request_chunk.bind(this),
+      this.on_finish.bind(this)
+    );
+
+    this.update_peaks();
+    // plugins (minimap, drag selection) wait for 'ready', which
+    // wavesurfer only fires once the whole audio has been decoded
+    this.internals.fireEvent('ready');
+
+    this._player.prefetch(this.model.get('time'));
+  }
+
+  request_chunk(index: number) {
+    this.send({
+      event: 'request_chunk',
+      stream_id: this.model.get('stream_id'),
+      index: index,
+    });
+  }
+
+  on_custom_msg(content: any, buffers: DataView[]) {
+    this.profiled('msg[' + content.event + ']', () =>
+      this.handle_custom_msg(content, buffers)
+    );
+  }
+
+  handle_custom_msg(content: any, buffers: DataView[]) {
+    if (content.event === 'regions') {
+      this.on_regions_msg(content);
+    } else if (content.event === 'ack') {
+      this.acknowledge(content.acks);
+    } else if (content.event === 'overlap') {
+      this.on_overlap_msg(content);
+    } else if (content.event === 'chunk') {
+      if (
+        this._player === null ||
+        content.stream_id !== this.model.get('stream_id')
+      ) {
+        return;
+      }
+      const buffer = buffers[0];
+      this._player.receive(
+        content.index,
+        new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength)
+      );
+    }
+  }
+
+  // streaming mode: move cursor along with playback
+  on_animation_frame() {
+    if (this._player === null || !this._player.playing) {
+      this._animation_frame = null;
+      return;
+    }
+    this._player.tick();
+    this.internals.drawer.progress(
+      this.get_current_time() / this._player.duration
+    );
+    this.on_audioprocess();
+    this._animation_frame = requestAnimationFrame(
+      this.on_animation_frame.bind(this)
+    );
+  }
+
+  get_current_time(): number {
+    if (this.model.get('streaming') && this._player !== null) {
+      return this._player.get_current_time();
+    }
+    return this._wavesurfer.getCurrentTime();
+  }
+
+  update_peaks() {
+    const peaks = this.model.get('peaks');
+    if (peaks === null) {
+      return;
+    }
+    this.internals.backend.setPeaks(
+      peaks as unknown as number[],
+      this.model.get('duration')
+    );
+    this._wavesurfer.drawBuffer();
+  }
+
+  // apply regions changes sent by the kernel
+  on_regions_msg(content: any) {
+    let removed: string[] = content.remove;
+    let upserted: IRegion[] = content.add.concat(content.update);
+    if (content.reset) {
+      // reconcile snapshot with current regions by id (rather than
+      // re-creating all of them): only missing ones are removed
+      const snapshot_ids = new Set(
+        content.add.map((region: IRegion) => region.id)
+      );
+      removed = Array.from(this._regions.keys()).filter(
+        (region_id) => !snapshot_ids.has(region_id)
+      );
+    } else if (
+      this._regions_version < 0 ||
+      content.version <= this._regions_version
+    ) {
+      // either waiting for a snapshot or already up to date
+      return;
+    } else if (content.version !== this._regions_version + 1) {
+      // some changes were missed: ask for a snapshot
+      this._regions_version = -1;
+      this.send({ event: 'request_regions' });
+      return;
+    }
+    this._regions_version = content.version;
+
+    this.acknowledge(content.acks);
+    if (this._unacknowledged.size > 0) {
+      // regions edited locally in patches not received by the kernel yet
+      // will be overwritten by those patches anyway
+      removed = removed.filter(
+        (region_id) => !this._unacknowledged.has(region_id)
+      );
+      upserted = upserted.filter(
+        (region) => !this._unacknowledged.has(region.id)
+      );
+    }
+    this.apply_regions(upserted, removed);
+  }
+
+  // forget local edits of patches received by the kernel
+  acknowledge(acks: { [view_id: string]: number } | undefined) {
+    const ack = acks?.[this._view_id] ?? 0;
+    for (const [region_id, seq] of Array.from(this._unacknowledged)) {
+      if (seq <= ack) {
+        this._unacknowledged.delete(region_id);
+      }
+    }
+  }
+
+  apply_regions(upserted: IRegion[], removed: string[]) {
     this._adding_regions = true;
+    for (const region_id of removed) {
+      this.remove_region(region_id);
+    }
+    const region_ids: string[] = [];
+    for (const region of upserted) {
+      if (this.upsert_region(region)) {
+        region_ids.push(region.id);
+      }
+    }
+    this._adding_regions = false;
+
+    // updated regions are re-rendered in place, added ones are
+    // rendered on next frame if visible
+    this.update_colors(region_ids);
+    this.update_label_visibility(region_ids);
+    this.schedule_render();
+  }
+
+  // apply regions edited in the browser, then send them to the kernel
+  // (overlap layout is sent back by the kernel)
+  edit_regions(add: IRegion[], update: IRegion[], remove: string[]) {
+    this.apply_regions(add.concat(update), remove);
+    this.send_regions(add, update, remove);
+  }
+
+  send_regions(add: IRegion[], update: IRegion[], remove: string[]) {
+    const seq = ++this._regions_seq;
+    const region_ids = add
+      .concat(update)
+      .map((region) => region.id)
+      .concat(remove);
+    for (const region_id of region_ids) {
+      this._unacknowledged.set(region_id, seq);
+    }
+    this.send({
+      event: 'regions',
+      view: this._view_id,
+      seq,
+      add,
+      update,
+      remove,
+    });
+  }
 
-    this._wavesurfer.clearRegions();
-    for (const region of regions) {
-      this._wavesurfer.addRegion({
-        start: region.start,
-        end: region.end,
-        id: region.id,
-        attributes: { label: region.label },
-      });
+  // add or update region, returns whether anything changed
+  upsert_region(region: IRegion): boolean {
+    const previous = this._regions.get(region.id);
+    if (
+      previous !== undefined &&
+      previous.start === region.start &&
+      previous.end === region.end &&
+      previous.label === region.label
+    ) {
+      return false;
     }
 
+    const wavesurfer_region = this._wavesurfer.regions.list[region.id];
+    if (wavesurfer_region !== undefined) {
+      // update existing region in place rather than re-creating it
+      wavesurfer_region.attributes.label = region.label;
+      wavesurfer_region.update({ start: region.start, end: region.end });
+      const tag = wavesurfer_region.element.querySelector(
+        '.wavesurfer-region-tag'
+      ) as HTMLElement | null;
+      if (tag !== null) {
+        tag.textContent = region.label.toUpperCase();
+      }
+    }
+    this._regions.set(region.id, { ...region });
+    this._timeline = null;
+    this._timeline_by_end = null;
+    return true;
+  }
+
+  remove_region(region_id: string) {
+    this.unmount_region(region_id);
+    this._regions.delete(region_id);
+    this._timeline = null;
+    this._timeline_by_end = null;
+  }
+
+  mount_region(region: IRegion) {
+    this._wavesurfer.addRegion({
+      start: region.start,
+      end: region.end,
+      id: region.id,
+      attributes: { label: region.label },
+    });
+    this._mounted.add(region.id);
+  }
+
+  unmount_region(region_id: string) {
+    const wavesurfer_region = this._wavesurfer.regions.list[region_id];
+    if (wavesurfer_region !== undefined) {
+      wavesurfer_region.remove();
+    }
+    this._mounted.delete(region_id);
+  }
+
+  // time range currently visible in the scroll window, plus one window width
+  // on both sides so that short scrolls do not need any (re-)rendering
+  visible_window(): [number, number] {
+    const wrapper = this.internals.drawer.wrapper;
+    const duration =
+      this.model.get('duration') || this._wavesurfer.getDuration();
+    if (!duration || !wrapper.scrollWidth) {
+      return [0, Infinity];
+    }
+    const seconds_per_pixel = duration / wrapper.scrollWidth;
+    const margin = wrapper.clientWidth;
+    return [
+      (wrapper.scrollLeft - margin) * seconds_per_pixel,
+      (wrapper.scrollLeft + wrapper.clientWidth + margin) * seconds_per_pixel,
+    ];
+  }
+
+  schedule_render() {
+    if (this._render_frame === null) {
+      this._render_frame = requestAnimationFrame(() =>
+        this.profiled('render_regions', () => this.render_regions())
+      );
+    }
+  }
+
+  // only keep DOM elements of regions intersecting the visible window
+  render_regions() {
+    this._render_frame = null;
+
+    const [start, end] = this.visible_window();
+    const visible = this.regions_in(start, end);
+    const visible_ids = new Set(visible.map((region) => region.id));
+    const active_region = this.model.get('active_region');
+
+    this._adding_regions = true;
+    for (const region_id of Array.from(this._mounted)) {
+      if (
+        !visible_ids.has(region_id) &&
+        region_id !== active_region &&
+        region_id !== this._dragging
+      ) {
+        this.unmount_region(region_id);
+      }
+    }
+    const mounted: string[] = [];
+    for (const region of visible) {
+      if (!this._mounted.has(region.id)) {
+        this.mount_region(region);
+        mounted.push(region.id);
+      }
+    }
     this._adding_regions = false;
 
-    this.update_colors();
-    this.update_active_region();
-    this.update_overlap();
-    this.update_label_visibility();
+    if (mounted.length > 0) {
+      this.update_colors(mounted);
+      this.update_overlap(mounted);
+      this.update_label_visibility(mounted);
+      this.update_active_region();
+    }
   }
 
-  update_colors() {
-    const regions = this.model.get('regions');
+  update_colors(region_ids?: Iterable<string>) {
     const colors = this.model.get('colors');
     const wavesurfer_regions = this._wavesurfer.regions.list;
-    for (const region of regions) {
-      wavesurfer_regions[region['id']].element.style.backgroundColor =
-        colors[region['label']];
+    for (const region_id of region_ids ?? this._mounted) {
+      const region = this._regions.get(region_id);
+      if (region === undefined || !(region_id in wavesurfer_regions)) {
+        continue;
+      }
+      wavesurfer_regions[region_id].element.style.backgroundColor =
+        colors[region.label];
     }
   }
 
   update_active_region() {
-    const regions = this.model.get('regions');
     const active_region = this.model.get('active_region');
     const wavesurfer_regions = this._wavesurfer.regions.list;
 
-    for (const region of regions) {
-      if (region['id'] === active_region) {
-        wavesurfer_regions[region['id']].element.classList.add(
-          'wavesurfer-region-active'
-        );
-      } else {
-        wavesurfer_regions[region['id']].element.classList.remove(
-          'wavesurfer-region-active'
-        );
-      }
+    for (const element of Array.from(
+      this.el.querySelectorAll('.wavesurfer-region-active')
+    )) {
+      element.classList.remove('wavesurfer-region-active');
+    }
+    if (active_region in wavesurfer_regions) {
+      wavesurfer_regions[active_region].element.classList.add(
+        'wavesurfer-region-active'
+      );
     }
   }
 
-  update_overlap() {
-    const regions = this.model.get('regions');
-    const overlap = this.model.get('overlap');
+  update_overlap(region_ids?: string[]) {
     const wavesurfer_regions = this._wavesurfer.regions.list;
+    if (region_ids === undefined) {
+      region_ids = Object.keys(wavesurfer_regions);
+    }
 
-    for (const region of regions) {
-      const wavesurfer_region = wavesurfer_regions[region['id']].element;
+    for (const region_id of region_ids) {
+      if (!(region_id in wavesurfer_regions)) {
+        continue;
+      }
+      const wavesurfer_region = wavesurfer_regions[region_id].element;
 
       for (const class_name of wavesurfer_region.className.split(' ')) {
         if (class_name.startsWith('wavesurfer-region-overlapping')) {
           wavesurfer_region.classList.remove(class_name);
         }
       }
-      if (region.id in overlap) {
+      if (region_id in this._overlap) {
+        const layout = this._overlap[region_id];
         wavesurfer_region.classList.add(
           'wavesurfer-region-overlapping-' +
-            overlap[region.id].level +
+            layout.level +
             '-' +
-            overlap[region.id].num_levels
+            layout.num_levels
         );
       }
     }
   }
 
-  update_label_visibility() {
-    const regions = this.model.get('regions');
+  // apply overlap layout changes sent by the kernel
+  on_overlap_msg(content: any) {
+    if (content.reset) {
+      this._overlap = {};
+    }
+    for (const region_id of content.remove) {
+      delete this._overlap[region_id];
+    }
+    Object.assign(this._overlap, content.update);
+    if (content.reset) {
+      this.update_overlap();
+    } else {
+      this.update_overlap(Object.keys(content.update));
+    }
+  }
+
+  update_label_visibility(region_ids?: Iterable<string>) {
     const wavesurfer_regions = this._wavesurfer.regions.list;
 
-    for (const region of regions) {
-      const wavesurfer_region = wavesurfer_regions[region['id']].element;
+    const elements: [HTMLElement, HTMLElement][] = [];
+    for (const region_id of region_ids ?? this._mounted) {
+      if (!(region_id in wavesurfer_regions)) {
+        continue;
+      }
+      const wavesurfer_region = wavesurfer_regions[region_id].element;
       const tag = wavesurfer_region.querySelector(
         '.wavesurfer-region-tag'
       ) as HTMLElement | null;
-
       if (tag !== null) {
-        tag.style.display = 'inline';
-        tag.style.display =
-          tag.getBoundingClientRect().width >
-          0.9 * wavesurfer_region.getBoundingClientRect().width
-            ? 'none'
-            : 'inline';
+        elements.push([wavesurfer_region, tag]);
       }
     }
+
+    // batch DOM writes and reads so that layout is computed only once
+    for (const [, tag] of elements) {
+      tag.style.display = 'inline';
+    }
+    const hidden = elements.map(
+      ([wavesurfer_region, tag]) =>
+        tag.getBoundingClientRect().width >
+        0.9 * wavesurfer_region.getBoundingClientRect().width
+    );
+    elements.forEach(([, tag], i) => {
+      tag.style.display = hidden[i] ? 'none' : 'inline';
+    });
   }
 
   update_playing() {
-    if (this.model.get('playing')) {
+    const playing = this.model.get('playing');
+    if (this.model.get('streaming') && this._player !== null) {
+      if (playing) {
+        this._player.play(this.model.get('time'));
+        if (this._animation_frame === null) {
+          this._animation_frame = requestAnimationFrame(
+            this.on_animation_frame.bind(this)
+          );
+        }
+      } else if (this._player.playing) {
+        this._player.pause();
+        this.sync_time(this.get_current_time());
+      }
+      return;
+    }
+
+    if (playing) {
+      if (!this.internals.isReady) {
+        // audio is not decoded yet: precomputed peaks defer decoding until
+        // first interaction, and `on_ready` starts playback once decoded
+        this.internals.fireEvent('interaction');
+        return;
+      }
       this._wavesurfer.play();
-    } else {
+    } else if (this._wavesurfer.isPlaying()) {
       this._wavesurfer.pause();
+      this.sync_time(this.get_current_time());
     }
   }
 
@@ -302,9 +792,8 @@ export class WavesurferView extends DOMWidgetView {
 
   update_zoom() {
     const zoom = this.model.get('zoom');
+    // regions are re-rendered by `on_zoom`
     this._wavesurfer.zoom(zoom);
-    this.update_colors();
-    this.update_label_visibility();
   }
 
   // FIXME: find correct type for `created_region`
@@ -332,48 +821,154 @@ export class WavesurferView extends DOMWidgetView {
 
   // FIXME: find correct type for `created_region`
   on_region_update_end(updated_region: any) {
-    const wavesurfer_regions = this._wavesurfer.regions.list;
-    const region_ids = Object.keys(wavesurfer_regions);
-    const regions = [];
-    for (const region_id of region_ids) {
-      const region = wavesurfer_regions[region_id];
-      regions.push({
-        start: region.start,
-        end: region.end,
-        id: region_id,
-        label: region.attributes.label,
-      });
-    }
+    const region: IRegion = {
+      start: updated_region.start,
+      end: updated_region.end,
+      id: updated_region.id,
+      label: updated_region.attributes.label,
+    };
+    const is_new = !this._regions.has(region.id);
+    this._regions.set(region.id, region);
+    this._timeline = null;
+    this._timeline_by_end = null;
+    this._mounted.add(region.id);
+    this._dragging = null;
 
-    this._syncing_regions = true;
-    this.model.set('regions', regions);
-    this.touch();
-    this._syncing_regions = false;
+    // only send the region that changed (overlap layout is sent back by the kernel)
+    this.send_regions(is_new ? [region] : [], is_new ? [] : [region], []);
 
     this.update_active_region();
-    this.update_colors();
-    this.update_overlap();
-    this.update_label_visibility();
+    this.update_colors([region.id]);
+    this.update_label_visibility([region.id]);
   }
 
-  on_audioprocess() {
-    this.model.set('time', this._wavesurfer.getCurrentTime());
+  // regions sorted by start time
+  timeline(): IRegion[] {
+    if (this._timeline === null) {
+      this._timeline = Array.from(this._regions.values()).sort(
+        (a, b) => a.start - b.start || a.end - b.end
+      );
+      this._timeline_cummax = new Float64Array(this._timeline.length);
+      let cummax = -Infinity;
+      for (let i = 0; i < this._timeline.length; i++) {
+        cummax = Math.max(cummax, this._timeline[i].end);
+        this._timeline_cummax[i] = cummax;
+      }
+    }
+    return this._timeline;
+  }
+
+  // regions intersecting [start, end], sorted by start time
+  regions_in(start: number, end: number): IRegion[] {
+    // regions before `first` all end before `start`
+    const timeline = this.timeline();
+    const first = bisect_left(this._timeline_cummax, start);
+    const regions: IRegion[] = [];
+    for (let i = first; i < timeline.length && timeline[i].start <= end; i++) {
+      if (timeline[i].end >= start) {
+        regions.push(timeline[i]);
+      }
+    }
+    return regions;
+  }
+
+  // next region in (start, end) order, wrapping around
+  // (same rule as IntervalIndex.following)
+  following(region_id: string): IRegion | undefined {
+    const timeline = this.timeline();
+    const region = this._regions.get(region_id);
+    if (region === undefined) {
+      return timeline[0];
+    }
+    const position = timeline.indexOf(region);
+    return timeline[(position + 1) % timeline.length];
+  }
+
+  // previous region in (end, start) order, wrapping around
+  // (same rule as IntervalIndex.preceding)
+  preceding(region_id: string): IRegion | undefined {
+    if (this._timeline_by_end === null) {
+      this._timeline_by_end = Array.from(this._regions.values()).sort(
+        (a, b) => a.end - b.end || a.start - b.start
+      );
+    }
+    const timeline = this._timeline_by_end;
+    const region = this._regions.get(region_id);
+    if (region === undefined) {
+      return timeline[timeline.length - 1];
+    }
+    const position = timeline.indexOf(region);
+    return timeline[(position - 1 + timeline.length) % timeline.length];
+  }
+
+  // select region corresponding to `time` without a round trip to the kernel
+  // (same rule as WavesurferWidget.on_time_change). returns whether it changed.
+  auto_select(time: number): boolean {
+    if (!this.model.get('auto_select')) {
+      return false;
+    }
+    const covering = this.regions_in(time - 0.01, time + 0.01);
+    if (covering.length === 0) {
+      return false;
+    }
+    let selected = covering[0];
+    for (const region of covering) {
+      if (Math.abs(region.start - time) < Math.abs(selected.start - time)) {
+        selected = region;
+      }
+    }
+    if (selected.id === this.model.get('active_region')) {
+      return false;
+    }
+    this.model.set('active_region', selected.id);
+    return true;
+  }
+
+  // send current time (along with any auto-selected region) to the kernel
+  sync_time(time: number) {
+    this._last_time_sync = performance.now();
+    this.model.set('time', time);
     this.touch();
   }
 
+  // called on every audio frame: only send `time` at `time_sync_rate`
+  on_audioprocess() {
+    const time = this.get_current_time();
+    const selected = this.auto_select(time);
+    const rate = this.model.get('time_sync_rate');
+    if (
+      selected ||
+      (rate > 0 && performance.now() - this._last_time_sync >= 1000 / rate)
+    ) {
+      this.sync_time(time);
+    }
+  }
+
   on_seek(progress: number) {
-    this.model.set('time', this._wavesurfer.getCurrentTime());
-    this.touch();
+    if (this.model.get('streaming') && this._player !== null) {
+      this._player.seek(progress * this._player.duration);
+    }
+    const time = this.get_current_time();
+    this.auto_select(time);
+    this.sync_time(time);
   }
 
   on_zoom(minPxPerSec: number) {
     console.log('minPxPerSec', minPxPerSec);
     this.update_label_visibility();
+    this.schedule_render();
+  }
+
+  // FIXME: find correct type for `region`
+  on_region_updated(region: any) {
+    if (!this._adding_regions) {
+      this._dragging = region.id;
+    }
   }
 
   on_finish() {
     this.model.set('playing', false);
-    this.touch();
+    this.sync_time(this.get_current_time());
   }
 
   // FIXME: find correct type for `region`
@@ -389,7 +984,206 @@ export class WavesurferView extends DOMWidgetView {
     this.touch();
   }
 
+  update_local_keyboard() {
+    if (this.model.get('local_keyboard')) {
+      // key events are captured while the mouse is over the widget
+      if (this._tab_index === undefined) {
+        this._tab_index = this.el.getAttribute('tabindex');
+      }
+      this.el.tabIndex = 0;
+    } else if (this._tab_index !== undefined) {
+      if (this._tab_index === null) {
+        this.el.removeAttribute('tabindex');
+      } else {
+        this.el.setAttribute('tabindex', this._tab_index);
+      }
+      this._tab_index = undefined;
+    }
+  }
+
+  on_mouseenter() {
+    if (this.model.get('local_keyboard')) {
+      this.el.focus({ preventScroll: true });
+    }
+  }
+
+  on_keydown(event: KeyboardEvent) {
+    if (!this.model.get('local_keyboard')) {
+      return;
+    }
+    const modifiers =
+      (event.shiftKey ? 'shift+' : '') + (event.altKey ? 'alt+' : '');
+    const name = 'keyboard[' + modifiers + event.key + ']';
+    const handled = this.profiled(name, () =>
+      this.on_key(event.key, event.shiftKey, event.altKey)
+    );
+    if (handled) {
+      event.preventDefault();
+      event.stopPropagation();
+    }
+  }
+
+  // same actions as WavesurferWidget._on_key (shortcuts are both taken from
+  // the `shortcuts` trait), applied to the local model. regions changes and
+  // state are sent to the kernel afterwards, so that shortcuts do not wait
+  // for a busy kernel. returns whether key is a shortcut.
+  on_key(key: string, shift: boolean, alt: boolean): boolean {
+    const action: string | undefined = this.model.get('shortcuts')[key];
+    const region = this._regions.get(this.model.get('active_region'));
+    const precision: [number, number] = this.model.get('precision');
+
+    switch (action) {
+      case 'toggle_playing': {
+        this.model.set('playing', !this.model.get('playing'));
+        break;
+      }
+      case 'select_next_region': {
+        // selects next region ([ shift ]: previous one) and moves cursor to
+        // its start time
+        const region_id = region === undefined ? '' : region.id;
+        const selected = shift
+          ? this.preceding(region_id)
+          : this.following(region_id);
+        if (selected === undefined) {
+          return true;
+        }
+        this.model.set('active_region', selected.id);
+        this.model.set('active_label', selected.label);
+        this.seek_to(selected.start);
+        break;
+      }
+      case 'unselect_region': {
+        this.model.set('active_region', '');
+        break;
+      }
+      case 'select_label': {
+        // selects label named after the key (and sets it to selected region)
+        if (region !== undefined && region.label !== key) {
+          this.edit_regions([], [{ ...region, label: key }], []);
+        }
+        this.model.set('active_label', key);
+        break;
+      }
+      case 'move_left':
+      case 'move_right': {
+        // moves cursor, or start time of selected region ([ alt ]: end time).
+        // speed is controlled by [ shift ] key
+        const direction = action === 'move_left' ? -1 : 1;
+        const delta = precision[shift ? 1 : 0] * direction;
+        if (region === undefined) {
+          this.seek_to(this.get_current_time() + delta);
+          break;
+        }
+        let start = region.start;
+        let end = region.end;
+        if (alt) {
+          end += delta;
+          if (this.get_current_time() > end) {
+            this.seek_to(end - 1.0);
+          }
+        } else {
+          start += delta;
+          this.seek_to(start);
+        }
+        this.edit_regions([], [{ ...region, start, end }], []);
+        this.model.set('playing', true);
+        break;
+      }
+      case 'zoom_in':
+      case 'zoom_out': {
+        const direction = action === 'zoom_in' ? 1 : -1;
+        this.model.set('zoom', this.model.get('zoom') + direction);
+        break;
+      }
+      case 'remove_region_select_previous':
+      case 'remove_region_select_next': {
+        if (region === undefined) {
+          return true;
+        }
+        const selected =
+          action === 'remove_region_select_previous'
+            ? this.preceding(region.id)
+            : this.following(region.id);
+        this.edit_regions([], [], [region.id]);
+        this.model.set(
+          'active_region',
+          selected !== undefined && selected.id !== region.id ? selected.id : ''
+        );
+        break;
+      }
+      case 'add_region': {
+        // creates a new region at current time
+        // ([ shift ]: splits selected region at current time)
+        const time = this.get_current_time();
+        let added: IRegion;
+        if (shift) {
+          if (
+            region === undefined ||
+            time < region.start ||
+            time > region.end
+          ) {
+            return true;
+          }
+          added = { ...region, start: time, id: new_region_id() };
+          this.edit_regions([added], [{ ...region, end: time }], []);
+        } else {
+          added = {
+            start: time,
+            end: time + precision[1],
+            id: new_region_id(),
+            label: this.model.get('active_label'),
+          };
+          this.edit_regions([added], [], []);
+        }
+        this.model.set('active_region', added.id);
+        break;
+      }
+      default:
+        return false;
+    }
+
+    this.touch();
+    return true;
+  }
+
+  // move cursor, including while playing
+  seek_to(time: number) {
+    time = Math.max(0, time);
+    if (this.model.get('playing')) {
+      if (this.model.get('streaming') && this._player !== null) {
+        this._player.seek(time);
+      } else {
+        this._wavesurfer.setCurrentTime(time);
+      }
+    }
+    // otherwise, cursor is moved by `update_time`
+    this._last_time_sync = performance.now();
+    this.model.set('time', time);
+  }
+
+  remove() {
+    if (this._render_frame !== null) {
+      cancelAnimationFrame(this._render_frame);
+    }
+    if (this._measures_timeout !== null) {
+      clearTimeout(this._measures_timeout);
+      this.flush_measures();
+    }
+    if (this._player !== null) {
+      this._player.destroy();
+    }
+    if (this._url !== null) {
+      URL.revokeObjectURL(this._url);
+    }
+    super.remove();
+  }
+
   on_ready() {
+    if (this._load_start !== null) {
+      this.record_measure('load', this._load_start);
+      this._load_start = null;
+    }
+    this.schedule_render();
     this.update_active_region();
     this.update_colors();
     this.update_overlap();